@@ -1,42 +1,488 @@
+import argparse
+import bisect
 import pygame
-import random
 import sys
 import json
 import time
 
-from typing import List, Tuple, Optional, Set, Dict
-from dataclasses import dataclass
+from typing import Callable, Iterator, List, Tuple, Dict, Optional, Set
 from enum import Enum
 import math
+import statistics
+from collections import OrderedDict, deque
+from functools import cached_property
+
+import numpy as np
+
+from teratis_bot import AutoPlayer
+from teratis_replay import Recorder, Replay, ReplayPlayer
+from teratis_scores import Leaderboard, ScoreStore
+from teratis_engine import (
+    Action,
+    Block,
+    BlockShape,
+    Engine,
+    GameConfig,
+    GameState,
+)
+
+
+class ParticlePool:
+    """Fixed-capacity particles stored as parallel NumPy arrays.
+
+    Spawns beyond `capacity` are dropped, dead particles are swap-removed
+    from the tail and every update is a handful of vectorized array ops.
+    """
+
+    LIFETIME = 30
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.count = 0
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.dx = np.zeros(capacity, np.float32)
+        self.dy = np.zeros(capacity, np.float32)
+        self.lifetime = np.zeros(capacity, np.float32)
+        self.radius = np.zeros(capacity, np.int16)
+        self.color = np.zeros((capacity, 3), np.uint8)
+        self.sprites: Dict[Tuple[Tuple[int, int, int], int], pygame.Surface] = {}
+
+    @cached_property
+    def rng(self) -> np.random.Generator:
+        # Created on the first spawn: numpy.random is slow to import.
+        return np.random.default_rng()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, x: float, y: float, color: Tuple[int, int, int], count: int = 1):
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+        start, end = self.count, self.count + count
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.dx[start:end] = self.rng.uniform(-2, 2, count)
+        self.dy[start:end] = self.rng.uniform(-2, 2, count)
+        self.lifetime[start:end] = self.LIFETIME
+        self.radius[start:end] = self.rng.uniform(2, 4, count)
+        self.color[start:end] = color
+        self.count = end
+
+    def update(self, frames: float = 1.0):
+        """Advance by `frames` 60 Hz frames (fractional at other frame rates)."""
+        n = self.count
+        if not n:
+            return
+        self.x[:n] += self.dx[:n] * frames
+        self.y[:n] += self.dy[:n] * frames
+        self.lifetime[:n] -= frames
+
+        dead = np.flatnonzero(self.lifetime[:n] <= 0)
+        if not len(dead):
+            return
+        alive = n - len(dead)
+        # Fill holes below the new count with survivors from the tail.
+        holes = dead[dead < alive]
+        tail = np.arange(alive, n)
+        tail = tail[self.lifetime[alive:n] > 0]
+        for array in (
+            self.x,
+            self.y,
+            self.dx,
+            self.dy,
+            self.lifetime,
+            self.radius,
+            self.color,
+        ):
+            array[holes] = array[tail]
+        self.count = alive
+
+    def bounds(self) -> Optional[pygame.Rect]:
+        n = self.count
+        if not n:
+            return None
+        left = int(self.x[:n].min()) - 5
+        top = int(self.y[:n].min()) - 5
+        return pygame.Rect(
+            left,
+            top,
+            int(self.x[:n].max()) + 6 - left,
+            int(self.y[:n].max()) + 6 - top,
+        )
+
+    def sprite(self, color: Tuple[int, int, int], radius: int) -> pygame.Surface:
+        key = (color, radius)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1))
+            sprite.set_colorkey((0, 0, 0))
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            self.sprites[key] = sprite
+        return sprite
+
+    def draw(self, screen: pygame.Surface):
+        n = self.count
+        if not n:
+            return
+        # Oldest first, so each sprite's alpha changes at most once per level
+        order = np.argsort(self.lifetime[:n], kind="stable")
+        xs = self.x[order].astype(np.int32).tolist()
+        ys = self.y[order].astype(np.int32).tolist()
+        lifetimes = self.lifetime[order].tolist()
+        radii = self.radius[order].tolist()
+        colors = [tuple(color) for color in self.color[order].tolist()]
+        for x, y, lifetime, radius, color in zip(xs, ys, lifetimes, radii, colors):
+            sprite = self.sprite(color, radius)
+            sprite.set_alpha(int(255 * lifetime / self.LIFETIME))
+            screen.blit(sprite, (x - radius, y - radius))
+
+
+class TextCache:
+    """Rendered text surfaces keyed by (font, text, color), evicted LRU."""
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self.surfaces: OrderedDict = OrderedDict()
+
+    def render(
+        self, font: pygame.font.Font, text: str, color: Tuple[int, int, int]
+    ) -> pygame.Surface:
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+class LabelCache(dict):
+    """Text that never changes, rendered on first lookup and never evicted.
+    `specs` maps each name to (font attribute of `owner`, text, color)."""
+
+    def __init__(self, owner, specs: Dict[str, Tuple[str, str, Tuple[int, int, int]]]):
+        super().__init__()
+        self.owner = owner
+        self.specs = specs
+
+    def __missing__(self, name: str) -> pygame.Surface:
+        font, text, color = self.specs[name]
+        surface = self[name] = getattr(self.owner, font).render(text, True, color)
+        return surface
+
+
+# Steps of the game-over sequence, advanced once per frame by Game.run
+class Transition(Enum):
+    NONE = 0
+    FADE = 1
+    NAME_ENTRY = 2
+
+
+FADE_DURATION = 510  # ms, the length of the old blocking fade loop
+MAX_NAME_LENGTH = 12
+DEFERRED_BUDGET_MS = 8.0
+LEADERBOARD_SLICE_MS = 4.0  # leaderboard indexing per frame
+DEMO_ACTION_DELAY = 60  # ms between autoplayer actions, so moves are visible
+PROFILER_REFRESH_MS = 500  # how often the profiler overlay's numbers change
+INPUT_POLL_MS = 1.0  # input polling interval while waiting for the next frame
+# Auto-repeat of held keys (DAS and ARR), in ms; down starts repeating at
+# the old soft-drop speed.
+DAS_MS = 170
+ARR_MS = 50
+DOWN_DAS_MS = 50
+DOWN_ARR_MS = 50
+REPEAT_MOVES = {Action.LEFT: (-1, 0), Action.RIGHT: (1, 0), Action.DOWN: (0, 1)}
+# Largest part of the board on screen, in cells; bigger boards scroll.
+VIEW_COLUMNS = 24
+VIEW_ROWS = 20
+CAMERA_MARGIN = 4  # cells kept between the falling piece and the view's edge
+
+
+class FrameStats:
+    """Rolling window of frame intervals, for judging frame pacing."""
+
+    def __init__(self, size: int = 600):
+        self.intervals: deque = deque(maxlen=size)
+
+    def record(self, interval_ms: float):
+        self.intervals.append(interval_ms)
+
+    def summary(self) -> str:
+        if len(self.intervals) < 2:
+            return "frame pacing: not enough frames"
+        intervals = sorted(self.intervals)
+        mean = statistics.fmean(intervals)
+        p50 = intervals[len(intervals) // 2]
+        p99 = intervals[min(len(intervals) - 1, int(len(intervals) * 0.99))]
+        return (
+            f"frame pacing over {len(intervals)} frames: "
+            f"{1000 / mean:.1f} fps, mean {mean:.2f} ms, p50 {p50:.2f} ms, "
+            f"p99 {p99:.2f} ms, max {intervals[-1]:.2f} ms, "
+            f"jitter {statistics.pstdev(intervals):.2f} ms"
+        )
+
+
+class LatencyStats:
+    """Input-to-photon latency: from an input event's timestamp to the end
+    of presenting the first frame drawn after it was applied."""
+
+    def __init__(self, size: int = 600):
+        self.samples: deque = deque(maxlen=size)
+        self.pending: List[float] = []
+
+    def input(self, stamp: float):
+        self.pending.append(stamp)
+
+    def presented(self, now: float):
+        for stamp in self.pending:
+            self.samples.append(now - stamp)
+        self.pending.clear()
+
+    def percentiles(self) -> Optional[Tuple[float, float]]:
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return (
+            samples[len(samples) // 2],
+            samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        )
+
+    def summary(self) -> str:
+        if not self.samples:
+            return "input latency: no input"
+        p50, p99 = self.percentiles()
+        return (
+            f"input latency over {len(self.samples)} inputs: "
+            f"p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max(self.samples):.2f} ms"
+        )
+
+
+class AutoRepeat:
+    """Auto-repeat of one held key: its action fires on the press, again
+    `delay` ms later and then every `interval` ms. An interval of 0 repeats
+    as far as the piece can go, every tick."""
+
+    def __init__(self, action: Action, delay: float, interval: float):
+        self.action = action
+        self.delay = delay
+        self.interval = interval
+        self.next_repeat: Optional[float] = None
+
+    def press(self, stamp: float):
+        self.next_repeat = stamp + self.delay
+
+    def release(self):
+        self.next_repeat = None
+
+    def due(self, until: float) -> int:
+        """Repeats due by the time `until`, which are then used up."""
+        if self.next_repeat is None or self.next_repeat > until:
+            return 0
+        if not self.interval:
+            return sys.maxsize
+        count = int((until - self.next_repeat) // self.interval) + 1
+        self.next_repeat += count * self.interval
+        return count
+
+
+class StartupTimer:
+    """Wall time of each startup step, from Game() to the end of the work
+    deferred until after the first frame. A step is recorded once, so a
+    mark in the frame loop only counts the first frame."""
+
+    def __init__(self):
+        # CPU time the process spent before Game(): the interpreter and
+        # module imports, pygame and NumPy above all.
+        self.before = time.process_time()
+        self.start = self.last = time.perf_counter()
+        self.steps: Dict[str, float] = {}
+
+    def mark(self, step: str) -> None:
+        if step in self.steps:
+            return
+        now = time.perf_counter()
+        self.steps[step] = (now - self.last) * 1000
+        self.last = now
+
+    def summary(self) -> str:
+        lines = [f"startup: {self.before * 1000:.1f} ms CPU in imports before Game()"]
+        for step, ms in self.steps.items():
+            lines.append(f"  {step:<24} {ms:8.2f} ms")
+        lines.append(
+            f"  {'total since Game()':<24} {(self.last - self.start) * 1000:8.2f} ms"
+        )
+        return "\n".join(lines)
+
+
+class PhaseProfiler:
+    """Wall time spent in each phase of a frame.
+
+    `begin_frame()` starts a frame and `mark(phase)` charges the time since
+    the previous mark to `phase`; `end_frame()` adds the frame to a rolling
+    window per phase. While disabled every call returns at once, so the
+    marks can stay in the frame loop. With `tracing` set, every phase is
+    also kept as a Chrome trace event (chrome://tracing, Perfetto).
+    """
+
+    # Upper edges (ms) of the frame-time histogram buckets; the last is open.
+    BUCKETS = (2, 4, 8, 17, 33, 67)
+
+    def __init__(self, size: int = 600, trace_limit: int = 1_000_000):
+        self.enabled = False
+        self.tracing = False
+        self.size = size
+        self.trace_limit = trace_limit
+        self.phases: Dict[str, deque] = {}
+        self.frames: deque = deque(maxlen=size)
+        self.current: Dict[str, float] = {}
+        self.trace: List[Tuple[str, float, float]] = []
+        self.origin = time.perf_counter()
+        self.frame_start = self.last = self.origin
+
+    def begin_frame(self) -> None:
+        if not self.enabled:
+            return
+        self.frame_start = self.last = time.perf_counter()
+        self.current = {}
 
+    def mark(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + (now - self.last)
+        if self.tracing and len(self.trace) < self.trace_limit:
+            self.trace.append((phase, self.last, now))
+        self.last = now
+
+    def end_frame(self) -> None:
+        if not self.enabled:
+            return
+        for phase, seconds in self.current.items():
+            history = self.phases.get(phase)
+            if history is None:
+                history = self.phases[phase] = deque(maxlen=self.size)
+            history.append(seconds * 1000)
+        self.frames.append((self.last - self.frame_start) * 1000)
+        if self.tracing and len(self.trace) < self.trace_limit:
+            self.trace.append(("frame", self.frame_start, self.last))
+
+    def percentiles(self) -> List[Tuple[str, float, float]]:
+        """(phase, p50 ms, p99 ms) for every phase seen, in first-seen order."""
+        rows = []
+        for phase, history in self.phases.items():
+            values = sorted(history)
+            rows.append(
+                (
+                    phase,
+                    values[len(values) // 2],
+                    values[min(len(values) - 1, int(len(values) * 0.99))],
+                )
+            )
+        return rows
+
+    def histogram(self) -> List[int]:
+        """Frame counts per BUCKETS interval over the rolling window."""
+        counts = [0] * (len(self.BUCKETS) + 1)
+        for frame_ms in self.frames:
+            counts[bisect.bisect_left(self.BUCKETS, frame_ms)] += 1
+        return counts
+
+    def export_trace(self, path: str) -> None:
+        events = [
+            {
+                "name": name,
+                "cat": "frame" if name == "frame" else "phase",
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": 1,
+                "tid": 0 if name == "frame" else 1,
+            }
+            for name, start, end in self.trace
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
 
-# Game States
-class GameState(Enum):
-    PLAYING = 1
-    PAUSED = 2
-    GAME_OVER = 3
-    WON = 4
 
+class Camera:
+    """The `columns` x `rows` cells of the board on screen, from (x, y).
 
-# Enhanced color palette
-COLORS = [
-    (255, 215, 0),  # Gold
-    (147, 112, 219),  # Purple
-    (0, 191, 255),  # Deep Sky Blue
-    (50, 205, 50),  # Lime Green
-    (255, 99, 71),  # Tomato Red
-]
+    It scrolls in whole cells to keep the falling piece, and where it will
+    land when that fits, `margin` cells inside the view. Drawing only ever
+    looks at the cells in view, so its cost doesn't grow with the board.
+    """
+
+    def __init__(
+        self,
+        board_width: int,
+        board_height: int,
+        columns: int = VIEW_COLUMNS,
+        rows: int = VIEW_ROWS,
+        margin: int = CAMERA_MARGIN,
+    ):
+        self.board_width = board_width
+        self.board_height = board_height
+        self.columns = min(columns, board_width)
+        self.rows = min(rows, board_height)
+        self.margin = margin
+        self.x = 0
+        self.y = 0
+
+    def follow(self, block: Optional[Block], distance: int = 0) -> bool:
+        """Scroll to `block`, `distance` rows above its landing spot;
+        returns whether the view moved."""
+        if not block:
+            return False
+        layout = block.shape.layout
+        top = block.y
+        bottom = block.y + layout.height - 1
+        if bottom + distance - top < self.rows - 2 * self.margin:
+            bottom += distance
+        x = self.scroll(
+            self.x,
+            block.x + layout.min_x,
+            block.x + layout.max_x,
+            self.columns,
+            self.board_width,
+        )
+        y = self.scroll(self.y, top, bottom, self.rows, self.board_height)
+        moved = (x, y) != (self.x, self.y)
+        self.x, self.y = x, y
+        return moved
+
+    def scroll(self, start: int, low: int, high: int, size: int, limit: int) -> int:
+        """Start of the view along one axis once [low, high] is in it."""
+        margin = max(0, min(self.margin, (size - (high - low + 1)) // 2))
+        if low - margin < start:
+            start = low - margin
+        elif high + margin >= start + size:
+            start = high + margin - size + 1
+        return max(0, min(start, limit - size))
+
+    def visible(self, x: int, y: int) -> bool:
+        return 0 <= x - self.x < self.columns and 0 <= y - self.y < self.rows
 
 
 class UIManager:
-    def __init__(self, screen_width: int, screen_height: int, block_size: int):
+    def __init__(
+        self,
+        screen_width: int,
+        screen_height: int,
+        block_size: int,
+        max_particles: int = 1024,
+    ):
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.block_size = block_size
         self.sidebar_width = 200
-        self.font_large = pygame.font.Font(None, 48)
-        self.font_medium = pygame.font.Font(None, 36)
-        self.font_small = pygame.font.Font(None, 24)
 
         self.colors = {
             "background": (15, 23, 42),  # slate-900
@@ -49,27 +495,73 @@ class UIManager:
             "progress_fill": (250, 204, 21),  # yellow-400
         }
 
+        self.text_cache = TextCache()
+        # Labels that never change are rendered on first use and kept out
+        # of the LRU.
+        self.labels = LabelCache(
+            self,
+            {
+                "score": ("font_small", "SCORE", self.colors["text"]),
+                "paused": ("font_large", "PAUSED", (255, 255, 255)),
+                "won": ("font_large", "YOU WON!", (0, 255, 0)),
+                "won_shadow": ("font_large", "YOU WON!", (0, 0, 0)),
+                "game_over": ("font_large", "GAME OVER", (255, 0, 0)),
+                "game_over_shadow": ("font_large", "GAME OVER", (0, 0, 0)),
+                "high_scores": ("font_medium", "High Scores", self.colors["score"]),
+                "restart": ("font_small", "Press R to Restart", self.colors["text"]),
+                "enter_name": ("font_medium", "Enter your name", self.colors["text"]),
+            },
+        )
+        self.overlays: Dict[int, pygame.Surface] = {}
+        self.shadow_surface: Optional[pygame.Surface] = None
+
         self.pulse_time = 0
-        self.particles = []
+        self.particles = ParticlePool(max_particles)
 
-    def create_particle(self, x: int, y: int, color: Tuple[int, int, int]):
-        return {
-            "x": x,
-            "y": y,
-            "dx": random.uniform(-2, 2),
-            "dy": random.uniform(-2, 2),
-            "lifetime": 30,
-            "color": color,
-            "size": random.uniform(2, 4),
-        }
+        # Pre-rendered backgrounds, rebuilt when their cache key changes
+        self.background_key = None
+        self.background = None
+        self.grid_layer = None
 
-    def update_particles(self):
-        for particle in self.particles[:]:
-            particle["x"] += particle["dx"]
-            particle["y"] += particle["dy"]
-            particle["lifetime"] -= 1
-            if particle["lifetime"] <= 0:
-                self.particles.remove(particle)
+    # Fonts are loaded on first use; the first frame needs only some of them.
+    @cached_property
+    def font_large(self) -> pygame.font.Font:
+        return pygame.font.Font(None, 48)
+
+    @cached_property
+    def font_medium(self) -> pygame.font.Font:
+        return pygame.font.Font(None, 36)
+
+    @cached_property
+    def font_small(self) -> pygame.font.Font:
+        return pygame.font.Font(None, 24)
+
+    @cached_property
+    def font_tiny(self) -> pygame.font.Font:
+        return pygame.font.Font(None, 18)
+
+    def resize(self, screen_width: int, screen_height: int):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.background_key = None
+        self.overlays.clear()
+
+    def text(
+        self, font: pygame.font.Font, text: str, color: Tuple[int, int, int]
+    ) -> pygame.Surface:
+        return self.text_cache.render(font, text, color)
+
+    def overlay(self, alpha: int) -> pygame.Surface:
+        overlay = self.overlays.get(alpha)
+        if overlay is None:
+            overlay = pygame.Surface((self.screen_width, self.screen_height))
+            overlay.fill((0, 0, 0))
+            overlay.set_alpha(alpha)
+            self.overlays[alpha] = overlay
+        return overlay
+
+    def update_particles(self, frames: float = 1.0):
+        self.particles.update(frames)
 
     def draw_sidebar(
         self,
@@ -78,6 +570,7 @@ class UIManager:
         time_left: int,
         combo: int,
         target_score: int,
+        rank: Optional[int] = None,
     ):
         sidebar_rect = pygame.Rect(
             self.screen_width - self.sidebar_width,
@@ -89,8 +582,8 @@ class UIManager:
 
         # Score section
         y_pos = 20
-        score_text = self.font_large.render(f"{score}", True, self.colors["score"])
-        score_label = self.font_small.render("SCORE", True, self.colors["text"])
+        score_text = self.text(self.font_large, f"{score}", self.colors["score"])
+        score_label = self.labels["score"]
         screen.blit(score_text, (self.screen_width - self.sidebar_width + 20, y_pos))
         screen.blit(
             score_label, (self.screen_width - self.sidebar_width + 20, y_pos + 40)
@@ -117,26 +610,120 @@ class UIManager:
         y_pos += 40
         minutes = time_left // 60
         seconds = time_left % 60
-        time_text = self.font_medium.render(
-            f"{minutes:02d}:{seconds:02d}", True, self.colors["time"]
+        time_text = self.text(
+            self.font_medium, f"{minutes:02d}:{seconds:02d}", self.colors["time"]
         )
         screen.blit(time_text, (self.screen_width - self.sidebar_width + 20, y_pos))
 
+        # Where the score would place on the leaderboard right now
+        if rank is not None:
+            rank_text = self.text(self.font_small, f"RANK #{rank}", self.colors["text"])
+            screen.blit(
+                rank_text, (self.screen_width - self.sidebar_width + 110, y_pos + 6)
+            )
+
         # Combo section
         if combo > 1:
             y_pos += 60
             pulse = abs(math.sin(self.pulse_time)) * 8
-            combo_text = self.font_medium.render(
-                f"COMBO x{combo}", True, self.colors["combo"]
+            combo_text = self.text(
+                self.font_medium, f"COMBO x{combo}", self.colors["combo"]
             )
             combo_pos = (self.screen_width - self.sidebar_width + 20 + pulse, y_pos)
             screen.blit(combo_text, combo_pos)
             self.pulse_time += 0.1
 
-    def draw_grid_background(self, screen: pygame.Surface):
+    def draw_profiler(
+        self,
+        screen: pygame.Surface,
+        rows: List[Tuple[str, float, float]],
+        histogram: List[int],
+    ):
+        """Phase timings and a frame-time histogram at the foot of the sidebar."""
+        left = self.screen_width - self.sidebar_width + 10
+        line = self.font_tiny.get_linesize()
+        bar_height = 40
+        top = self.screen_height - 10 - bar_height - line * (len(rows) + 2)
+        pygame.draw.rect(
+            screen,
+            self.colors["background"],
+            (left - 5, top - 5, self.sidebar_width - 10, self.screen_height - top),
+        )
+
+        columns = (("phase", "p50", "p99 ms"),) + tuple(
+            (phase[:10], f"{p50:.2f}", f"{p99:.2f}") for phase, p50, p99 in rows
+        )
+        for i, (phase, p50, p99) in enumerate(columns):
+            color = self.colors["time"] if i == 0 else self.colors["text"]
+            y = top + i * line
+            screen.blit(self.text(self.font_tiny, phase, color), (left, y))
+            for text, right in ((p50, left + 120), (p99, left + 175)):
+                surface = self.text(self.font_tiny, text, color)
+                screen.blit(surface, surface.get_rect(topright=(right, y)))
+
+        label = self.text(
+            self.font_tiny, "frames <2 4 8 17 33 67+ ms", self.colors["time"]
+        )
+        screen.blit(label, (left, top + (len(rows) + 1) * line))
+        total = sum(histogram) or 1
+        bar_width = (self.sidebar_width - 20) // len(histogram)
+        bottom = self.screen_height - 10
+        for i, count in enumerate(histogram):
+            height = max(1, int(bar_height * count / total)) if count else 0
+            pygame.draw.rect(
+                screen,
+                self.colors["combo"] if i > 3 else self.colors["progress_fill"],
+                (left + i * bar_width, bottom - height, bar_width - 2, height),
+            )
+
+    def draw_grid_background(
+        self,
+        screen: pygame.Surface,
+        config: GameConfig,
+        grid_lines: bool = False,
+        area: Optional[pygame.Rect] = None,
+    ):
+        key = (
+            self.screen_width,
+            self.screen_height,
+            config.block_size,
+        )
+        if key != self.background_key:
+            self.render_backgrounds(screen, config)
+            self.background_key = key
+        layer = self.grid_layer if grid_lines else self.background
+        if area is None:
+            screen.blit(layer, (0, 0))
+        else:
+            screen.blit(layer, area, area)
+
+    def render_backgrounds(self, screen: pygame.Surface, config: GameConfig):
+        self.block_size = config.block_size
+        size = (self.screen_width, self.screen_height)
+
+        self.background = pygame.Surface(size, 0, screen)
+        self.background.fill(self.colors["background"])
         for y in range(0, self.screen_height, 4):
             for x in range(0, self.screen_width - self.sidebar_width, 4):
-                pygame.draw.circle(screen, (30, 41, 59), (x + 2, y + 2), 1)
+                pygame.draw.circle(self.background, (30, 41, 59), (x + 2, y + 2), 1)
+
+        # Grid lines over the cells in view, which is all the board area
+        self.grid_layer = self.background.copy()
+        for y in range(self.screen_height // config.block_size):
+            for x in range(
+                (self.screen_width - self.sidebar_width) // config.block_size
+            ):
+                pygame.draw.rect(
+                    self.grid_layer,
+                    (50, 50, 50),
+                    (
+                        x * config.block_size,
+                        y * config.block_size,
+                        config.block_size,
+                        config.block_size,
+                    ),
+                    1,
+                )
 
     def draw_block_shadow(self, screen: pygame.Surface, x: int, y: int):
         shadow_rect = pygame.Rect(
@@ -145,21 +732,54 @@ class UIManager:
             self.block_size - 1,
             self.block_size - 1,
         )
-        shadow_surface = pygame.Surface((self.block_size - 1, self.block_size - 1))
-        shadow_surface.fill((0, 0, 0))
-        shadow_surface.set_alpha(64)
+        shadow_surface = self.shadow_surface
+        if shadow_surface is None or shadow_surface.get_width() != self.block_size - 1:
+            shadow_surface = pygame.Surface((self.block_size - 1, self.block_size - 1))
+            shadow_surface.fill((0, 0, 0))
+            shadow_surface.set_alpha(64)
+            self.shadow_surface = shadow_surface
         screen.blit(shadow_surface, shadow_rect)
 
+    def draw_cell(
+        self,
+        screen: pygame.Surface,
+        x: int,
+        y: int,
+        color: Tuple[int, int, int],
+        block_size: int,
+    ):
+        self.draw_block_shadow(screen, x, y)
+        pygame.draw.rect(
+            screen,
+            color,
+            (x * block_size, y * block_size, block_size - 1, block_size - 1),
+        )
+
+    def draw_ghost_cell(
+        self,
+        screen: pygame.Surface,
+        x: int,
+        y: int,
+        color: Tuple[int, int, int],
+        block_size: int,
+    ):
+        """2px outline of a cell where the falling piece will land."""
+        # Filled strips rather than draw.rect(width=2), whose thick lines
+        # come out differently under a clip rect.
+        left, top, size = x * block_size, y * block_size, block_size - 1
+        for strip in (
+            (left, top, size, 2),
+            (left, top + size - 2, size, 2),
+            (left, top, 2, size),
+            (left + size - 2, top, 2, size),
+        ):
+            screen.fill(color, strip)
+
+    def particle_bounds(self) -> Optional[pygame.Rect]:
+        return self.particles.bounds()
+
     def draw_particles(self, screen: pygame.Surface):
-        for particle in self.particles:
-            alpha = int(255 * (particle["lifetime"] / 30))
-            color = (*particle["color"], alpha)
-            pygame.draw.circle(
-                screen,
-                color,
-                (int(particle["x"]), int(particle["y"])),
-                particle["size"],
-            )
+        self.particles.draw(screen)
 
     def draw_game_over(
         self,
@@ -168,625 +788,1000 @@ class UIManager:
         high_scores: List[dict],
         game_state: GameState,
     ):
-        overlay = pygame.Surface((self.screen_width, self.screen_height))
-        overlay.fill((0, 0, 0))
-        overlay.set_alpha(128)
-        screen.blit(overlay, (0, 0))
+        screen.blit(self.overlay(128), (0, 0))
 
         y_pos = self.screen_height // 3
 
         # Display "YOU WON!" if the game is won
         if game_state == GameState.WON:
-            game_over_text = "YOU WON!"
-            text_color = (0, 255, 0)  # Green color
+            text = self.labels["won"]
+            shadow = self.labels["won_shadow"]
         else:
-            game_over_text = "GAME OVER"
-            text_color = (255, 0, 0)  # Red color
+            text = self.labels["game_over"]
+            shadow = self.labels["game_over_shadow"]
 
         # Game Over text with shadow
-        text = self.font_large.render(game_over_text, True, text_color)
-        shadow = self.font_large.render(game_over_text, True, (0, 0, 0))
         text_rect = text.get_rect(center=(self.screen_width // 2, y_pos))
         screen.blit(shadow, (text_rect.x + 2, text_rect.y + 2))
         screen.blit(text, text_rect)
 
         y_pos += 60
-        score_text = self.font_medium.render(
-            f"Final Score: {score}", True, self.colors["text"]
+        score_text = self.text(
+            self.font_medium, f"Final Score: {score}", self.colors["text"]
         )
         score_rect = score_text.get_rect(center=(self.screen_width // 2, y_pos))
         screen.blit(score_text, score_rect)
 
         y_pos += 60
-        title = self.font_medium.render("High Scores", True, self.colors["score"])
+        title = self.labels["high_scores"]
         title_rect = title.get_rect(center=(self.screen_width // 2, y_pos))
         screen.blit(title, title_rect)
 
         for i, score_data in enumerate(high_scores[:5]):
             y_pos += 30
-            score_line = self.font_small.render(
+            score_line = self.text(
+                self.font_small,
                 f"{i+1}. {score_data['name']}: {score_data['score']}",
-                True,
                 self.colors["text"],
             )
             score_rect = score_line.get_rect(center=(self.screen_width // 2, y_pos))
             screen.blit(score_line, score_rect)
 
         y_pos += 60
-        restart_text = self.font_small.render(
-            "Press R to Restart", True, self.colors["text"]
-        )
+        restart_text = self.labels["restart"]
         restart_rect = restart_text.get_rect(center=(self.screen_width // 2, y_pos))
         screen.blit(restart_text, restart_rect)
 
-        # Check if "R" is pressed to restart the game when won
-        if game_state == GameState.WON:
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_r]:
-                self.restart_game()  # Call method to restart the game
-
-
-@dataclass
-class GameConfig:
-    block_size: int = 30
-    grid_width: int = 10
-    grid_height: int = 20
-    time_limit: int = 180
-    target_score: int = 1000
-    initial_fall_speed: int = 500
-
-
-@dataclass
-class Block:
-    x: int
-    y: int
-    color: Tuple[int, int, int]
-    shape: Optional["BlockShape"] = None
-    matched: bool = False
-
-    def __hash__(self):
-        return hash((self.x, self.y, self.color))
-
-    def __eq__(self, other):
-        if not isinstance(other, Block):
-            return NotImplemented
-        return (self.x, self.y, self.color) == (other.x, other.y, other.color)
-
-    def move(self, dx: int, dy: int) -> None:
-        self.x += dx
-        self.y += dy
-
-    def draw(
-        self, screen: pygame.Surface, block_size: int, ui_manager: UIManager
-    ) -> None:
-        if self.shape:
-            for y, row in enumerate(self.shape.blocks):
-                for x, has_block in enumerate(row):
-                    if has_block:
-                        ui_manager.draw_block_shadow(screen, self.x + x, self.y + y)
-                        pygame.draw.rect(
-                            screen,
-                            self.color,
-                            (
-                                (self.x + x) * block_size,
-                                (self.y + y) * block_size,
-                                block_size - 1,
-                                block_size - 1,
-                            ),
-                        )
-        else:
-            ui_manager.draw_block_shadow(screen, self.x, self.y)
-            pygame.draw.rect(
-                screen,
-                self.color,
-                (
-                    self.x * block_size,
-                    self.y * block_size,
-                    block_size - 1,
-                    block_size - 1,
-                ),
-            )
-
-    def moved(self, dx: int, dy: int) -> "Block":
-        return Block(self.x + dx, self.y + dy, self.color, self.shape, self.matched)
-
-
-class BlockShape:
-    def __init__(self, color: Tuple[int, int, int], shape_type: str):
-        self.color = color
-        self.shape_type = shape_type
-        self.rotation = 0
-        self.blocks = self.get_shape_blocks()
-
-    def get_shape_blocks(self) -> List[List[bool]]:
-        shapes = {
-            "I": [[True], [True], [True], [True]],
-            "L": [[True, False], [True, False], [True, True]],
-            "T": [[True, True, True], [False, True, False]],
-            "S": [[False, True, True], [True, True, False]],
-            "O": [[True, True], [True, True]],
-        }
-        return shapes.get(self.shape_type, [[True]])
-
-    def rotate(self) -> None:
-        self.rotation = (self.rotation + 90) % 360
-        rotated = list(zip(*self.blocks[::-1]))
-        self.blocks = [list(row) for row in rotated]
-        
-    def restart(self):
-        # Reset game variables to restart the game
-        self.score = 0
-        self.game_state = GameState.PLAYING  # Change to playing state to start a new game
-        self.reset_player()  # Reset player or other game-specific elements
-        self.reset_level()  # Reset level or any other necessary game elements
-
-
 
 class Game:
-    def __init__(self):
-        pygame.init()
-
-        self.config = GameConfig()
-        self.screen = pygame.display.set_mode(
-            (
-                self.config.grid_width * self.config.block_size + 200,
-                self.config.grid_height * self.config.block_size,
-            )
+    def __init__(
+        self,
+        dirty_rects: bool = False,
+        fps: int = 60,
+        vsync: bool = False,
+        interpolate: bool = False,
+        frame_stats: bool = False,
+        demo: bool = False,
+        record: Optional[str] = None,
+        replay: Optional[Replay] = None,
+        profile: bool = False,
+        trace: Optional[str] = None,
+        startup_report: bool = False,
+        latency: bool = False,
+        das: float = DAS_MS,
+        arr: float = ARR_MS,
+        down_das: float = DOWN_DAS_MS,
+        down_arr: float = DOWN_ARR_MS,
+        config: Optional[GameConfig] = None,
+        view: Tuple[int, int] = (VIEW_COLUMNS, VIEW_ROWS),
+    ):
+        # Only the subsystems the game uses; pygame.init() would also bring
+        # up audio, joysticks and the rest.
+        self.startup = StartupTimer()
+        self.startup_report = startup_report
+        pygame.display.init()
+        pygame.font.init()
+        self.startup.mark("pygame init")
+
+        if replay:
+            self.config = replay.config
+            self.engine = Engine(self.config, seed=replay.seed)
+        else:
+            self.config = config or GameConfig()
+            self.engine = Engine(self.config)
+        self.engine.record_effects = True
+        # The window fits the view, not the board; drawing works in view
+        # cells and the camera maps them to the board.
+        self.camera = Camera(self.config.grid_width, self.config.grid_height, *view)
+        size = (
+            self.camera.columns * self.config.block_size + 200,
+            self.camera.rows * self.config.block_size,
         )
+        if vsync:
+            # SDL only honours vsync for renderer-backed (SCALED) windows.
+            self.screen = pygame.display.set_mode(size, pygame.SCALED, vsync=1)
+        else:
+            self.screen = pygame.display.set_mode(size)
         pygame.display.set_caption("Teratis")
+        self.startup.mark("window")
 
-        self.state = GameState.PLAYING
         self.ui_manager = UIManager(
-            self.screen.get_width(), self.screen.get_height(), self.config.block_size
+            self.screen.get_width(),
+            self.screen.get_height(),
+            self.config.block_size,
+            self.config.max_particles,
         )
+
+        # Dirty-rectangle mode: only regions that changed since the last
+        # presented frame are redrawn and passed to display.update().
+        self.dirty_rects = dirty_rects
+        self.last_state: Optional[GameState] = None
+        self.last_cells: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        self.last_piece: Set[Tuple[int, int]] = set()
+        self.last_ghost: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        self.last_hud: Optional[Tuple[int, int, int, Optional[int]]] = None
+        self.last_particles: Optional[pygame.Rect] = None
+
+        # Rendering runs at its own rate (0 = uncapped) over fixed-size
+        # simulation ticks; vsync paces presentation by itself.
+        self.fps = 0 if vsync else fps
+        self.interpolate = interpolate
+        self.frame_time = 1000 / 60
+        self.frame_stats = FrameStats()
+        self.show_frame_stats = frame_stats
+
+        # Input is polled while waiting for the next frame and stamped on
+        # arrival; each event is then applied just before the gravity of
+        # the tick its stamp falls in.
+        self.input_queue: deque = deque()
+        self.repeats = {
+            pygame.K_LEFT: AutoRepeat(Action.LEFT, das, arr),
+            pygame.K_RIGHT: AutoRepeat(Action.RIGHT, das, arr),
+            pygame.K_DOWN: AutoRepeat(Action.DOWN, down_das, down_arr),
+        }
+        self.latency = LatencyStats()
+        self.show_latency = latency
+        self.previous_pose: Optional[Tuple[BlockShape, int, int]] = None
+
+        # Game-over fade and name entry run as states, never as nested loops;
+        # slow follow-up work is deferred and run within a per-frame budget.
+        self.transition = Transition.NONE
+        self.transition_time = 0.0
+        self.player_name = ""
+        self.fade_surface: Optional[pygame.Surface] = None
+        self.deferred: deque = deque()
+
+        # Demo mode: the autoplayer drives the game and restarts it after
+        # each game over; its scores are not recorded.
+        self.autoplayer = AutoPlayer(delay=DEMO_ACTION_DELAY) if demo else None
+
+        # Every action is stamped with the number of simulation ticks run
+        # before it, for recording a replay or playing one back.
+        self.ticks = 0
+        self.record_path = record
+        self.recorder = Recorder(self.engine) if record else None
+        self.replay_player = ReplayPlayer(replay) if replay else None
+
+        # Phase timings: F3 toggles the sidebar overlay, which turns the
+        # profiler on; a trace path keeps it on and exports on exit.
+        self.profiler = PhaseProfiler()
+        self.profiler.enabled = profile or bool(trace)
+        self.profiler.tracing = bool(trace)
+        self.trace_path = trace
+        self.show_profiler = profile
+        self.profiler_view: Tuple[list, list] = ([], [])
+        self.profiler_refresh = 0.0
+
+        # High scores are only needed for the sidebar rank and the game-over
+        # screen, so they load after the first frame is on screen.
         self.high_score_manager = HighScoreManager()
-        self.next_block = None
+        self.defer(self.high_score_manager.load)
+        self.defer(self.finish_startup)
+        self.defer(self.build_leaderboard)
+        self.startup.mark("game state")
 
-        self.reset_game()
+    def finish_startup(self) -> None:
+        self.startup.mark("deferred loading")
+        if self.startup_report:
+            print(self.startup.summary())
+            self.quit()
 
     def reset_game(self):
-        self.grid = [
-            [None for _ in range(self.config.grid_width)]
-            for _ in range(self.config.grid_height)
-        ]
-        self.current_block = None
-        self.next_block = None
-        self.score = 0
-        self.start_time = pygame.time.get_ticks()
-        self.fall_speed = self.config.initial_fall_speed
-        self.combo_count = 0
-        self.state = GameState.PLAYING
-
-    def create_new_block(self) -> None:
-        if not self.current_block and self.state == GameState.PLAYING:
-            if self.next_block:
-                self.current_block = self.next_block
+        self.step(Action.RESET)
+        self.transition = Transition.NONE
+        self.last_state = None
+
+    def step(self, action: Action = Action.NONE, dt: float = 0.0) -> None:
+        previous_state = self.engine.state
+        if self.recorder:
+            self.recorder.record(self.ticks, action)
+        self.engine.step(action, dt)
+        self.spawn_effects()
+        if self.engine.state != previous_state:
+            self.on_state_change(previous_state)
+
+    def on_state_change(self, previous_state: GameState) -> None:
+        if previous_state != GameState.PLAYING:
+            return
+        if self.engine.state in (GameState.GAME_OVER, GameState.WON):
+            self.transition = Transition.FADE
+            self.transition_time = 0.0
+            # Queued now, not after the fade, so quitting during it keeps it.
+            if (
+                self.engine.state == GameState.GAME_OVER
+                and self.engine.time_remaining == 0
+                and not self.autoplayer
+                and not self.replay_player
+            ):
+                self.defer(self.high_score_manager.add_score, self.engine.score)
+
+    def update_transition(self, dt: float) -> None:
+        if self.transition == Transition.NONE:
+            return
+        self.transition_time += dt
+        if self.transition == Transition.FADE and self.transition_time >= FADE_DURATION:
+            self.transition_time = 0.0
+            if self.replay_player:
+                # The recording carries its own resets.
+                self.transition = Transition.NONE
+            elif self.autoplayer:
+                self.reset_game()
+            elif self.engine.state == GameState.WON:
+                self.player_name = ""
+                self.transition = Transition.NAME_ENTRY
             else:
-                x = self.config.grid_width // 2
-                color = random.choice(COLORS)
-                new_block = Block(x, 0, color)
-                new_block.shape = BlockShape(
-                    color, random.choice(["I", "L", "T", "S", "O"])
-                )
-                self.current_block = new_block
-
-            # Create next block
-            x = self.config.grid_width // 2
-            color = random.choice(COLORS)
-            self.next_block = Block(x, 0, color)
-            self.next_block.shape = BlockShape(
-                color, random.choice(["I", "L", "T", "S", "O"])
-            )
-
-            if not self.is_valid_move(self.current_block, 0, 0):
-                self.state = GameState.GAME_OVER
-                self.show_game_over_animation()
+                self.transition = Transition.NONE
+
+    def defer(self, task: Callable, *args) -> None:
+        self.deferred.append((task, args))
+
+    def run_deferred(self) -> None:
+        # The budget starts here rather than with the frame, so a frame
+        # that is slow to simulate or draw still runs at least one task.
+        # Tasks deferred while these run wait for the next frame.
+        start = time.perf_counter()
+        for _ in range(len(self.deferred)):
+            if (time.perf_counter() - start) * 1000 >= DEFERRED_BUDGET_MS:
                 return
+            task, args = self.deferred.popleft()
+            task(*args)
+
+    def build_leaderboard(self) -> None:
+        """Index the score history a slice per frame until it is done."""
+        leaderboard = self.high_score_manager.leaderboard
+        if leaderboard is not None and not leaderboard.build(LEADERBOARD_SLICE_MS):
+            self.defer(self.build_leaderboard)
+
+    def spawn_effects(self) -> None:
+        camera = self.camera
+        for kind, x, y, color in self.engine.effects:
+            if not camera.visible(x, y):
+                continue
+            if kind == "land":
+                self.add_landing_effect(x, y)
+            else:
+                self.ui_manager.particles.spawn(
+                    (x - camera.x) * self.config.block_size,
+                    (y - camera.y) * self.config.block_size,
+                    color,
+                    5,
+                )
+        self.engine.effects.clear()
+
+    def poll_input(self) -> None:
+        stamp = time.perf_counter() * 1000
+        for event in pygame.event.get():
+            self.input_queue.append((stamp, event))
+
+    def apply_input(self, until: float) -> None:
+        """Handle the input stamped up to `until` (ms) and the key repeats
+        falling due before each event and by `until`."""
+        queue = self.input_queue
+        while queue and queue[0][0] <= until:
+            stamp, event = queue.popleft()
+            self.fire_repeats(stamp)
+            if event.type == pygame.QUIT:
+                self.quit()
+            self.handle_input(event, stamp)
+        self.fire_repeats(until)
+
+    def fire_repeats(self, until: float) -> None:
+        for repeat in self.repeats.values():
+            count = repeat.due(until)
+            dx, dy = REPEAT_MOVES[repeat.action]
+            while count and self.engine.state == GameState.PLAYING:
+                block = self.engine.current_block
+                # Repeats stop at walls; a timed down repeat may place the
+                # piece, as holding soft drop did.
+                if not block or (
+                    not self.engine.is_valid_move(block, dx, dy)
+                    and not (dy and repeat.interval)
+                ):
+                    break
+                self.step(repeat.action)
+                count -= 1
 
-    def is_valid_move(self, block: Block, dx: int, dy: int) -> bool:
-        if not block.shape:
-            return False
-
-        for y, row in enumerate(block.shape.blocks):
-            for x, has_block in enumerate(row):
-                if has_block:
-                    new_x = block.x + x + dx
-                    new_y = block.y + y + dy
-
-                    if not (
-                        0 <= new_x < self.config.grid_width
-                        and 0 <= new_y < self.config.grid_height
-                    ):
-                        return False
-
-                    if new_y >= 0 and self.grid[new_y][new_x] is not None:
-                        return False
-        return True
-
-    def handle_input(self, event: pygame.event.Event) -> None:
+    def handle_input(self, event: pygame.event.Event, stamp: float = 0.0) -> None:
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.toggle_profiler()
+            return
+        if self.replay_player:
+            return
+        if event.type == pygame.KEYDOWN:
+            self.latency.input(stamp)
+        elif event.type == pygame.KEYUP and event.key in self.repeats:
+            self.repeats[event.key].release()
+        if self.transition == Transition.NAME_ENTRY:
+            self.handle_name_input(event)
+            return
+        if self.transition == Transition.FADE:
+            return
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_p:
-                self.toggle_pause()
+                self.step(Action.PAUSE)
             elif event.key == pygame.K_r:
                 self.reset_game()
-            elif self.state == GameState.PLAYING:
-                self.handle_gameplay_input(event)
-        elif event.type == pygame.KEYUP and self.state == GameState.PLAYING:
-            if event.key == pygame.K_DOWN:
-                self.fall_speed = self.config.initial_fall_speed
-
-    def handle_gameplay_input(self, event: pygame.event.Event) -> None:
-        if event.key == pygame.K_LEFT:
-            self.move_block(-1)
-        elif event.key == pygame.K_RIGHT:
-            self.move_block(1)
-        elif event.key == pygame.K_DOWN:
-            self.fall_speed = 50
+            elif self.engine.state == GameState.PLAYING:
+                self.handle_gameplay_input(event, stamp)
+
+    def toggle_profiler(self) -> None:
+        self.show_profiler = not self.show_profiler
+        self.profiler.enabled = self.show_profiler or self.profiler.tracing
+        self.last_hud = None
+
+    def draw_profiler(self) -> None:
+        now = time.perf_counter() * 1000
+        if now >= self.profiler_refresh:
+            rows = self.profiler.percentiles()
+            latency = self.latency.percentiles()
+            if latency:
+                rows.append(("input lag", *latency))
+            self.profiler_view = (rows, self.profiler.histogram())
+            self.profiler_refresh = now + PROFILER_REFRESH_MS
+        self.ui_manager.draw_profiler(self.screen, *self.profiler_view)
+
+    def handle_gameplay_input(self, event: pygame.event.Event, stamp: float) -> None:
+        repeat = self.repeats.get(event.key)
+        if repeat:
+            # The newer of left and right wins.
+            if event.key == pygame.K_LEFT:
+                self.repeats[pygame.K_RIGHT].release()
+            elif event.key == pygame.K_RIGHT:
+                self.repeats[pygame.K_LEFT].release()
+            self.step(repeat.action)
+            repeat.press(stamp)
         elif event.key == pygame.K_UP:
-            self.rotate_block()
+            self.step(Action.ROTATE)
         elif event.key == pygame.K_SPACE:
-            self.hard_drop()
+            self.step(Action.HARD_DROP)
 
-    def toggle_pause(self):
-        if self.state == GameState.PLAYING:
-            self.state = GameState.PAUSED
-        elif self.state == GameState.PAUSED:
-            self.state = GameState.PLAYING
+    def handle_name_input(self, event: pygame.event.Event) -> None:
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_RETURN:
+            self.transition = Transition.NONE
+            self.defer(
+                self.high_score_manager.add_score,
+                self.engine.score,
+                self.player_name.strip() or "Player",
+            )
+        elif event.key == pygame.K_BACKSPACE:
+            self.player_name = self.player_name[:-1]
+        elif len(self.player_name) < MAX_NAME_LENGTH:
+            self.player_name += event.unicode
 
-    def move_block(self, dx: int) -> None:
-        if self.current_block and self.is_valid_move(self.current_block, dx, 0):
-            self.current_block = self.current_block.moved(dx, 0)
+    def add_landing_effect(self, x: int, y: int):
+        radius = self.config.block_size // 2
+        self.ui_manager.particles.spawn(
+            (x - self.camera.x) * self.config.block_size + radius,
+            (y - self.camera.y) * self.config.block_size + radius,
+            (255, 255, 255),
+            5,
+        )
 
-    def hard_drop(self):
-        if not self.current_block:
-            return
-        while self.is_valid_move(self.current_block, 0, 1):
-            self.current_block.move(0, 1)
-        self.place_block()
-
-    def rotate_block(self):
-        if self.current_block:
-            old_blocks = self.current_block.shape.blocks.copy()
-            self.current_block.shape.rotate()
-            if not self.is_valid_move(self.current_block, 0, 0):
-                self.current_block.shape.blocks = old_blocks
-
-    def drop_block(self) -> bool:
-        if not self.current_block:
-            return False
+    def draw_fade(self):
+        if self.fade_surface is None or self.fade_surface.get_width() != (
+            self.config.block_size
+        ):
+            self.fade_surface = pygame.Surface(
+                (self.config.block_size, self.config.block_size)
+            )
+            self.fade_surface.fill((0, 0, 0))
+        self.fade_surface.set_alpha(
+            int(250 * min(1.0, self.transition_time / FADE_DURATION))
+        )
 
-        if self.is_valid_move(self.current_block, 0, 1):
-            self.current_block.move(0, 1)
-            return False
-        else:
-            self.place_block()
-            return True
+        for x, y, _ in self.visible_cells():
+            self.screen.blit(
+                self.fade_surface,
+                (x * self.config.block_size, y * self.config.block_size),
+            )
 
-    def place_block(self) -> None:
-        if not self.current_block:
+    def draw(self, alpha: float = 1.0) -> None:
+        """Draw a frame `alpha` of the way from the last tick to the next."""
+        block = self.engine.current_block
+        if block and self.camera.follow(block, self.engine.drop_distance(block)):
+            # Everything on screen moved.
+            self.last_state = None
+        if (
+            self.dirty_rects
+            and self.last_state == GameState.PLAYING
+            and self.engine.state == GameState.PLAYING
+        ):
+            self.draw_dirty()
             return
 
-        for y, row in enumerate(self.current_block.shape.blocks):
-            for x, has_block in enumerate(row):
-                if has_block:
-                    grid_x = self.current_block.x + x
-                    grid_y = self.current_block.y + y
-                    self.grid[grid_y][grid_x] = Block(
-                        grid_x, grid_y, self.current_block.color
-                    )
-                    self.add_landing_effect(grid_x, grid_y)
-
-        matches = self.find_matches()
-        if matches:
-            self.remove_matches(matches)
-            self.apply_gravity()
+        self.ui_manager.draw_grid_background(
+            self.screen,
+            self.config,
+            self.engine.state == GameState.PLAYING
+            or self.transition == Transition.FADE,
+        )
+        self.profiler.mark("background")
 
-            while True:
-                matches = self.find_matches()
-                if not matches:
-                    break
-                self.remove_matches(matches)
-                self.apply_gravity()
+        if self.engine.state == GameState.PAUSED:
+            self.draw_pause_screen()
+        elif self.transition == Transition.FADE:
+            self.draw_game_screen(alpha)
+            self.draw_fade()
+        elif self.transition == Transition.NAME_ENTRY:
+            self.draw_name_entry()
+        elif self.engine.state in [GameState.GAME_OVER, GameState.WON]:
+            self.ui_manager.draw_game_over(
+                self.screen,
+                self.engine.score,
+                self.high_score_manager.high_scores,
+                self.engine.state,
+            )
+        else:
+            self.draw_game_screen(alpha)
+        self.profiler.mark("overlay")
 
-        self.current_block = None
+        self.ui_manager.update_particles(self.frame_time * 60 / 1000)
+        self.ui_manager.draw_particles(self.screen)
+        self.profiler.mark("particles")
 
-    def add_landing_effect(self, x: int, y: int):
-        radius = self.config.block_size // 2
-        for _ in range(5):
-            self.ui_manager.particles.append(
-                self.ui_manager.create_particle(
-                    x * self.config.block_size + radius,
-                    y * self.config.block_size + radius,
-                    (255, 255, 255),
-                )
-            )
+        if self.show_profiler:
+            self.draw_profiler()
+            self.profiler.mark("profiler")
 
-    def find_matches(self) -> List[List[Block]]:
-        matches = []
-        for y in range(self.config.grid_height - 1, -1, -1):
-            line = []
-            line_complete = True
+        if self.dirty_rects:
+            self.remember_frame(*self.frame_cells(), self.ghost_cells())
+        pygame.display.flip()
+        self.profiler.mark("flip")
 
-            for x in range(self.config.grid_width):
-                if self.grid[y][x] is None:
-                    line_complete = False
-                    break
-                line.append(self.grid[y][x])
+    def visible_cells(self) -> Iterator[Tuple[int, int, Tuple[int, int, int]]]:
+        """(x, y, color) of the settled cells in view, in view cells."""
+        camera = self.camera
+        for block in self.engine.blocks(
+            camera.x, camera.y, camera.x + camera.columns, camera.y + camera.rows
+        ):
+            yield block.x - camera.x, block.y - camera.y, block.color
 
-            if line_complete:
-                matches.append(line)
+    def frame_cells(
+        self,
+    ) -> Tuple[Dict[Tuple[int, int], Tuple[int, int, int]], Set[Tuple[int, int]]]:
+        cells = {(x, y): color for x, y, color in self.visible_cells()}
+        piece = set()
+        block = self.engine.current_block
+        if block:
+            camera = self.camera
+            for x, y in block.shape.layout.cells:
+                if camera.visible(block.x + x, block.y + y):
+                    cell = (block.x + x - camera.x, block.y + y - camera.y)
+                    cells[cell] = block.color
+                    piece.add(cell)
+        return cells, piece
+
+    def ghost_cells(self) -> Dict[Tuple[int, int], Tuple[int, int, int]]:
+        """Where the falling piece would land, less the cells it covers, in
+        view cells."""
+        block = self.engine.current_block
+        if not block or self.engine.state != GameState.PLAYING:
+            return {}
+        distance = self.engine.drop_distance(block)
+        if not distance:
+            return {}
+        camera = self.camera
+        y = block.y + distance
+        return {
+            (block.x + cell_x - camera.x, y + cell_y - camera.y): block.color
+            for cell_x, cell_y in block.shape.layout.cells
+            if (
+                cell_y + distance >= block.shape.layout.height
+                or not block.shape.layout.blocks[cell_y + distance][cell_x]
+            )
+            and camera.visible(block.x + cell_x, y + cell_y)
+        }
 
-        return matches
+    def remember_frame(
+        self,
+        cells: Dict[Tuple[int, int], Tuple[int, int, int]],
+        piece: Set[Tuple[int, int]],
+        ghost: Dict[Tuple[int, int], Tuple[int, int, int]],
+    ) -> None:
+        self.last_state = self.engine.state
+        self.last_cells = cells
+        self.last_piece = piece
+        self.last_ghost = ghost
+        self.last_hud = self.hud()
+        self.last_particles = self.ui_manager.particle_bounds()
+
+    def hud(self) -> Tuple[int, int, int, Optional[int]]:
+        """Sidebar values: score, seconds left, combo and live rank."""
+        score = self.engine.score
+        return (
+            score,
+            self.engine.time_remaining,
+            self.engine.combo_count,
+            self.high_score_manager.rank(score),
+        )
 
-    def remove_matches(self, matches: List[List[Block]]) -> None:
-        if not matches:
-            self.combo_count = 0
-            return
+    def draw_dirty(self) -> None:
+        block_size = self.config.block_size
+        cells, piece = self.frame_cells()
+        ghost = self.ghost_cells()
+        dirty = []
+
+        # Changed cells, including the shadow's 2px overhang
+        for key in self.changed_cells(cells, piece, ghost):
+            dirty.append(
+                pygame.Rect(
+                    key[0] * block_size,
+                    key[1] * block_size,
+                    block_size + 2,
+                    block_size + 2,
+                )
+            )
 
-        lines_cleared = len(matches)
-        base_scores = {1: 100, 2: 300, 3: 500, 4: 800}
-        score_gain = base_scores.get(lines_cleared, 800) * self.combo_count
-        self.score += score_gain
-        self.combo_count += 1
-
-        for line in matches:
-            for block in line:
-                self.grid[block.y][block.x] = None
-                for _ in range(5):
-                    self.ui_manager.particles.append(
-                        self.ui_manager.create_particle(
-                            block.x * self.config.block_size,
-                            block.y * self.config.block_size,
-                            block.color,
-                        )
-                    )
+        # Where particles were last frame and where they are now
+        self.ui_manager.update_particles(self.frame_time * 60 / 1000)
+        particles = self.ui_manager.particle_bounds()
+        for bounds in (self.last_particles, particles):
+            if bounds:
+                dirty.append(bounds)
+        self.profiler.mark("particles")
 
-    def apply_gravity(self) -> None:
-        for x in range(self.config.grid_width):
-            empty_y = None
-
-            for y in range(self.config.grid_height - 1, -1, -1):
-                if self.grid[y][x] is None:
-                    if empty_y is None:
-                        empty_y = y
-                elif empty_y is not None:
-                    self.grid[empty_y][x] = self.grid[y][x]
-                    self.grid[y][x] = None
-                    self.grid[empty_y][x].y = empty_y
-                    empty_y -= 1
-
-    def show_game_over_animation(self):
-        fade_surface = pygame.Surface((self.config.block_size, self.config.block_size))
-        fade_surface.fill((0, 0, 0))
-
-        for alpha in range(0, 255, 5):
-            fade_surface.set_alpha(alpha)
-            for y in range(self.config.grid_height):
-                for x in range(self.config.grid_width):
-                    if self.grid[y][x]:
-                        self.screen.blit(
-                            fade_surface,
-                            (x * self.config.block_size, y * self.config.block_size),
-                        )
-            pygame.display.flip()
-            pygame.time.wait(10)
-
-    def draw(self) -> None:
-        self.screen.fill(self.ui_manager.colors["background"])
-        self.ui_manager.draw_grid_background(self.screen)
+        for rect in dirty:
+            self.redraw_board_region(rect, cells, piece, ghost)
+        self.profiler.mark("board")
 
-        if self.state == GameState.PAUSED:
-            self.draw_pause_screen()
-        elif self.state in [GameState.GAME_OVER, GameState.WON]:
-            self.ui_manager.draw_game_over(
-                self.screen, self.score, self.high_score_manager.high_scores, self.state
+        sidebar = pygame.Rect(
+            self.ui_manager.screen_width - self.ui_manager.sidebar_width,
+            0,
+            self.ui_manager.sidebar_width,
+            self.ui_manager.screen_height,
+        )
+        hud = self.hud()
+        if (
+            hud != self.last_hud
+            or self.engine.combo_count > 1
+            or self.show_profiler
+            or sidebar.collidelist(dirty) != -1
+        ):
+            self.screen.set_clip(sidebar)
+            self.ui_manager.draw_grid_background(
+                self.screen, self.config, True, sidebar
             )
-        else:
-            self.draw_game_screen()
+            score, time_left, combo, rank = hud
+            self.ui_manager.draw_sidebar(
+                self.screen, score, time_left, combo, self.config.target_score, rank
+            )
+            if self.show_profiler:
+                self.draw_profiler()
+            self.screen.set_clip(None)
+            dirty.append(sidebar)
+        self.profiler.mark("hud")
 
-        self.ui_manager.update_particles()
         self.ui_manager.draw_particles(self.screen)
+        self.profiler.mark("particles")
 
-        pygame.display.flip()
+        self.remember_frame(cells, piece, ghost)
+        if dirty:
+            pygame.display.update(dirty)
+        self.profiler.mark("flip")
 
-    def draw_game_screen(self):
-        for y in range(self.config.grid_height):
-            for x in range(self.config.grid_width):
-                pygame.draw.rect(
-                    self.screen,
-                    (50, 50, 50),
-                    (
-                        x * self.config.block_size,
-                        y * self.config.block_size,
-                        self.config.block_size,
-                        self.config.block_size,
-                    ),
-                    1,
-                )
-                if self.grid[y][x]:
-                    self.grid[y][x].draw(
-                        self.screen, self.config.block_size, self.ui_manager
+    def changed_cells(
+        self,
+        cells: Dict[Tuple[int, int], Tuple[int, int, int]],
+        piece: Set[Tuple[int, int]],
+        ghost: Dict[Tuple[int, int], Tuple[int, int, int]],
+    ) -> Set[Tuple[int, int]]:
+        """View cells to redraw to bring the last frame up to this one."""
+        changed = {
+            key
+            for key in cells.keys() | self.last_cells.keys()
+            if cells.get(key) != self.last_cells.get(key)
+        }
+        # A piece cell that settles keeps its color, but a full redraw now
+        # draws it in row order instead of last, so the shadows overlapping
+        # it stack differently.
+        changed.update(piece ^ self.last_piece)
+        # The ghost follows the piece and its drop distance. Whenever it
+        # changes, redraw every cell it covered last frame and covers now.
+        if ghost != self.last_ghost:
+            changed.update(ghost.keys() | self.last_ghost.keys())
+        return changed
+
+    def redraw_board_region(
+        self,
+        rect: pygame.Rect,
+        cells: Dict[Tuple[int, int], Tuple[int, int, int]],
+        piece: Set[Tuple[int, int]],
+        ghost: Dict[Tuple[int, int], Tuple[int, int, int]],
+    ) -> None:
+        block_size = self.config.block_size
+        self.screen.set_clip(rect)
+        self.ui_manager.draw_grid_background(self.screen, self.config, True, rect)
+
+        # Neighbouring cells can reach into the region with their shadows.
+        x_range = range(
+            max(0, (rect.left - 2) // block_size - 1),
+            min(self.camera.columns, (rect.right - 1) // block_size + 1),
+        )
+        y_range = range(
+            max(0, (rect.top - 2) // block_size - 1),
+            min(self.camera.rows, (rect.bottom - 1) // block_size + 1),
+        )
+        # Settled cells, the ghost, then the falling piece, as in a full redraw
+        for y in y_range:
+            for x in x_range:
+                color = cells.get((x, y))
+                if color and (x, y) not in piece:
+                    self.ui_manager.draw_cell(self.screen, x, y, color, block_size)
+        for (x, y), color in ghost.items():
+            if x in x_range and y in y_range:
+                self.ui_manager.draw_ghost_cell(self.screen, x, y, color, block_size)
+        for y in y_range:
+            for x in x_range:
+                if (x, y) in piece:
+                    self.ui_manager.draw_cell(
+                        self.screen, x, y, cells[(x, y)], block_size
                     )
+        self.screen.set_clip(None)
 
-        if self.current_block:
-            self.current_block.draw(
-                self.screen, self.config.block_size, self.ui_manager
+    def draw_game_screen(self, alpha: float = 1.0):
+        for x, y, color in self.visible_cells():
+            self.ui_manager.draw_cell(self.screen, x, y, color, self.config.block_size)
+
+        for (x, y), color in self.ghost_cells().items():
+            self.ui_manager.draw_ghost_cell(
+                self.screen, x, y, color, self.config.block_size
             )
 
-        elapsed_time = (pygame.time.get_ticks() - self.start_time) // 1000
-        time_remaining = max(0, self.config.time_limit - elapsed_time)
+        block = self.engine.current_block
+        if block:
+            x, y = block.x, block.y
+            if (
+                self.interpolate
+                and self.previous_pose
+                and self.previous_pose[0] is block.shape
+            ):
+                _, previous_x, previous_y = self.previous_pose
+                x = previous_x + (x - previous_x) * alpha
+                y = previous_y + (y - previous_y) * alpha
+            x -= self.camera.x
+            y -= self.camera.y
+            for cell_x, cell_y in block.shape.layout.cells:
+                self.ui_manager.draw_cell(
+                    self.screen,
+                    x + cell_x,
+                    y + cell_y,
+                    block.color,
+                    self.config.block_size,
+                )
+        self.profiler.mark("board")
 
+        score, time_left, combo, rank = self.hud()
         self.ui_manager.draw_sidebar(
-            self.screen,
-            self.score,
-            time_remaining,
-            self.combo_count,
-            self.config.target_score,
+            self.screen, score, time_left, combo, self.config.target_score, rank
         )
+        self.profiler.mark("hud")
 
     def draw_pause_screen(self):
-        overlay = pygame.Surface((self.screen.get_width(), self.screen.get_height()))
-        overlay.fill((0, 0, 0))
-        overlay.set_alpha(128)
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.ui_manager.overlay(128), (0, 0))
 
-        font = pygame.font.Font(None, 48)
-        text = font.render("PAUSED", True, (255, 255, 255))
+        text = self.ui_manager.labels["paused"]
         text_rect = text.get_rect(
             center=(self.screen.get_width() // 2, self.screen.get_height() // 2)
         )
         self.screen.blit(text, text_rect)
 
-    def run(self) -> None:
-        clock = pygame.time.Clock()
-        fall_time = 0
+    def draw_name_entry(self):
+        font = self.ui_manager.font_medium
 
-        while True:
-            if self.state == GameState.PLAYING:
-                elapsed_time = (pygame.time.get_ticks() - self.start_time) // 1000
-                if elapsed_time >= self.config.time_limit:
-                    self.state = GameState.GAME_OVER
-                    self.show_game_over_animation()
-                    self.high_score_manager.add_score(self.score)
-
-                if self.score >= self.config.target_score:
-                    self.state = GameState.WON
-                    self.show_game_over_animation()
-                    player_name = self.get_player_name()
-                    self.high_score_manager.add_score(self.score, player_name)
-
-                delta_time = clock.tick(60)
-                fall_time += delta_time
-
-                if fall_time >= self.fall_speed:
-                    if self.current_block:
-                        self.drop_block()
-                    fall_time = 0
-
-                if not self.current_block:
-                    self.create_new_block()
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                self.handle_input(event)
-
-            self.draw()
-            clock.tick(60)
-
-    def get_player_name(self) -> str:
-        name = ""
-        font = pygame.font.Font(None, 36)
-        input_active = True
-        cursor_visible = True
-        cursor_timer = 0
-        max_name_length = 12
-
-        # Add a clock to control the blinking cursor
-        self.clock = pygame.time.Clock()
-
-        while input_active:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RETURN:
-                        input_active = False
-                    elif event.key == pygame.K_BACKSPACE:
-                        name = name[:-1]
-                    else:
-                        if len(name) < max_name_length:
-                            name += event.unicode
-
-            # Draw semi-transparent overlay
-            self.screen.fill(self.ui_manager.colors["background"])
-            overlay = pygame.Surface(
-                (self.screen.get_width(), self.screen.get_height())
-            )
-            overlay.fill((0, 0, 0))
-            overlay.set_alpha(150)
-            self.screen.blit(overlay, (0, 0))
-
-            # Draw input box
-            box_width = 400
-            box_height = 200
-            box_x = (self.screen.get_width() - box_width) // 2
-            box_y = (self.screen.get_height() - box_height) // 2
-            pygame.draw.rect(
-                self.screen,
-                self.ui_manager.colors["panel"],
-                (box_x, box_y, box_width, box_height),
-                border_radius=10,
-            )
+        # Draw semi-transparent overlay
+        self.screen.fill(self.ui_manager.colors["background"])
+        self.screen.blit(self.ui_manager.overlay(150), (0, 0))
+
+        # Draw input box
+        box_width = 400
+        box_height = 200
+        box_x = (self.screen.get_width() - box_width) // 2
+        box_y = (self.screen.get_height() - box_height) // 2
+        pygame.draw.rect(
+            self.screen,
+            self.ui_manager.colors["panel"],
+            (box_x, box_y, box_width, box_height),
+            border_radius=10,
+        )
 
-            # Draw prompt text
-            prompt_text = font.render(
-                "Enter your name", True, self.ui_manager.colors["text"]
-            )
-            prompt_rect = prompt_text.get_rect(
-                center=(self.screen.get_width() // 2, box_y + 50)
-            )
-            self.screen.blit(prompt_text, prompt_rect)
+        # Draw prompt text
+        prompt_text = self.ui_manager.labels["enter_name"]
+        prompt_rect = prompt_text.get_rect(
+            center=(self.screen.get_width() // 2, box_y + 50)
+        )
+        self.screen.blit(prompt_text, prompt_rect)
 
-            # Draw input text box inside the input area
-            input_rect = pygame.Rect(box_x + 50, box_y + 100, box_width - 100, 40)
-            pygame.draw.rect(
-                self.screen, self.ui_manager.colors["background"], input_rect
+        # Draw input text box inside the input area
+        input_rect = pygame.Rect(box_x + 50, box_y + 100, box_width - 100, 40)
+        pygame.draw.rect(self.screen, self.ui_manager.colors["background"], input_rect)
+        pygame.draw.rect(self.screen, self.ui_manager.colors["text"], input_rect, 2)
+
+        # Render name text
+        name_surface = self.ui_manager.text(
+            font, self.player_name, self.ui_manager.colors["text"]
+        )
+        self.screen.blit(name_surface, (input_rect.x + 5, input_rect.y + 5))
+
+        # Blinking cursor, toggled every 500 ms
+        cursor_visible = int(self.transition_time // 500) % 2 == 0
+        if cursor_visible and len(self.player_name) < MAX_NAME_LENGTH:
+            cursor_pos = input_rect.x + 5 + name_surface.get_width()
+            pygame.draw.line(
+                self.screen,
+                self.ui_manager.colors["text"],
+                (cursor_pos, input_rect.y + 5),
+                (cursor_pos, input_rect.y + input_rect.height - 5),
             )
-            pygame.draw.rect(self.screen, self.ui_manager.colors["text"], input_rect, 2)
-
-            # Blinking cursor logic
-            cursor_timer += self.clock.tick(60)
-            if cursor_timer >= 500:
-                cursor_visible = not cursor_visible
-                cursor_timer = 0
-
-            # Render name text
-            name_surface = font.render(name, True, self.ui_manager.colors["text"])
-            self.screen.blit(name_surface, (input_rect.x + 5, input_rect.y + 5))
-
-            # Draw cursor if visible
-            if cursor_visible and len(name) < max_name_length:
-                cursor_pos = input_rect.x + 5 + name_surface.get_width()
-                pygame.draw.line(
-                    self.screen,
-                    self.ui_manager.colors["text"],
-                    (cursor_pos, input_rect.y + 5),
-                    (cursor_pos, input_rect.y + input_rect.height - 5),
-                )
 
-            pygame.display.flip()
+    def run(self) -> None:
+        tick_ms = 1000 / self.config.tick_rate
+        accumulator = 0.0
+        previous = deadline = time.perf_counter()
+
+        while True:
+            now = time.perf_counter()
+            # Clamp long stalls so the simulation doesn't spiral catching up.
+            self.frame_time = min((now - previous) * 1000, 250.0)
+            previous = now
+            self.frame_stats.record(self.frame_time)
+            self.profiler.begin_frame()
+            self.poll_input()
+
+            accumulator += self.frame_time
+            # The ticks run now cover the wall time up to `now`, less the
+            # remainder left in the accumulator.
+            tick_end = now * 1000 - accumulator + tick_ms
+            while accumulator >= tick_ms:
+                block = self.engine.current_block
+                self.previous_pose = (block.shape, block.x, block.y) if block else None
+                self.apply_input(tick_end)
+                if self.replay_player:
+                    for action in self.replay_player.actions(self.ticks):
+                        self.step(action)
+                    if self.replay_player.finished(self.ticks):
+                        self.finish_replay()
+                elif self.autoplayer and self.engine.state == GameState.PLAYING:
+                    action = self.autoplayer.act(self.engine)
+                    if action != Action.NONE:
+                        self.step(action)
+                self.step(Action.NONE, tick_ms)
+                self.ticks += 1
+                accumulator -= tick_ms
+                tick_end += tick_ms
+            self.profiler.mark("simulate")
+
+            # Input within the unfinished tick goes in ahead of its gravity.
+            self.apply_input(now * 1000)
+            self.update_transition(self.frame_time)
+            self.profiler.mark("events")
+
+            self.draw(accumulator / tick_ms)
+            self.latency.presented(time.perf_counter() * 1000)
+            self.startup.mark("first frame")
+            self.run_deferred()
+            self.profiler.mark("deferred")
+            if self.fps:
+                # Deadlines follow on from each other, so sleep overshoot
+                # doesn't pile up, but a late frame doesn't bank time.
+                deadline = max(deadline + 1 / self.fps, now)
+                self.wait_until(deadline)
+            self.profiler.mark("idle")
+            self.profiler.end_frame()
+
+    def wait_until(self, deadline: float) -> None:
+        """Sleep until `deadline` (perf_counter seconds), polling input."""
+        while True:
+            self.poll_input()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, INPUT_POLL_MS / 1000))
 
-        return name.strip() or "Player"
+    def finish_replay(self) -> None:
+        if self.replay_player.verify(self.engine):
+            print("replay finished: final score and board match")
+        else:
+            print("replay finished: diverged from the recording", file=sys.stderr)
+        self.quit()
+
+    def quit(self) -> None:
+        if self.show_frame_stats:
+            print(self.frame_stats.summary())
+        if self.show_latency:
+            print(self.latency.summary())
+        # Scores still queued would be lost; the rest of the queue can go.
+        for task, args in self.deferred:
+            if task == self.high_score_manager.add_score:
+                task(*args)
+        self.high_score_manager.close()
+        if self.trace_path:
+            self.profiler.export_trace(self.trace_path)
+            print(f"trace saved to {self.trace_path}")
+        if self.recorder:
+            self.recorder.finish(self.engine, self.ticks).save(self.record_path)
+            print(f"replay saved to {self.record_path}")
+        pygame.quit()
+        sys.exit()
 
 
 class HighScoreManager:
-    def __init__(self):
-        self.high_scores: List[Dict] = self.load_high_scores()
-
-    def load_high_scores(self) -> List[Dict]:
-        try:
-            with open("high_scores.json", "r") as f:
-                return json.load(f)
-        except:
-            return []
+    """The game's view of the score store: the top entries, live ranks and
+    adding a score.
+
+    Writes go to the store's background thread, so adding a score never
+    blocks a frame. Load and write problems are printed instead of being
+    dropped.
+    """
+
+    def __init__(self, path: str = "high_scores"):
+        self.path = path
+        self.store: Optional[ScoreStore] = None
+        self.leaderboard: Optional[Leaderboard] = None
+        self.reported_errors = 0
+
+    def load(self) -> None:
+        """Open the store; until then there are no scores and no ranks."""
+        if self.store is not None:
+            return
+        self.store = ScoreStore(self.path)
+        self.leaderboard = Leaderboard(self.store)
+        self.report_errors()
 
-    def save_high_scores(self):
-        
-        with open("high_scores.json", "w") as f:
-            json.dump(self.high_scores, f)
+    @property
+    def high_scores(self) -> List[Dict]:
+        return self.store.top if self.store else []
 
     def add_score(self, score: int, player_name: str = "Player"):
-        self.high_scores.append(
-            {"score": score, "name": player_name, "date": time.strftime("%Y-%m-%d")}
-        )
-        self.high_scores.sort(key=lambda x: x["score"], reverse=True)
-        self.high_scores = self.high_scores[:10]
-        self.save_high_scores()
+        self.load()
+        self.leaderboard.add(self.store.add(score, player_name))
+
+    def rank(self, score: int) -> Optional[int]:
+        """Rank `score` would get among every recorded score, or None while
+        the leaderboard is still loading."""
+        return self.leaderboard.rank(score) if self.leaderboard is not None else None
+
+    def report_errors(self) -> None:
+        for error in self.store.errors[self.reported_errors :]:
+            print(f"high scores: {error}", file=sys.stderr)
+        self.reported_errors = len(self.store.errors)
+
+    def close(self) -> None:
+        if self.store:
+            self.store.close()
+            self.report_errors()
+
+
+def cell_size(text: str) -> Tuple[int, int]:
+    """Parse a COLUMNSxROWS command-line size."""
+    try:
+        columns, rows = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected COLUMNSxROWS, got {text!r}")
+    if columns < 1 or rows < 1:
+        raise argparse.ArgumentTypeError(f"size must be positive, got {text!r}")
+    return columns, rows
 
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Teratis")
+    parser.add_argument(
+        "--dirty-rects",
+        action="store_true",
+        help="redraw and present only the screen regions that changed",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=60,
+        help="render frame cap, 0 for uncapped (default: 60)",
+    )
+    parser.add_argument(
+        "--vsync",
+        action="store_true",
+        help="present in step with the display refresh instead of a frame cap",
+    )
+    parser.add_argument(
+        "--interpolate",
+        action="store_true",
+        help="draw the falling piece between simulation ticks",
+    )
+    parser.add_argument(
+        "--frame-stats",
+        action="store_true",
+        help="print frame pacing statistics on exit",
+    )
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="print input-to-photon latency statistics on exit",
+    )
+    parser.add_argument(
+        "--das",
+        type=float,
+        default=DAS_MS,
+        help=f"ms a held left or right waits before repeating (default: {DAS_MS})",
+    )
+    parser.add_argument(
+        "--arr",
+        type=float,
+        default=ARR_MS,
+        help=f"ms between left or right repeats, 0 for instant (default: {ARR_MS})",
+    )
+    parser.add_argument(
+        "--down-das",
+        type=float,
+        default=DOWN_DAS_MS,
+        help=f"ms a held down waits before repeating (default: {DOWN_DAS_MS})",
+    )
+    parser.add_argument(
+        "--down-arr",
+        type=float,
+        default=DOWN_ARR_MS,
+        help=f"ms between down repeats, 0 for instant (default: {DOWN_ARR_MS})",
+    )
+    parser.add_argument(
+        "--board",
+        type=cell_size,
+        metavar="COLUMNSxROWS",
+        help="board size in cells (default: 10x20)",
+    )
+    parser.add_argument(
+        "--view",
+        type=cell_size,
+        default=(VIEW_COLUMNS, VIEW_ROWS),
+        metavar="COLUMNSxROWS",
+        help="most cells on screen; bigger boards scroll "
+        f"(default: {VIEW_COLUMNS}x{VIEW_ROWS})",
+    )
+    parser.add_argument(
+        "--demo",
+        action="store_true",
+        help="let the autoplayer play, restarting after every game",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="start with the frame-phase overlay shown (F3 toggles it)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="save frame phases as Chrome trace-event JSON to PATH on exit",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="save a replay of the session to PATH on exit",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="print how long each startup step took, then exit",
+    )
+    args = parser.parse_args()
+
+    config = None
+    if args.board:
+        config = GameConfig(grid_width=args.board[0], grid_height=args.board[1])
+    game = Game(
+        dirty_rects=args.dirty_rects,
+        fps=args.fps,
+        vsync=args.vsync,
+        interpolate=args.interpolate,
+        frame_stats=args.frame_stats,
+        latency=args.latency,
+        das=args.das,
+        arr=args.arr,
+        down_das=args.down_das,
+        down_arr=args.down_arr,
+        demo=args.demo,
+        record=args.record,
+        profile=args.profile,
+        trace=args.trace,
+        startup_report=args.startup_report,
+        config=config,
+        view=args.view,
+    )
+    game.run()
@@ -0,0 +1,136 @@
+"""Throughput of BatchEngine, checked against Engine board for board.
+
+Every board plays random placements (a random rotation and column for
+each piece). With --verify, a sample of boards is replayed through
+Engine.place_block one placement at a time and must end every placement
+with the same cells, score and combo.
+
+    python benchmarks/bench_batch.py --boards 4096 --placements 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teratis_batch import PLAYING, SHAPE_TYPES, BatchEngine  # noqa: E402
+from teratis_engine import COLORS, Block, BlockShape, Engine  # noqa: E402
+
+
+def random_moves(batch: BatchEngine, rng: np.random.Generator):
+    rotation = rng.integers(4, size=batch.count)
+    x = rng.integers(batch.config.grid_width, size=batch.count)
+    return rotation, x
+
+
+def load_engine(batch: BatchEngine, i: int) -> Engine:
+    """An Engine holding board `i` of `batch`, its piece at the spawn pose."""
+    engine = Engine(batch.config)
+    engine.load_cells(batch.boards[i].tobytes())
+    engine.score = int(batch.score[i])
+    engine.combo_count = int(batch.combo[i])
+    color = COLORS[batch.color[i] - 1]
+    block = Block(int(batch.x[i]), int(batch.y[i]), color)
+    block.shape = BlockShape(color, SHAPE_TYPES[batch.piece[i]])
+    block.shape.rotate(int(batch.rotation[i]))
+    engine.current_block = block
+    return engine
+
+
+def board_of(engine: Engine) -> list:
+    width = engine.config.grid_width
+    return [
+        list(engine.cells[y : y + width]) for y in range(0, len(engine.cells), width)
+    ]
+
+
+def prefill(batch: BatchEngine, rng: np.random.Generator, idx: np.ndarray):
+    """Fill the lower rows of fresh boards with holes and near-full lines,
+    so verification exercises clears and cascades."""
+    height, width = batch.config.grid_height, batch.config.grid_width
+    for i in idx:
+        for y in range(height // 2, height):
+            density = rng.random()
+            row = (rng.random(width) < density) * rng.integers(1, 6, width)
+            if row.all():
+                row[rng.integers(width)] = 0
+            batch.boards[i, y] = row
+
+
+def verify(boards: int, rounds: int, seed: int) -> Tuple[int, int]:
+    """Boards checked against Engine, and lines the finished games cleared."""
+    batch = BatchEngine(boards, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    prefill(batch, rng, np.arange(boards))
+    checked = 0
+    lines = 0
+    for _ in range(rounds):
+        rotation, x = random_moves(batch, rng)
+        expected = {}
+        for i in batch.playing():
+            engine = load_engine(batch, i)
+            block = engine.current_block
+            target = block.moved(int(x[i]) - block.x, 0)
+            target.shape = BlockShape(block.color, block.shape.shape_type)
+            target.shape.rotate(int(rotation[i]))
+            if engine.is_valid_move(target, 0, 0):
+                engine.current_block = target
+            engine.hard_drop()
+            expected[i] = (board_of(engine), engine.score, engine.combo_count)
+        batch.place(rotation, x)
+        for i, (board, score, combo) in expected.items():
+            actual = (
+                batch.boards[i].tolist(),
+                int(batch.score[i]),
+                int(batch.combo[i]),
+            )
+            if actual != (board, score, combo):
+                sys.exit(f"board {i} differs from Engine")
+            checked += 1
+        finished = np.flatnonzero(batch.state != PLAYING)
+        lines += int(batch.lines[finished].sum())
+        batch.reset(finished)
+        prefill(batch, rng, finished)
+    return checked, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=4096)
+    parser.add_argument("--placements", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args()
+
+    if args.verify:
+        checked, lines = verify(256, 200, args.seed)
+        print(f"verified {checked} placements ({lines} lines) against Engine")
+
+    batch = BatchEngine(args.boards, seed=args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    moves = [random_moves(batch, rng) for _ in range(64)]
+    start = time.perf_counter()
+    placed = 0
+    for round_ in range(args.placements):
+        before = int(batch.placements.sum())
+        batch.place(*moves[round_ % len(moves)])
+        placed += int(batch.placements.sum()) - before
+        if placed >= args.placements:
+            break
+        finished = np.flatnonzero(batch.state != PLAYING)
+        if len(finished):
+            batch.reset(finished)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.boards} boards: {placed} placements in {elapsed:.2f}s, "
+        f"{placed / elapsed:,.0f} placements/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
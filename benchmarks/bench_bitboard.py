@@ -0,0 +1,81 @@
+"""Compare the bitboard and cell-scan occupancy paths of Engine.
+
+Both engines play the same seeded, placement-heavy workload: every piece is
+rotated and slid to a random column, then dropped a row at a time with
+is_valid_move, the board is checked for full rows and the piece is placed.
+Only the drop and the full-row check are timed. They are what the two
+paths do differently; Engine.hard_drop reads the column skyline and makes
+no collision checks, and placing the piece costs the same either way. The
+script checks that both paths end every game with the same score, combo
+and board, then reports placements per second for each.
+
+    python benchmarks/bench_bitboard.py --games 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teratis_engine import Action, Engine, GameState  # noqa: E402
+
+
+def play(engine: Engine, seed: int, max_placements: int = 500):
+    moves = random.Random(seed + 1)
+    engine.reset_game(seed)
+    engine.step()
+    placements = 0
+    elapsed = 0.0
+    while engine.state == GameState.PLAYING and placements < max_placements:
+        for _ in range(moves.randrange(4)):
+            engine.step(Action.ROTATE)
+        dx = moves.randrange(-5, 6)
+        for _ in range(abs(dx)):
+            engine.step(Action.LEFT if dx < 0 else Action.RIGHT)
+        block = engine.current_block
+        start = time.perf_counter()
+        while engine.is_valid_move(block, 0, 1):
+            block.move(0, 1)
+        engine.find_matches()
+        elapsed += time.perf_counter() - start
+        engine.place_block()
+        engine.step()  # spawns the next piece
+        placements += 1
+    result = (engine.score, engine.combo_count, bytes(engine.cells))
+    return elapsed, placements, result
+
+
+def run(bitboard: bool, games: int):
+    engine = Engine(bitboard=bitboard)
+    results = []
+    placements = 0
+    elapsed = 0.0
+    for seed in range(games):
+        seconds, count, result = play(engine, seed)
+        elapsed += seconds
+        placements += count
+        results.append(result)
+    return elapsed, placements, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=200)
+    args = parser.parse_args()
+
+    scan_time, placements, scan_results = run(False, args.games)
+    bit_time, _, bit_results = run(True, args.games)
+    if scan_results != bit_results:
+        sys.exit("bitboard results differ from the cell-scan engine")
+
+    print(f"{args.games} games, {placements} placements, identical results")
+    print(f"cell scan: {placements / scan_time:10.0f} placements/s")
+    print(f"bitboard:  {placements / bit_time:10.0f} placements/s")
+    print(f"speedup:   {scan_time / bit_time:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Frame and tick times as the board grows under a fixed view.
+
+Every board is stacked with random cells to half its height and has a
+piece falling in the middle, a few rows above the stack. For each board
+size, the script times a full Game.draw, a dirty-rect Game.draw with
+nothing changed, a gravity tick, a hard drop and a hard drop that clears
+a line. Drawing only looks at the cells the camera shows, a tick or a
+drop only at the rows the piece touches, and a clear only at the rows
+above it and the columns it leaves holes in, so none of these should
+grow with the board.
+
+Each benchmark runs --repeat times and keeps its best p50, so one noisy
+run can't fail the gate. The script exits non-zero when any gated
+benchmark is slower on the largest board than on the smallest by more
+than --threshold. A cost that really grows with the board is thousands
+of times slower there, so the default leaves plenty of headroom.
+
+    python benchmarks/bench_board_size.py
+    python benchmarks/bench_board_size.py --sizes 10x20,2000x4000 --threshold 1
+"""
+
+import argparse
+import os
+import random
+import sys
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import time_ops  # noqa: E402
+from Teratis import Game, cell_size  # noqa: E402
+from teratis_engine import (  # noqa: E402
+    COLOR_INDEX,
+    COLORS,
+    Action,
+    Block,
+    BlockShape,
+    Engine,
+    GameConfig,
+    piece_from_pose,
+)
+
+SIZES = "10x20,100x200,1000x2000,2000x4000"
+VIEW = (10, 20)
+
+
+def stacked(width: int, height: int, seed: int = 0) -> Engine:
+    """An engine whose lower half is about half full, with at least four
+    holes in every row, and a T falling mid-board six rows above it."""
+    rng = random.Random(seed)
+    engine = Engine(GameConfig(grid_width=width, grid_height=height), seed=seed)
+    engine.step()
+    # Each random byte maps to empty or to one of the colors.
+    values = [COLOR_INDEX[color] for color in COLORS]
+    table = bytes(values[i % len(values)] if i % 2 else 0 for i in range(256))
+    top = height // 2
+    cells = bytearray(width * top)
+    for y in range(top, height):
+        row = bytearray(
+            rng.getrandbits(8 * width).to_bytes(width, "little").translate(table)
+        )
+        for x in rng.sample(range(width), min(4, width)):
+            row[x] = 0
+        cells += row
+    engine.load_cells(cells)
+
+    block = Block(width // 2, max(0, top - 6), COLORS[0])
+    block.shape = BlockShape(COLORS[0], "T")
+    engine.current_block = block
+    return engine
+
+
+def clearing(width: int, height: int, seed: int = 0) -> Engine:
+    """An engine whose lower half is solid but for four empty well columns
+    at the left edge, with a T falling mid-board and the row it lands its
+    bottom on filled around it, so a hard drop clears that line.
+
+    The random stack of stacked() has holes under overhangs all over, so
+    its first clear would settle the whole board. Here the only holes are
+    the wells under the line, which the clear empties out.
+    """
+    rng = random.Random(seed)
+    engine = Engine(GameConfig(grid_width=width, grid_height=height), seed=seed)
+    engine.step()
+    values = [COLOR_INDEX[color] for color in COLORS]
+    table = bytes(values[i % len(values)] for i in range(256))
+    top = height // 2
+    cells = bytearray(width * top)
+    for y in range(top, height):
+        row = bytearray(
+            rng.getrandbits(8 * width).to_bytes(width, "little").translate(table)
+        )
+        row[:4] = bytes(4)
+        cells += row
+
+    block = Block(width // 2, max(0, top - 6), COLORS[0])
+    block.shape = BlockShape(COLORS[0], "T")
+    engine.load_cells(cells)
+    layout = block.shape.layout
+    y = block.y + engine.drop_distance(block) + layout.height - 1
+    covered = {block.x + x for x, cell_y in layout.cells if cell_y == layout.height - 1}
+    for x in range(width):
+        if x not in covered:
+            cells[y * width + x] = values[0]
+    engine.load_cells(cells)
+    engine.current_block = block
+    return engine
+
+
+def putting_back(engine: Engine):
+    """A setup that puts back `engine`'s falling piece, the rows it lands
+    in and the column indexes, as they are now. Restoring the whole board
+    instead would flush the caches and time the op on cold memory."""
+    width = engine.config.grid_width
+    snapshot = engine.snapshot(rng=False)
+    block = engine.current_block
+    landing = block.y + engine.drop_distance(block)
+    rows = range(landing, landing + block.shape.layout.height)
+
+    def fresh():
+        for y in rows:
+            row = slice(y * width, (y + 1) * width)
+            engine.cells[row] = snapshot.cells[row]
+            engine.rows[y] = snapshot.rows[y]
+            engine.row_fill[y] = snapshot.row_fill[y]
+        engine.tops[:] = snapshot.tops
+        engine.tops_shift = snapshot.tops_shift
+        engine.column_fill[:] = snapshot.column_fill
+        engine.holes = snapshot.holes
+        engine.stack_top = snapshot.stack_top
+        engine.current_block = piece_from_pose(snapshot.current_block)
+        engine.fall_time = snapshot.fall_time
+        return engine
+
+    return fresh
+
+
+def benchmarks(width: int, height: int):
+    """(name, setup, op) for one board size."""
+    engine = stacked(width, height)
+    fresh = putting_back(engine)
+    game = Game(config=engine.config, view=VIEW)
+    game.engine = engine
+    tick = engine.fall_speed
+
+    def full_frame():
+        fresh()
+        game.dirty_rects = False
+        return game
+
+    def dirty_frame():
+        fresh()
+        game.dirty_rects = True
+        game.last_state = None
+        game.draw()
+        return game
+
+    def gravity_tick(engine: Engine) -> None:
+        engine.step(Action.NONE, tick)
+
+    # The clear only moves the rows from the piece down to the line.
+    before_clear = putting_back(clearing(width, height))
+
+    size = f"{width}x{height}"
+    yield f"Game.draw/{size}", full_frame, Game.draw
+    yield f"Game.draw dirty/{size}", dirty_frame, Game.draw
+    yield f"Engine.step tick/{size}", fresh, gravity_tick
+    yield f"hard_drop/{size}", fresh, Engine.hard_drop
+    yield f"hard_drop line clear/{size}", before_clear, Engine.hard_drop
+
+
+def growth(
+    results: Dict[str, Dict[str, float]], sizes: List[str]
+) -> List[Tuple[str, float]]:
+    """p50 on the largest board relative to the smallest, per benchmark."""
+    changes = []
+    for name in results:
+        kind, size = name.split("/")
+        if size != sizes[-1]:
+            continue
+        smallest = results[f"{kind}/{sizes[0]}"]["p50_us"]
+        changes.append((kind, results[name]["p50_us"] / smallest - 1))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per benchmark, keeping the best p50 (default: 3)",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=SIZES,
+        help=f"comma-separated COLUMNSxROWS boards, smallest first (default: {SIZES})",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.0,
+        help="allowed slowdown of the largest board over the smallest (default: 1)",
+    )
+    args = parser.parse_args()
+    sizes = [cell_size(size) for size in args.sizes.split(",")]
+
+    results = {}
+    print(f"{'benchmark':32} {'ops/s':>12} {'p50 us':>10} {'p99 us':>10}")
+    for width, height in sizes:
+        for name, setup, op in benchmarks(width, height):
+            result = min(
+                (time_ops(setup, op, args.samples) for _ in range(args.repeat)),
+                key=lambda result: result["p50_us"],
+            )
+            results[name] = result
+            print(
+                f"{name:32} {result['ops_per_sec']:12,.0f} "
+                f"{result['p50_us']:10.2f} {result['p99_us']:10.2f}"
+            )
+
+    labels = [f"{width}x{height}" for width, height in sizes]
+    print(f"\nlargest board ({labels[-1]}) vs smallest ({labels[0]}), p50:")
+    failures = []
+    for kind, change in growth(results, labels):
+        print(f"  {kind:30} {change:+7.0%}")
+        if change > args.threshold:
+            failures.append(kind)
+    if failures:
+        print("grows with the board:", ", ".join(failures))
+        sys.exit(1)
+    print(f"no benchmark grows beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
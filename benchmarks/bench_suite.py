@@ -0,0 +1,242 @@
+"""Timings of the core game operations on seeded fixture boards.
+
+Each engine operation runs on three fixtures built from a fixed seed:
+an empty board, a half-full one and one stacked to near the top. Every
+stacked board has an empty well column whose bottom four rows are
+otherwise full, so a vertical I dropped into it clears four lines and
+the random cells above cascade. Particle updates and a full-frame
+Game.draw run under the SDL dummy video driver.
+
+Every benchmark reports ops/s with p50 and p99 per-op times. --save
+writes them to a JSON baseline. --baseline compares against one and
+exits non-zero when a benchmark's p50 is slower than the baseline by
+more than --threshold; the median is used because ops/s, a mean, moves
+with every scheduling hiccup.
+
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --threshold 0.15
+"""
+
+import argparse
+import copy
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teratis_engine import COLOR_INDEX, COLORS, Block, BlockShape, Engine  # noqa: E402
+
+# Fixture name -> first stacked row as a fraction of the board height
+FIXTURES = {"empty": 1.0, "half_full": 0.5, "near_top": 0.3}
+
+
+def fixture(name: str, seed: int = 0) -> Engine:
+    rng = random.Random(seed)
+    engine = Engine(seed=seed)
+    engine.step()
+    width, height = engine.config.grid_width, engine.config.grid_height
+    top = int(height * FIXTURES[name])
+    well = width - 1
+    cells = bytearray(width * height)
+    for y in range(top, height):
+        if y >= height - 4:
+            columns = [x for x in range(width) if x != well]
+        else:
+            density = rng.uniform(0.3, 0.8)
+            columns = [x for x in range(width - 1) if rng.random() < density]
+            if len(columns) == width - 1:
+                columns.pop(rng.randrange(len(columns)))
+        for x in columns:
+            cells[y * width + x] = COLOR_INDEX[rng.choice(COLORS)]
+    engine.load_cells(cells)
+    return engine
+
+
+def well_piece(engine: Engine) -> Engine:
+    """Put a vertical I at the bottom of the well, ready to place."""
+    block = Block(engine.config.grid_width - 1, 0, COLORS[0])
+    block.shape = BlockShape(COLORS[0], "I")
+    while engine.is_valid_move(block, 0, 1):
+        block.move(0, 1)
+    engine.current_block = block
+    return engine
+
+
+def time_ops(
+    setup: Callable, op: Callable, samples: int, inner: int = 1
+) -> Dict[str, float]:
+    """Run `op(state)` `inner` times per sample on a fresh `setup()` state;
+    only the op is timed. A tenth as many warm-up samples run first, and
+    the collector is off while timing, as in timeit."""
+    per_op: List[float] = []
+    gc_was_enabled = gc.isenabled()
+    try:
+        for sample in range(samples + samples // 10):
+            state = setup()
+            gc.disable()
+            start = time.perf_counter()
+            for _ in range(inner):
+                op(state)
+            elapsed = time.perf_counter() - start
+            if gc_was_enabled:
+                gc.enable()
+            if sample >= samples // 10:
+                per_op.append(elapsed / inner)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    per_op.sort()
+    return {
+        "ops_per_sec": len(per_op) / sum(per_op),
+        "p50_us": statistics.median(per_op) * 1e6,
+        "p99_us": per_op[min(len(per_op) - 1, int(len(per_op) * 0.99))] * 1e6,
+    }
+
+
+def valid_drop(engine: Engine) -> bool:
+    return engine.is_valid_move(engine.current_block, 0, 1)
+
+
+def drop_distance(engine: Engine) -> int:
+    return engine.drop_distance(engine.current_block)
+
+
+def snapshot_board(engine: Engine):
+    return engine.snapshot(rng=False)
+
+
+def restore(state) -> None:
+    engine, snapshot = state
+    engine.restore(snapshot)
+
+
+def engine_benchmarks():
+    """(name, setup, op, ops per sample) for every engine benchmark. Ops
+    that change the board get a fresh copy of the fixture each sample."""
+    for name in FIXTURES:
+        board = fixture(name)
+        placing = well_piece(fixture(name))
+
+        def same(board=board):
+            return board
+
+        def fresh(board=board):
+            return copy.deepcopy(board)
+
+        def fresh_placing(placing=placing):
+            return copy.deepcopy(placing)
+
+        def snapshotted(board=board):
+            return board, board.snapshot()
+
+        yield f"is_valid_move/{name}", same, valid_drop, 100
+        yield f"drop_distance/{name}", same, drop_distance, 100
+        yield f"rotate_block/{name}", same, Engine.rotate_block, 100
+        yield f"find_matches/{name}", same, Engine.find_matches, 100
+        yield f"hard_drop/{name}", fresh, Engine.hard_drop, 1
+        yield f"place_block/{name}", fresh_placing, Engine.place_block, 1
+        yield f"apply_gravity/{name}", fresh, Engine.apply_gravity, 1
+        yield f"deepcopy/{name}", same, copy.deepcopy, 1
+        yield f"snapshot/{name}", same, Engine.snapshot, 100
+        yield f"snapshot_board/{name}", same, snapshot_board, 100
+        yield f"restore/{name}", snapshotted, restore, 100
+
+
+def update_particles(ui_manager) -> None:
+    ui_manager.update_particles(1)
+
+
+def draw(game) -> None:
+    game.draw()
+
+
+def render_benchmarks():
+    from Teratis import Game
+
+    game = Game()
+    particles = game.ui_manager.particles
+    rng = random.Random(0)
+
+    def full_pool():
+        particles.clear()
+        while len(particles) < particles.capacity:
+            particles.spawn(rng.randrange(300), rng.randrange(600), COLORS[0], 16)
+        return game.ui_manager
+
+    yield "update_particles/full_pool", full_pool, update_particles, 1
+
+    for name in FIXTURES:
+
+        def load(board=fixture(name)):
+            game.engine = board
+            return game
+
+        yield f"Game.draw/{name}", load, draw, 1
+
+
+def compare(results, baseline, threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if result["p50_us"] > old["p50_us"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p50 {result['p50_us']:.2f}us vs {old['p50_us']:.2f}us baseline"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument(
+        "--filter", default="", help="only run benchmarks whose name contains this"
+    )
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown as a fraction of the baseline (default: 0.2)",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    benchmarks = list(engine_benchmarks()) + list(render_benchmarks())
+    print(f"{'benchmark':32} {'ops/s':>12} {'p50 us':>10} {'p99 us':>10}")
+    for name, setup, op, inner in benchmarks:
+        if args.filter not in name:
+            continue
+        result = time_ops(setup, op, args.samples, inner)
+        results[name] = result
+        print(
+            f"{name:32} {result['ops_per_sec']:12,.0f} "
+            f"{result['p50_us']:10.2f} {result['p99_us']:10.2f}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("regressions:", *regressions, sep="\n  ")
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
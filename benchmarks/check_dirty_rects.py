@@ -0,0 +1,135 @@
+"""Compare dirty-rect frames against full redraws, pixel for pixel.
+
+Two games run side by side from the same seed and the same random
+inputs, one drawing every frame in full and one in dirty-rect mode. The
+script exits non-zero if any presented frame differs, and prints the
+first few differing frames with the bounds of the stale pixels.
+
+    python benchmarks/check_dirty_rects.py
+    python benchmarks/check_dirty_rects.py --frames 3000 --board 40x60 --view 12x16
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from typing import Iterator, Tuple
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+
+from Teratis import VIEW_COLUMNS, VIEW_ROWS, Game, cell_size  # noqa: E402
+from teratis_engine import Action, GameConfig, GameState  # noqa: E402
+from teratis_sweep import POLICIES  # noqa: E402
+
+# Random key presses, half the frames idle. Mostly soft drops, so most
+# pieces lock in place after resting a frame, and a few hard drops.
+ACTIONS = [Action.LEFT, Action.RIGHT, Action.ROTATE, Action.DOWN, Action.HARD_DROP]
+WEIGHTS = [2, 2, 2, 8, 1]
+IDLE = 0.5
+
+
+def frames(
+    dirty_rects: bool,
+    count: int,
+    seed: int,
+    board: Tuple[int, int],
+    view: Tuple[int, int],
+    policy_name: str,
+    max_particles: int,
+) -> Iterator[np.ndarray]:
+    """The screen after each of `count` seeded frames."""
+    config = GameConfig(
+        grid_width=board[0], grid_height=board[1], max_particles=max_particles
+    )
+    game = Game(dirty_rects=dirty_rects, config=config, view=view)
+    # Both games would otherwise draw onto the one display surface.
+    game.screen = game.screen.copy()
+    game.ui_manager.particles.rng = np.random.default_rng(seed)
+    game.engine.reset_game(seed)
+    rng = random.Random(seed)
+    policy = POLICIES[policy_name](seed, "") if policy_name in POLICIES else None
+    next_action = 0.0
+    for frame in range(count):
+        action = Action.NONE
+        if policy:
+            if game.engine.elapsed >= next_action:
+                action = policy.act(game.engine)
+                next_action = game.engine.elapsed + policy.delay
+        elif rng.random() >= IDLE:
+            action = rng.choices(ACTIONS, WEIGHTS)[0]
+        # Pause now and then, for the full redraws on entering and leaving it
+        if frame % 400 in (398, 399):
+            action = Action.PAUSE
+        game.step(action, 16)
+        game.draw()
+        yield pygame.surfarray.array3d(game.screen)
+        if game.engine.state in (GameState.GAME_OVER, GameState.WON):
+            game.reset_game()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=5)
+    parser.add_argument(
+        "--board", type=cell_size, default=(10, 20), help="COLUMNSxROWS board"
+    )
+    parser.add_argument(
+        "--view",
+        type=cell_size,
+        default=(VIEW_COLUMNS, VIEW_ROWS),
+        help="COLUMNSxROWS cells on screen",
+    )
+    parser.add_argument(
+        "--policy",
+        choices=["keys"] + sorted(POLICIES),
+        default="keys",
+        help="who plays: random key presses (default) or a teratis_sweep policy",
+    )
+    parser.add_argument(
+        "--max-particles",
+        type=int,
+        default=0,
+        help="particles on screen (default: 0, since effects repaint the cells "
+        "they cover and can hide stale ones)",
+    )
+    parser.add_argument("--show", type=int, default=5, help="mismatches to print")
+    args = parser.parse_args()
+
+    # Keep any score files the games write out of the working tree.
+    os.chdir(tempfile.mkdtemp(prefix="teratis-dirty-"))
+    run = (
+        args.frames,
+        args.seed,
+        args.board,
+        args.view,
+        args.policy,
+        args.max_particles,
+    )
+    mismatches = 0
+    for frame, (expected, actual) in enumerate(
+        zip(frames(False, *run), frames(True, *run))
+    ):
+        stale = (expected != actual).any(axis=2)
+        if not stale.any():
+            continue
+        mismatches += 1
+        if mismatches <= args.show:
+            xs, ys = np.nonzero(stale)
+            print(
+                f"frame {frame}: {len(xs)} pixels differ in "
+                f"x {xs.min()}-{xs.max()}, y {ys.min()}-{ys.max()}"
+            )
+    print(f"{mismatches} of {args.frames} dirty frames differ from a full redraw")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
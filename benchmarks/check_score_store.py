@@ -0,0 +1,248 @@
+"""Check that ScoreStore recovers from crashes and failed compactions.
+
+Each check runs on a fresh store in a temporary directory and puts the
+files into the state a crash or an OS error would leave them in:
+
+- a crash after a compaction swapped the snapshot in but before it reset
+  the log, so the log still holds entries the snapshot has;
+- a crash mid-append, leaving the log's last line torn;
+- compaction falling due while history() has the snapshot open, which
+  must wait (Windows can't replace an open file) and happen afterwards;
+- os.replace failing during compaction, which must leave the writer
+  running and be retried.
+
+The script exits non-zero if any check fails.
+
+    python benchmarks/check_score_store.py
+    python benchmarks/check_score_store.py --entries 500 --compact-every 16
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import teratis_scores  # noqa: E402
+from teratis_scores import ScoreStore  # noqa: E402
+
+
+def open_store(path: str, compact_every: int) -> ScoreStore:
+    return ScoreStore(path, compact_every=compact_every, legacy_path=None)
+
+
+def fill(store: ScoreStore, count: int) -> None:
+    for _ in range(count):
+        store.add(store.seq * 37 % 1000, f"player {store.seq % 7}")
+
+
+def log_lines(store: ScoreStore) -> int:
+    with open(store.log_path) as f:
+        return sum(1 for line in f if line.strip())
+
+
+def snapshot_header(store: ScoreStore) -> dict:
+    with open(store.snapshot_path) as f:
+        return json.loads(f.readline())
+
+
+def history_problems(path: str, compact_every: int, expected: int) -> List[str]:
+    """What is wrong with the store at `path`, reopened, holding entries
+    1..`expected` once each, with the best first in its top list."""
+    store = open_store(path, compact_every)
+    try:
+        problems = [f"error on load: {error}" for error in store.errors]
+        if store.count != expected:
+            problems.append(f"count {store.count}, expected {expected}")
+        seqs = sorted(entry["seq"] for entry in store.history())
+        if seqs != list(range(1, expected + 1)):
+            problems.append(
+                f"history holds {len(seqs)} entries, {len(set(seqs))} distinct, "
+                f"expected {expected}"
+            )
+        best = sorted(store.history(), key=teratis_scores.entry_key)
+        if store.top != best[: store.top_size]:
+            problems.append("top list differs from the best of the history")
+        return problems
+    finally:
+        store.close()
+
+
+def check_swap_before_log_reset(path: str, entries: int, compact_every: int):
+    """A crash between the snapshot swap and the log reset."""
+    # Copy the files aside at that moment, then put them back once the
+    # store has closed, as if it had stopped there.
+    crashed = path + ".crashed"
+    real_fsync_dir = teratis_scores.fsync_dir
+    saved = []
+
+    def fsync_dir_then_save(snapshot_path: str) -> None:
+        real_fsync_dir(snapshot_path)
+        if not saved:
+            shutil.copy(store.log_path, crashed + ".log.jsonl")
+            shutil.copy(store.snapshot_path, crashed + ".snapshot.jsonl")
+            saved.append(store.seq)
+
+    teratis_scores.fsync_dir = fsync_dir_then_save
+    try:
+        store = open_store(path, compact_every)
+        fill(store, entries)
+        store.close()
+    finally:
+        teratis_scores.fsync_dir = real_fsync_dir
+    if not saved:
+        return ["no compaction ran"]
+
+    shutil.copy(crashed + ".log.jsonl", store.log_path)
+    shutil.copy(crashed + ".snapshot.jsonl", store.snapshot_path)
+    logged = log_lines(store)
+    expected = snapshot_header(store)["last_seq"]
+    if logged != compact_every:
+        return [f"log held {logged} entries at the swap, expected {compact_every}"]
+    problems = history_problems(path, compact_every, expected)
+
+    # The next compaction must not merge the stale log lines in again.
+    store = open_store(path, compact_every)
+    fill(store, compact_every)
+    store.close()
+    return problems + history_problems(path, compact_every, expected + compact_every)
+
+
+def check_torn_log_line(path: str, entries: int, compact_every: int):
+    """A crash mid-append, leaving half a line at the end of the log."""
+    store = open_store(path, compact_every)
+    fill(store, entries)
+    store.close()
+    logged = log_lines(store)
+    with open(store.log_path, "a") as f:
+        f.write('{"date": "2024-01-01", "name": "torn", "sc')
+
+    store = open_store(path, compact_every)
+    problems = []
+    if len(store.errors) != 1 or f"{store.log_path}:{logged + 1}:" not in (
+        store.errors[0]
+    ):
+        problems.append(f"torn line reported as {store.errors}")
+    if store.count != entries:
+        problems.append(f"count {store.count} after the torn line, expected {entries}")
+    # The next entry must start on a line of its own, not finish the torn one.
+    fill(store, 1)
+    store.close()
+    # A glued line would fail to parse, dropping the new entry with it.
+    store = open_store(path, compact_every)
+    store.close()
+    if store.count != entries + 1:
+        problems.append(f"count {store.count} after appending, expected {entries + 1}")
+    return problems
+
+
+def check_compaction_waits_for_reader(path: str, entries: int, compact_every: int):
+    """Compaction falling due while history() is reading the snapshot."""
+    store = open_store(path, compact_every)
+    fill(store, compact_every)
+    store.close()
+    if log_lines(store) or not os.path.exists(store.snapshot_path):
+        return ["the first entries were not compacted"]
+
+    problems = []
+    store = open_store(path, compact_every)
+    history = store.history()
+    read = [next(history)]
+    if store.readers != 1:
+        problems.append(f"{store.readers} readers registered while reading")
+    # close() joins the writer, so every entry has been written, and any
+    # compaction tried, by the time it returns.
+    fill(store, entries)
+    store.close()
+    if snapshot_header(store)["last_seq"] != compact_every:
+        problems.append("the snapshot was replaced while history() read it")
+    if log_lines(store) != entries:
+        problems.append(f"log holds {log_lines(store)} entries, expected {entries}")
+    read.extend(history)
+    if len(read) != compact_every:
+        problems.append(f"history() read {len(read)}, expected {compact_every}")
+    if store.readers:
+        problems.append(f"{store.readers} readers registered after reading")
+
+    store = open_store(path, compact_every)
+    fill(store, 1)
+    store.close()
+    if log_lines(store):
+        problems.append("compaction did not run once history() finished")
+    return problems + history_problems(path, compact_every, compact_every + entries + 1)
+
+
+def check_failed_replace_retried(path: str, entries: int, compact_every: int):
+    """os.replace failing, as it does on Windows for a file held open."""
+    real_replace = os.replace
+
+    def replace_in_use(source: str, destination: str) -> None:
+        raise PermissionError(13, "file in use", destination)
+
+    store = open_store(path, compact_every)
+    os.replace = replace_in_use
+    try:
+        fill(store, entries)
+        store.close()
+    finally:
+        os.replace = real_replace
+
+    problems = []
+    failures = [e for e in store.errors if e.startswith("compaction failed")]
+    if len(failures) != entries // compact_every:
+        problems.append(f"{len(failures)} failed compactions reported: {store.errors}")
+    if any(error.startswith("score writer stopped") for error in store.errors):
+        problems.append("the writer stopped on the failed replace")
+    if log_lines(store) != entries:
+        problems.append(f"log holds {log_lines(store)} entries, expected {entries}")
+
+    # The log is past compact_every already, so the next entry compacts.
+    store = open_store(path, compact_every)
+    fill(store, 1)
+    store.close()
+    if log_lines(store):
+        problems.append("compaction was not retried")
+    return problems + history_problems(path, compact_every, entries + 1)
+
+
+CHECKS = [
+    check_swap_before_log_reset,
+    check_torn_log_line,
+    check_compaction_waits_for_reader,
+    check_failed_replace_retried,
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--entries", type=int, default=100, help="scores recorded per check"
+    )
+    parser.add_argument("--compact-every", type=int, default=8)
+    args = parser.parse_args()
+    if args.entries < args.compact_every:
+        parser.error("--entries must be at least --compact-every")
+
+    directory = tempfile.mkdtemp(prefix="teratis-scores-")
+    failed = 0
+    try:
+        for check in CHECKS:
+            path = os.path.join(directory, check.__name__)
+            problems = check(path, args.entries, args.compact_every)
+            print(f"{'FAIL' if problems else 'ok  '} {check.__doc__.splitlines()[0]}")
+            for problem in problems:
+                print(f"     {problem}")
+            failed += bool(problems)
+    finally:
+        shutil.rmtree(directory)
+    print(f"{failed} of {len(CHECKS)} checks failed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Vectorized Teratis engine that advances many boards at once.
+
+`BatchEngine` keeps N games in NumPy arrays: one ``(N, grid_height,
+grid_width)`` uint8 array of color indices (0 is empty, i + 1 is
+``COLORS[i]``) plus per-board arrays for the falling piece, score and
+combo. Every operation applies to all boards still playing with a fixed
+number of array operations, which is what policy evaluation needs.
+
+Placements follow `Engine.place_block` and `Engine.remove_matches` board
+for board: the same scoring table multiplied by the running combo count,
+and full column gravity after every clear, so cascades resolve the same
+way. There is no timer; a board is WON once its score reaches
+`GameConfig.target_score` after a placement and GAME_OVER when a new piece
+does not fit.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from teratis_engine import (
+    COLORS,
+    SHAPE_ROTATIONS,
+    SHAPE_TYPES,
+    GameConfig,
+    GameState,
+)
+
+# Cell offsets of every rotation of every shape, indexed [shape, rotation, cell]
+# with shapes in SHAPE_TYPES order. Every shape has four cells.
+CELL_X = np.array(
+    [
+        [[x for x, _ in rotation.cells] for rotation in SHAPE_ROTATIONS[s]]
+        for s in SHAPE_TYPES
+    ],
+    np.int64,
+)
+CELL_Y = np.array(
+    [
+        [[y for _, y in rotation.cells] for rotation in SHAPE_ROTATIONS[s]]
+        for s in SHAPE_TYPES
+    ],
+    np.int64,
+)
+
+# Engine.remove_matches scores, indexed by lines cleared (five or more as four)
+BASE_SCORES = np.array([0, 100, 300, 500, 800], np.int64)
+
+PLAYING = GameState.PLAYING.value
+GAME_OVER = GameState.GAME_OVER.value
+WON = GameState.WON.value
+
+
+class BatchEngine:
+    def __init__(
+        self,
+        count: int,
+        config: Optional[GameConfig] = None,
+        seed: Optional[int] = None,
+    ):
+        self.config = config or GameConfig()
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+
+        height, width = self.config.grid_height, self.config.grid_width
+        self.boards = np.zeros((count, height, width), np.uint8)
+        self.piece = np.zeros(count, np.int64)
+        self.color = np.zeros(count, np.uint8)
+        self.next_piece = np.zeros(count, np.int64)
+        self.next_color = np.zeros(count, np.uint8)
+        self.rotation = np.zeros(count, np.int64)
+        self.x = np.zeros(count, np.int64)
+        self.y = np.zeros(count, np.int64)
+        self.score = np.zeros(count, np.int64)
+        self.combo = np.zeros(count, np.int64)
+        self.lines = np.zeros(count, np.int64)
+        self.placements = np.zeros(count, np.int64)
+        self.state = np.zeros(count, np.uint8)
+        self.reset()
+
+    def reset(self, idx: Optional[np.ndarray] = None) -> None:
+        """Start new games on the boards in `idx` (default: all of them)."""
+        if idx is None:
+            idx = np.arange(self.count)
+        self.boards[idx] = 0
+        for array in (self.score, self.combo, self.lines, self.placements):
+            array[idx] = 0
+        self.state[idx] = PLAYING
+        # Like Engine.create_new_block: the first piece and the preview are
+        # both drawn fresh, then every spawn promotes the preview.
+        self.roll_next(idx)
+        self.spawn(idx)
+
+    def playing(self) -> np.ndarray:
+        return np.flatnonzero(self.state == PLAYING)
+
+    def roll_next(self, idx: np.ndarray) -> None:
+        self.next_piece[idx] = self.rng.integers(len(SHAPE_TYPES), size=len(idx))
+        self.next_color[idx] = self.rng.integers(1, len(COLORS) + 1, size=len(idx))
+
+    def spawn(self, idx: np.ndarray) -> None:
+        self.piece[idx] = self.next_piece[idx]
+        self.color[idx] = self.next_color[idx]
+        self.roll_next(idx)
+        self.rotation[idx] = 0
+        self.x[idx] = self.config.grid_width // 2
+        self.y[idx] = 0
+        blocked = ~self.fits(idx, self.rotation[idx], self.x[idx], self.y[idx])
+        self.state[idx[blocked]] = GAME_OVER
+
+    def cells(self, idx, rotation, x, y):
+        piece = self.piece[idx]
+        xs = x[:, None] + CELL_X[piece, rotation]
+        ys = y[:, None] + CELL_Y[piece, rotation]
+        return xs, ys
+
+    def fits(self, idx, rotation, x, y) -> np.ndarray:
+        """Whether each board's piece fits at the given pose."""
+        height, width = self.config.grid_height, self.config.grid_width
+        xs, ys = self.cells(idx, rotation, x, y)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        occupied = self.boards[
+            idx[:, None], np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)
+        ]
+        return (inside & (occupied == 0)).all(axis=1)
+
+    def move(self, dx) -> None:
+        idx = self.playing()
+        x = self.x[idx] + (dx[idx] if isinstance(dx, np.ndarray) else dx)
+        ok = self.fits(idx, self.rotation[idx], x, self.y[idx])
+        self.x[idx[ok]] = x[ok]
+
+    def rotate(self, turns=1) -> None:
+        idx = self.playing()
+        rotation = (
+            self.rotation[idx]
+            + (turns[idx] if isinstance(turns, np.ndarray) else turns)
+        ) % 4
+        ok = self.fits(idx, rotation, self.x[idx], self.y[idx])
+        self.rotation[idx[ok]] = rotation[ok]
+
+    def drop(self) -> None:
+        """Move every piece down one row, locking the ones that can't move."""
+        idx = self.playing()
+        ok = self.fits(idx, self.rotation[idx], self.x[idx], self.y[idx] + 1)
+        self.y[idx[ok]] += 1
+        self.lock(idx[~ok])
+
+    def hard_drop(self) -> None:
+        idx = self.playing()
+        if not len(idx):
+            return
+        height = self.config.grid_height
+        rows = np.arange(height)[None, :, None]
+        # below[n, y, x]: first occupied row at or below y in column x
+        below = np.where(self.boards[idx] != 0, rows, height)
+        below = np.minimum.accumulate(below[:, ::-1], axis=1)[:, ::-1]
+        below = np.concatenate(
+            [below, np.full((len(idx), 1, below.shape[2]), height)], axis=1
+        )
+        xs, ys = self.cells(idx, self.rotation[idx], self.x[idx], self.y[idx])
+        stop = below[np.arange(len(idx))[:, None], ys + 1, xs]
+        self.y[idx] += (stop - 1 - ys).min(axis=1)
+        self.lock(idx)
+
+    def place(self, rotation, x) -> None:
+        """Hard drop every piece at the given rotation and column.
+
+        Boards where that pose doesn't fit at the piece's current height
+        drop the piece where it is, as Engine ignores an invalid move.
+        """
+        idx = self.playing()
+        rotation = np.broadcast_to(rotation, (self.count,))[idx] % 4
+        x = np.broadcast_to(x, (self.count,))[idx]
+        ok = self.fits(idx, rotation, x, self.y[idx])
+        self.rotation[idx[ok]] = rotation[ok]
+        self.x[idx[ok]] = x[ok]
+        self.hard_drop()
+
+    def lock(self, idx: np.ndarray) -> None:
+        if not len(idx):
+            return
+        xs, ys = self.cells(idx, self.rotation[idx], self.x[idx], self.y[idx])
+        self.boards[idx[:, None], ys, xs] = self.color[idx][:, None]
+        self.placements[idx] += 1
+        self.resolve(idx)
+
+        won = self.score[idx] >= self.config.target_score
+        self.state[idx[won]] = WON
+        self.spawn(idx[~won])
+
+    def resolve(self, idx: np.ndarray) -> None:
+        """Clear full rows and apply column gravity until nothing clears."""
+        while len(idx):
+            boards = self.boards[idx]
+            full = (boards != 0).all(axis=2)
+            lines = full.sum(axis=1)
+            hit = lines > 0
+            if not hit.any():
+                return
+            idx, boards, full, lines = idx[hit], boards[hit], full[hit], lines[hit]
+
+            self.score[idx] += BASE_SCORES[np.minimum(lines, 4)] * self.combo[idx]
+            self.combo[idx] += 1
+            self.lines[idx] += lines
+
+            boards[full] = 0
+            # Stable sort puts empty cells on top of each column while the
+            # occupied ones keep their order, like Engine.apply_gravity.
+            order = np.argsort(boards != 0, axis=1, kind="stable")
+            self.boards[idx] = np.take_along_axis(boards, order, axis=1)
@@ -0,0 +1,319 @@
+"""Placement enumeration and a search-based autoplayer.
+
+`enumerate_placements` lists every final resting place of a piece: each
+distinct rotation reachable from its current pose, each column it can
+slide to, and the landing row taken from the board's column tops. Boards
+are plain lists of row bitmasks, the same layout as `Engine.rows`.
+
+`AutoPlayer` scores placements with a weighted heuristic, keeps the best
+few in a beam and looks one piece ahead at the preview, caching board
+evaluations under a Zobrist hash. It stops searching when its per-move
+time budget runs out and returns the best placement found so far.
+"""
+
+import random
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from teratis_engine import (
+    SHAPE_ROTATIONS,
+    Action,
+    Engine,
+    ShapeRotation,
+    column_tops,
+)
+
+DEFAULT_WEIGHTS = {
+    "lines": 0.76,
+    "height": -0.51,
+    "holes": -0.36,
+    "bumpiness": -0.18,
+}
+
+_zobrist_tables: Dict[Tuple[int, int], List[List[int]]] = {}
+
+
+def zobrist_table(width: int, height: int) -> List[List[int]]:
+    table = _zobrist_tables.get((width, height))
+    if table is None:
+        rng = random.Random(0x7E7A)
+        table = [[rng.getrandbits(64) for _ in range(width)] for _ in range(height)]
+        _zobrist_tables[(width, height)] = table
+    return table
+
+
+def zobrist_hash(rows: List[int], table: List[List[int]]) -> int:
+    key = 0
+    for y, row in enumerate(rows):
+        while row:
+            low = row & -row
+            key ^= table[y][low.bit_length() - 1]
+            row ^= low
+    return key
+
+
+try:
+    popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+
+    def popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+class Placement(NamedTuple):
+    rotation: int
+    x: int
+    y: int
+    rows: List[int]
+    lines: int
+    key: int
+
+
+def fits(rows: List[int], layout: ShapeRotation, x: int, y: int, width: int) -> bool:
+    if x + layout.min_x < 0 or x + layout.max_x >= width:
+        return False
+    if y < 0 or y + layout.height > len(rows):
+        return False
+    for i, mask in enumerate(layout.row_masks):
+        if rows[y + i] & (mask << x):
+            return False
+    return True
+
+
+def settle(rows: List[int], width: int) -> int:
+    """Clear full rows and apply column gravity as Engine does, in place;
+    returns the number of lines cleared."""
+    full_row = (1 << width) - 1
+    height = len(rows)
+    cleared = 0
+    while True:
+        full = [y for y, row in enumerate(rows) if row == full_row]
+        if not full:
+            return cleared
+        cleared += len(full)
+        for y in full:
+            del rows[y]
+            rows.insert(0, 0)
+        holes = 0
+        for y in range(1, height):
+            holes |= rows[y - 1] & ~rows[y]
+        if holes:
+            counts = [sum((row >> x) & 1 for row in rows) for x in range(width)]
+            for y in range(height):
+                rows[y] = sum(1 << x for x in range(width) if counts[x] >= height - y)
+
+
+def enumerate_placements(
+    rows: List[int],
+    width: int,
+    shape_type: str,
+    rotation: int,
+    x: int,
+    y: int,
+    key: int = 0,
+    table: Optional[List[List[int]]] = None,
+) -> List[Placement]:
+    """Every final placement of a piece starting at (rotation, x, y)."""
+    rotations = SHAPE_ROTATIONS[shape_type]
+    tops = column_tops(rows, width)
+    full_row = (1 << width) - 1
+    placements = []
+    seen_layouts = set()
+
+    for turns in range(4):
+        index = (rotation + turns) % 4
+        layout = rotations[index]
+        if not fits(rows, layout, x, y, width):
+            break
+        if layout.cells in seen_layouts:
+            continue
+        seen_layouts.add(layout.cells)
+
+        left = x
+        while fits(rows, layout, left - 1, y, width):
+            left -= 1
+        right = x
+        while fits(rows, layout, right + 1, y, width):
+            right += 1
+
+        for column in range(left, right + 1):
+            land = min(tops[column + cx] - 1 - cy for cx, cy in layout.bottoms)
+            if land < y:
+                # The piece is already under an overhang; step it down.
+                land = y
+                while fits(rows, layout, column, land + 1, width):
+                    land += 1
+            new_rows = list(rows)
+            full = False
+            for i, mask in enumerate(layout.row_masks):
+                new_rows[land + i] |= mask << column
+                full = full or new_rows[land + i] == full_row
+            lines = settle(new_rows, width) if full else 0
+            if table is None:
+                new_key = 0
+            elif lines:
+                new_key = zobrist_hash(new_rows, table)
+            else:
+                new_key = key
+                for cx, cy in layout.cells:
+                    new_key ^= table[land + cy][column + cx]
+            placements.append(Placement(index, column, land, new_rows, lines, new_key))
+    return placements
+
+
+class AutoPlayer:
+    """Beam search over the current piece and the preview piece.
+
+    A `budget_ms` of None searches the full beam every move, which makes
+    the choice independent of machine speed.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        beam_width: int = 4,
+        budget_ms: Optional[float] = 1.0,
+        delay: float = 0.0,
+        cache_size: int = 100_000,
+    ):
+        unknown = set(weights or {}) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"unknown heuristic weights: {sorted(unknown)}")
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.beam_width = beam_width
+        self.budget_ms = budget_ms
+        self.delay = delay
+        self.cache_size = cache_size
+        self.evaluations: Dict[int, float] = {}
+        self.expand_cost = 0.0
+
+        self.shape = None
+        self.target: Optional[Tuple[int, int]] = None
+        self.last_pose = None
+        self.next_action = 0.0
+
+    def evaluate(self, rows: List[int], width: int, key: int) -> float:
+        value = self.evaluations.get(key)
+        if value is not None:
+            return value
+        height = len(rows)
+        tops = column_tops(rows, width)
+        heights = [height - top for top in tops]
+        holes = 0
+        seen = 0
+        for row in rows:
+            covered = seen & ~row
+            if covered:
+                holes += popcount(covered)
+            seen |= row
+        bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+        value = (
+            self.weights["height"] * sum(heights)
+            + self.weights["holes"] * holes
+            + self.weights["bumpiness"] * bumpiness
+        )
+        if len(self.evaluations) >= self.cache_size:
+            self.evaluations.clear()
+        self.evaluations[key] = value
+        return value
+
+    def decide(self, engine: Engine) -> Optional[Tuple[int, int]]:
+        """Best (rotation, x) for the current piece, or None if it has none."""
+        if self.budget_ms is None:
+            deadline = float("inf")
+        else:
+            deadline = time.perf_counter() + self.budget_ms / 1000
+        block = engine.current_block
+        if block is None or block.shape is None:
+            return None
+        width = engine.config.grid_width
+        table = zobrist_table(width, engine.config.grid_height)
+        rows = list(engine.rows)
+        key = zobrist_hash(rows, table)
+
+        lines_weight = self.weights["lines"]
+        first = enumerate_placements(
+            rows,
+            width,
+            block.shape.shape_type,
+            block.shape.rotation,
+            block.x,
+            block.y,
+            key,
+            table,
+        )
+        if not first:
+            return None
+        ranked = sorted(
+            first,
+            key=lambda p: lines_weight * p.lines + self.evaluate(p.rows, width, p.key),
+            reverse=True,
+        )
+        best = ranked[0]
+
+        preview = engine.next_block
+        if preview is None or time.perf_counter() >= deadline:
+            return best.rotation, best.x
+
+        # Only expand a beam entry if the last expansion's cost still fits
+        # in the budget; otherwise keep the one-piece ranking.
+        best_value = None
+        for placement in ranked[: self.beam_width]:
+            started = time.perf_counter()
+            if started + self.expand_cost >= deadline:
+                break
+            children = enumerate_placements(
+                placement.rows,
+                width,
+                preview.shape.shape_type,
+                0,
+                width // 2,
+                0,
+                placement.key,
+                table,
+            )
+            if children:
+                value = max(
+                    lines_weight * child.lines
+                    + self.evaluate(child.rows, width, child.key)
+                    for child in children
+                )
+            else:
+                value = float("-inf")
+            value += lines_weight * placement.lines
+            if best_value is None or value > best_value:
+                best_value, best = value, placement
+            self.expand_cost = time.perf_counter() - started
+        return best.rotation, best.x
+
+    def act(self, engine: Engine) -> Action:
+        """Next action steering the current piece to the chosen placement."""
+        block = engine.current_block
+        if self.next_action > engine.elapsed + self.delay:
+            self.next_action = 0.0  # the engine was reset
+        if block is None or engine.elapsed < self.next_action:
+            return Action.NONE
+        if block.shape is not self.shape:
+            self.shape = block.shape
+            self.target = self.decide(engine)
+            self.last_pose = None
+        action = steer(block, self.target, self.last_pose)
+        self.last_pose = (block.shape.rotation, block.x, block.y)
+        if action != Action.NONE:
+            self.next_action = engine.elapsed + self.delay
+        return action
+
+
+def steer(block, target: Optional[Tuple[int, int]], last_pose=None) -> Action:
+    """Action moving `block` toward the (rotation, x) target, dropping it
+    once there or when the previous action didn't move it."""
+    if target is None or (block.shape.rotation, block.x, block.y) == last_pose:
+        return Action.HARD_DROP
+    rotation, x = target
+    if block.shape.rotation != rotation:
+        return Action.ROTATE
+    if block.x < x:
+        return Action.RIGHT
+    if block.x > x:
+        return Action.LEFT
+    return Action.HARD_DROP
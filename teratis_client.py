@@ -0,0 +1,273 @@
+"""Bot clients for teratis_server, for playing and load-testing it.
+
+Each client mirrors its session from the server's updates into an
+Engine that is never stepped, and lets a teratis_sweep policy play on
+it. A client only sends its next action once an update shows the last
+one applied, so a policy always steers from the current piece.
+
+Input latency is the time from sending an action to receiving the
+update that shows it applied. It is reported with the update rate and
+the bytes received.
+
+    python teratis_client.py --port 7777 --clients 500 --seconds 30
+    python teratis_client.py --unix /tmp/teratis.sock --policy bot
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+from teratis_engine import Action, Engine, GameConfig, GameState, piece_from_pose
+from teratis_server import Update, decode_hello, read_frame
+from teratis_sweep import POLICIES
+
+
+class Mirror:
+    """A client's copy of its session, kept in an Engine so policies can
+    read it. Pieces keep their identity until the next placement, as
+    TargetPolicy expects."""
+
+    def __init__(self, config: GameConfig, seed: int):
+        self.engine = Engine(config, seed=seed)
+        self.inputs = 0
+        self.placed_at = -1  # placements when the current piece was made
+
+    def apply(self, update: Update) -> None:
+        engine = self.engine
+        fields = update.fields
+        if update.rows:
+            width = engine.config.grid_width
+            for y, cells in update.rows:
+                engine.cells[y * width : (y + 1) * width] = cells
+                engine.rows[y] = sum(1 << x for x, value in enumerate(cells) if value)
+                engine.row_fill[y] = width - cells.count(0)
+            engine.update_tops()
+        engine.score = fields.get("score", engine.score)
+        engine.combo_count = fields.get("combo", engine.combo_count)
+        engine.lines_cleared = fields.get("lines", engine.lines_cleared)
+        engine.placements = fields.get("placements", engine.placements)
+        if "state" in fields:
+            engine.state = GameState(fields["state"])
+        if "time_left" in fields:
+            engine.elapsed = (engine.config.time_limit - fields["time_left"]) * 1000
+        self.inputs = fields.get("inputs", self.inputs)
+        if "next" in fields:
+            engine.next_block = piece_from_pose(fields["next"])
+        if "piece" in fields:
+            self.move_piece(fields["piece"])
+
+    def move_piece(self, pose) -> None:
+        engine = self.engine
+        block = engine.current_block
+        if pose is None:
+            engine.current_block = None
+        elif (
+            block is None
+            or self.placed_at != engine.placements
+            or block.shape.shape_type != pose[3]
+        ):
+            engine.current_block = piece_from_pose(pose)
+            self.placed_at = engine.placements
+        else:
+            block.x, block.y = pose[0], pose[1]
+            block.shape.rotate(pose[4] - block.shape.rotation)
+
+
+class ClientStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.updates = 0
+        self.bytes = 0
+        self.actions = 0
+        self.games = 0
+        self.errors = 0
+
+    def summary(self, clients: int, seconds: float) -> str:
+        lines = [
+            f"{clients} clients for {seconds:.1f}s: {self.updates} updates "
+            f"({self.updates / seconds / max(1, clients):.1f}/s per client), "
+            f"{self.bytes / seconds / 1024:.0f} KiB/s received, "
+            f"{self.actions} actions, {self.games} games finished, "
+            f"{self.errors} errors"
+        ]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            lines.append(
+                f"input latency mean {statistics.fmean(latencies):.1f} ms, "
+                f"p50 {latencies[len(latencies) // 2]:.1f} ms, p99 {p99:.1f} ms, "
+                f"max {latencies[-1]:.1f} ms"
+            )
+        return "\n".join(lines)
+
+
+class BotClient:
+    """One connection: a receiver applies updates to the mirror while the
+    bot acts, whenever its last action has been applied and the policy's
+    delay has passed."""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        mirror: Mirror,
+        policy,
+        delay: float,
+        stats: ClientStats,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.mirror = mirror
+        self.policy = policy
+        self.delay = delay
+        self.stats = stats
+        self.sent = 0
+        self.sent_at = 0.0
+        self.updated = asyncio.Event()
+
+    async def receive(self) -> None:
+        width = self.mirror.engine.config.grid_width
+        try:
+            while True:
+                data = await read_frame(self.reader)
+                self.stats.updates += 1
+                self.stats.bytes += len(data) + 4
+                self.mirror.apply(Update.decode(data, width))
+                if self.sent_at and self.mirror.inputs >= self.sent:
+                    latency = time.perf_counter() - self.sent_at
+                    self.stats.latencies.append(latency * 1000)
+                    self.sent_at = 0.0
+                self.updated.set()
+        finally:
+            self.updated.set()
+
+    async def play(self, until: float) -> None:
+        receiver = asyncio.ensure_future(self.receive())
+        next_action = 0.0
+        try:
+            while not receiver.done():
+                now = time.perf_counter()
+                if now >= until:
+                    break
+                if self.mirror.inputs < self.sent:
+                    wake = until
+                elif now < next_action:
+                    wake = next_action
+                else:
+                    action = self.choose()
+                    if action != Action.NONE:
+                        self.send(action)
+                        next_action = now + self.delay
+                        continue
+                    wake = until  # nothing to do before the next update
+                self.updated.clear()
+                try:
+                    await asyncio.wait_for(self.updated.wait(), wake - now)
+                except asyncio.TimeoutError:
+                    pass
+            if receiver.done():
+                receiver.result()
+        finally:
+            receiver.cancel()
+
+    def choose(self) -> Action:
+        if self.mirror.engine.state in (GameState.GAME_OVER, GameState.WON):
+            self.stats.games += 1
+            return Action.RESET
+        return self.policy.act(self.mirror.engine)
+
+    def send(self, action: Action) -> None:
+        self.writer.write(bytes([action.value]))
+        self.sent += 1
+        self.sent_at = time.perf_counter()
+        self.stats.actions += 1
+
+
+async def play(
+    connect,
+    seed: int,
+    policy_name: str,
+    policy_arg: str,
+    delay: Optional[float],
+    until: float,
+    stats: ClientStats,
+) -> None:
+    try:
+        reader, writer = await asyncio.wait_for(connect(), until - time.perf_counter())
+    except (OSError, asyncio.TimeoutError) as error:
+        stats.errors += 1
+        print(f"client {seed}: {error!r}", file=sys.stderr)
+        return
+    try:
+        config, session_seed = decode_hello(await read_frame(reader))
+        policy = POLICIES[policy_name](seed, policy_arg)
+        delay = policy.delay if delay is None else delay
+        client = BotClient(
+            reader, writer, Mirror(config, session_seed), policy, delay / 1000, stats
+        )
+        await client.play(until)
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError) as error:
+        stats.errors += 1
+        print(f"client {seed}: {error!r}", file=sys.stderr)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def run(args) -> ClientStats:
+    if args.unix:
+
+        def connect():
+            return asyncio.open_unix_connection(args.unix)
+
+    else:
+
+        def connect():
+            return asyncio.open_connection(args.host, args.port)
+
+    stats = ClientStats()
+    until = time.perf_counter() + args.seconds
+    await asyncio.gather(
+        *(
+            play(connect, seed, args.policy, args.policy_arg, args.delay, until, stats)
+            for seed in range(args.clients)
+        )
+    )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play bot clients against a Teratis server and report load."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", metavar="PATH", help="connect to a Unix socket")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument(
+        "--policy-arg", default="", help="policy option, e.g. the action script"
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        help="ms between a client's actions (default: the policy's own)",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    stats = asyncio.run(run(args))
+    print(stats.summary(args.clients, time.perf_counter() - started))
+    if stats.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,768 @@
+"""Pure game logic for Teratis.
+
+Nothing in this module imports pygame. `Engine` owns the board, the falling
+piece, the timer and the scoring rules and is advanced explicitly with
+`step(action, dt)`, so bots, tests and tuning runs can simulate thousands of
+games without a window. `Game` in Teratis.py is a renderer and input layer
+on top of it.
+"""
+
+import random
+
+from typing import Iterator, List, NamedTuple, Set, Tuple, Optional
+from dataclasses import dataclass
+from enum import Enum
+
+
+# Game States
+class GameState(Enum):
+    PLAYING = 1
+    PAUSED = 2
+    GAME_OVER = 3
+    WON = 4
+
+
+# Player actions understood by Engine.step
+class Action(Enum):
+    NONE = 0
+    LEFT = 1
+    RIGHT = 2
+    ROTATE = 3
+    SOFT_DROP = 4
+    SOFT_DROP_RELEASE = 5
+    HARD_DROP = 6
+    PAUSE = 7
+    RESET = 8
+    DOWN = 9  # one row down, placing the piece if it can't move
+
+
+# Enhanced color palette
+COLORS = [
+    (255, 215, 0),  # Gold
+    (147, 112, 219),  # Purple
+    (0, 191, 255),  # Deep Sky Blue
+    (50, 205, 50),  # Lime Green
+    (255, 99, 71),  # Tomato Red
+]
+
+# Board cells hold 0 for empty or a color's index in COLORS plus one.
+COLOR_INDEX = {color: i + 1 for i, color in enumerate(COLORS)}
+
+SHAPE_TYPES = ["I", "L", "T", "S", "O"]
+
+SOFT_DROP_SPEED = 50
+
+
+@dataclass
+class GameConfig:
+    block_size: int = 30
+    grid_width: int = 10
+    grid_height: int = 20
+    time_limit: int = 180
+    target_score: int = 1000
+    initial_fall_speed: int = 500
+    max_particles: int = 1024
+    tick_rate: int = 120
+
+
+@dataclass
+class Block:
+    x: int
+    y: int
+    color: Tuple[int, int, int]
+    shape: Optional["BlockShape"] = None
+    matched: bool = False
+
+    def __hash__(self):
+        return hash((self.x, self.y, self.color))
+
+    def __eq__(self, other):
+        if not isinstance(other, Block):
+            return NotImplemented
+        return (self.x, self.y, self.color) == (other.x, other.y, other.color)
+
+    def move(self, dx: int, dy: int) -> None:
+        self.x += dx
+        self.y += dy
+
+    def draw(self, screen, block_size: int, ui_manager) -> None:
+        if self.shape:
+            for x, y in self.shape.layout.cells:
+                ui_manager.draw_cell(
+                    screen, self.x + x, self.y + y, self.color, block_size
+                )
+        else:
+            ui_manager.draw_cell(screen, self.x, self.y, self.color, block_size)
+
+    def moved(self, dx: int, dy: int) -> "Block":
+        return Block(self.x + dx, self.y + dy, self.color, self.shape, self.matched)
+
+
+class ShapeRotation(NamedTuple):
+    blocks: Tuple[Tuple[bool, ...], ...]
+    # (x, y) offsets of the filled cells, row by row
+    cells: Tuple[Tuple[int, int], ...]
+    width: int
+    height: int
+    # Bit x of row_masks[y] is set when blocks[y][x] is filled.
+    row_masks: Tuple[int, ...]
+    min_x: int
+    max_x: int
+    # (x, y) of the lowest filled cell in each column, left to right
+    bottoms: Tuple[Tuple[int, int], ...]
+
+
+SHAPES = {
+    "I": [[True], [True], [True], [True]],
+    "L": [[True, False], [True, False], [True, True]],
+    "T": [[True, True, True], [False, True, False]],
+    "S": [[False, True, True], [True, True, False]],
+    "O": [[True, True], [True, True]],
+}
+
+
+def build_rotations(blocks: List[List[bool]]) -> Tuple[ShapeRotation, ...]:
+    rotations = []
+    matrix = tuple(tuple(row) for row in blocks)
+    for _ in range(4):
+        cells = tuple(
+            (x, y)
+            for y, row in enumerate(matrix)
+            for x, has_block in enumerate(row)
+            if has_block
+        )
+        rotations.append(
+            ShapeRotation(
+                blocks=matrix,
+                cells=cells,
+                width=len(matrix[0]),
+                height=len(matrix),
+                row_masks=tuple(
+                    sum(1 << x for x, has_block in enumerate(row) if has_block)
+                    for row in matrix
+                ),
+                min_x=min(x for x, _ in cells),
+                max_x=max(x for x, _ in cells),
+                bottoms=tuple(
+                    (x, max(y for cx, y in cells if cx == x))
+                    for x in sorted({x for x, _ in cells})
+                ),
+            )
+        )
+        # Clockwise quarter turn
+        matrix = tuple(zip(*matrix[::-1]))
+    return tuple(rotations)
+
+
+# Every rotation of every shape, built once at import.
+SHAPE_ROTATIONS = {
+    shape_type: build_rotations(blocks) for shape_type, blocks in SHAPES.items()
+}
+DEFAULT_ROTATIONS = build_rotations([[True]])
+
+
+def column_tops(rows: List[int], width: int) -> List[int]:
+    """Row index of the highest filled cell in each column (height if empty)."""
+    height = len(rows)
+    tops = [height] * width
+    seen = 0
+    for y, row in enumerate(rows):
+        new = row & ~seen
+        while new:
+            low = new & -new
+            tops[low.bit_length() - 1] = y
+            new ^= low
+        seen |= row
+    return tops
+
+
+class BlockShape:
+    def __init__(self, color: Tuple[int, int, int], shape_type: str):
+        self.color = color
+        self.shape_type = shape_type
+        self.rotations = SHAPE_ROTATIONS.get(shape_type, DEFAULT_ROTATIONS)
+        self.rotation = 0
+        self.layout = self.rotations[0]
+
+    @property
+    def blocks(self) -> Tuple[Tuple[bool, ...], ...]:
+        return self.layout.blocks
+
+    def rotate(self, turns: int = 1) -> None:
+        self.rotation = (self.rotation + turns) % 4
+        self.layout = self.rotations[self.rotation]
+
+
+# A piece as (x, y, color, shape type, rotation)
+PiecePose = Tuple[int, int, Tuple[int, int, int], str, int]
+
+
+class Snapshot(NamedTuple):
+    """A game's complete state, taken by Engine.snapshot."""
+
+    cells: bytes
+    rows: Tuple[int, ...]
+    row_fill: Tuple[int, ...]
+    tops: Tuple[int, ...]
+    tops_shift: int
+    column_fill: Tuple[int, ...]
+    holes: int
+    stack_top: int
+    current_block: Optional[PiecePose]
+    next_block: Optional[PiecePose]
+    score: int
+    elapsed: float
+    fall_time: float
+    fall_speed: float
+    combo_count: int
+    lines_cleared: int
+    placements: int
+    state: GameState
+    seed: int
+    rng_state: Optional[tuple]
+
+
+def piece_pose(block: Optional[Block]) -> Optional[PiecePose]:
+    if block is None:
+        return None
+    shape = block.shape
+    return block.x, block.y, block.color, shape.shape_type, shape.rotation
+
+
+def piece_from_pose(pose: Optional[PiecePose]) -> Optional[Block]:
+    if pose is None:
+        return None
+    x, y, color, shape_type, rotation = pose
+    block = Block(x, y, color)
+    block.shape = BlockShape(color, shape_type)
+    block.shape.rotate(rotation)
+    return block
+
+
+class Engine:
+    """Headless Teratis simulation.
+
+    The board is `cells`, a flat row-major bytearray of COLOR_INDEX
+    values, so copying it is one buffer copy; `snapshot` and `restore`
+    build on that. Block objects for settled cells are only made on
+    request, by `blocks`.
+
+    Landing and line-clear effects are reported through `effects` as
+    ``(kind, x, y, color)`` tuples when `record_effects` is set, so a
+    renderer can spawn particles without the engine knowing about them.
+    """
+
+    def __init__(
+        self,
+        config: Optional[GameConfig] = None,
+        bitboard: bool = True,
+        seed: Optional[int] = None,
+    ):
+        self.config = config or GameConfig()
+        # Occupancy is also kept as one integer per row (bit x = column x);
+        # with bitboard set, collision and line checks use it instead of
+        # scanning `cells`.
+        self.bitboard = bitboard
+        self.full_row = (1 << self.config.grid_width) - 1
+        self.record_effects = False
+        self.effects: List[Tuple[str, int, int, Tuple[int, int, int]]] = []
+        # Each engine draws its pieces from its own RNG, so a game is fully
+        # determined by its seed and inputs.
+        self.rng = random.Random()
+        self.reset_game(random.randrange(1 << 32) if seed is None else seed)
+
+    def reset_game(self, seed: Optional[int] = None):
+        """Start a new game. A seed restarts the piece sequence; without
+        one the sequence carries on from the previous game."""
+        if seed is not None:
+            self.seed = seed
+            self.rng.seed(seed)
+        self.cells = bytearray(self.config.grid_width * self.config.grid_height)
+        self.rows = [0] * self.config.grid_height
+        self.row_fill = [0] * self.config.grid_height
+        # Skyline: the highest filled row of each column, kept up to date by
+        # place_block, clears and gravity, so drop_distance needs no
+        # collision scan. A clear moves most of the skyline down at once,
+        # so `tops` is stored less `tops_shift`, the rows cleared since it
+        # was last rebuilt, and `column_fill`, the cells in each column,
+        # plus it; clears then only touch the columns they empty out.
+        self.tops = [self.config.grid_height] * self.config.grid_width
+        self.tops_shift = 0
+        self.column_fill = [0] * self.config.grid_width
+        # Columns that may have a hole, an empty cell under a filled one;
+        # only these settle after a clear. No row above stack_top has a cell.
+        self.holes = 0
+        self.stack_top = self.config.grid_height
+        self.current_block = None
+        self.next_block = None
+        self.score = 0
+        self.elapsed = 0.0
+        self.fall_time = 0.0
+        self.fall_speed = self.config.initial_fall_speed
+        self.combo_count = 0
+        self.lines_cleared = 0
+        self.placements = 0
+        self.state = GameState.PLAYING
+
+    def color_at(self, x: int, y: int) -> Optional[Tuple[int, int, int]]:
+        value = self.cells[y * self.config.grid_width + x]
+        return COLORS[value - 1] if value else None
+
+    def blocks(
+        self,
+        left: int = 0,
+        top: int = 0,
+        right: Optional[int] = None,
+        bottom: Optional[int] = None,
+    ) -> Iterator[Block]:
+        """A Block for every settled cell in columns [left, right) of rows
+        [top, bottom), row by row; the whole board by default."""
+        cells = self.cells
+        width = self.config.grid_width
+        right = width if right is None else min(right, width)
+        bottom = self.config.grid_height if bottom is None else bottom
+        mask = (1 << max(0, right - left)) - 1
+        for y in range(max(0, top), min(bottom, self.config.grid_height)):
+            row = (self.rows[y] >> left) & mask
+            while row:
+                low = row & -row
+                x = left + low.bit_length() - 1
+                yield Block(x, y, COLORS[cells[y * width + x] - 1])
+                row ^= low
+
+    def load_cells(self, cells: bytes) -> None:
+        """Replace the board with `cells`, laid out like `self.cells`, and
+        rebuild the row and column indexes from it."""
+        width = self.config.grid_width
+        self.cells = bytearray(cells)
+        for y in range(self.config.grid_height):
+            row = fill = 0
+            for x, value in enumerate(self.cells[y * width : (y + 1) * width]):
+                if value:
+                    row |= 1 << x
+                    fill += 1
+            self.rows[y] = row
+            self.row_fill[y] = fill
+        self.update_tops()
+
+    def snapshot(self, rng: bool = True) -> Snapshot:
+        """The whole game state, for undo, rewind or trying a move out.
+
+        Copying the piece RNG's state is most of the cost; leave it out
+        with `rng=False` when no piece will be drawn before restoring,
+        e.g. to hard drop and look at the board.
+        """
+        return Snapshot(
+            bytes(self.cells),
+            tuple(self.rows),
+            tuple(self.row_fill),
+            tuple(self.tops),
+            self.tops_shift,
+            tuple(self.column_fill),
+            self.holes,
+            self.stack_top,
+            piece_pose(self.current_block),
+            piece_pose(self.next_block),
+            self.score,
+            self.elapsed,
+            self.fall_time,
+            self.fall_speed,
+            self.combo_count,
+            self.lines_cleared,
+            self.placements,
+            self.state,
+            self.seed,
+            self.rng.getstate() if rng else None,
+        )
+
+    def restore(self, snapshot: Snapshot) -> None:
+        """Put the game back to `snapshot`. The pieces are new objects."""
+        self.cells[:] = snapshot.cells
+        self.rows[:] = snapshot.rows
+        self.row_fill[:] = snapshot.row_fill
+        self.tops[:] = snapshot.tops
+        self.tops_shift = snapshot.tops_shift
+        self.column_fill[:] = snapshot.column_fill
+        self.holes = snapshot.holes
+        self.stack_top = snapshot.stack_top
+        self.current_block = piece_from_pose(snapshot.current_block)
+        self.next_block = piece_from_pose(snapshot.next_block)
+        self.score = snapshot.score
+        self.elapsed = snapshot.elapsed
+        self.fall_time = snapshot.fall_time
+        self.fall_speed = snapshot.fall_speed
+        self.combo_count = snapshot.combo_count
+        self.lines_cleared = snapshot.lines_cleared
+        self.placements = snapshot.placements
+        self.state = snapshot.state
+        self.seed = snapshot.seed
+        if snapshot.rng_state is not None:
+            self.rng.setstate(snapshot.rng_state)
+
+    @property
+    def time_remaining(self) -> int:
+        return max(0, self.config.time_limit - int(self.elapsed // 1000))
+
+    def step(self, action: Action = Action.NONE, dt: float = 0.0) -> GameState:
+        """Apply one action, then advance the simulation by `dt` milliseconds."""
+        self.apply_action(action)
+        self.update(dt)
+        return self.state
+
+    def apply_action(self, action: Action) -> None:
+        if action == Action.PAUSE:
+            self.toggle_pause()
+        elif action == Action.RESET:
+            self.reset_game()
+        elif self.state != GameState.PLAYING:
+            return
+        elif action == Action.LEFT:
+            self.move_block(-1)
+        elif action == Action.RIGHT:
+            self.move_block(1)
+        elif action == Action.ROTATE:
+            self.rotate_block()
+        elif action == Action.SOFT_DROP:
+            self.fall_speed = SOFT_DROP_SPEED
+        elif action == Action.SOFT_DROP_RELEASE:
+            self.fall_speed = self.config.initial_fall_speed
+        elif action == Action.HARD_DROP:
+            self.hard_drop()
+        elif action == Action.DOWN:
+            self.move_down()
+
+    def update(self, dt: float) -> None:
+        # The clock keeps running while paused, as it always has.
+        if self.state in (GameState.PLAYING, GameState.PAUSED):
+            self.elapsed += dt
+        if self.state != GameState.PLAYING:
+            return
+
+        if self.elapsed // 1000 >= self.config.time_limit:
+            self.state = GameState.GAME_OVER
+            return
+
+        if self.score >= self.config.target_score:
+            self.state = GameState.WON
+            return
+
+        self.fall_time += dt
+        if self.fall_time >= self.fall_speed:
+            if self.current_block:
+                self.drop_block()
+            # Keep the remainder so gravity doesn't drift with the step size,
+            # but never bank more than one row.
+            self.fall_time = (self.fall_time - self.fall_speed) % self.fall_speed
+
+        if not self.current_block:
+            self.create_new_block()
+
+    def random_block(self) -> Block:
+        x = self.config.grid_width // 2
+        color = self.rng.choice(COLORS)
+        block = Block(x, 0, color)
+        block.shape = BlockShape(color, self.rng.choice(SHAPE_TYPES))
+        return block
+
+    def create_new_block(self) -> None:
+        if not self.current_block and self.state == GameState.PLAYING:
+            if self.next_block:
+                self.current_block = self.next_block
+            else:
+                self.current_block = self.random_block()
+
+            # Create next block
+            self.next_block = self.random_block()
+
+            if not self.is_valid_move(self.current_block, 0, 0):
+                self.state = GameState.GAME_OVER
+
+    def is_valid_move(self, block: Block, dx: int, dy: int) -> bool:
+        if not block.shape:
+            return False
+
+        if self.bitboard:
+            shape = block.shape.layout
+            new_x = block.x + dx
+            new_y = block.y + dy
+            if new_x + shape.min_x < 0 or new_x + shape.max_x >= self.config.grid_width:
+                return False
+            if new_y < 0 or new_y + len(shape.row_masks) > self.config.grid_height:
+                return False
+            rows = self.rows
+            for y, mask in enumerate(shape.row_masks, new_y):
+                if rows[y] & (mask << new_x):
+                    return False
+            return True
+
+        for x, y in block.shape.layout.cells:
+            new_x = block.x + x + dx
+            new_y = block.y + y + dy
+
+            if not (
+                0 <= new_x < self.config.grid_width
+                and 0 <= new_y < self.config.grid_height
+            ):
+                return False
+
+            if self.cells[new_y * self.config.grid_width + new_x]:
+                return False
+        return True
+
+    def toggle_pause(self):
+        if self.state == GameState.PLAYING:
+            self.state = GameState.PAUSED
+        elif self.state == GameState.PAUSED:
+            self.state = GameState.PLAYING
+
+    def move_block(self, dx: int) -> None:
+        if self.current_block and self.is_valid_move(self.current_block, dx, 0):
+            self.current_block = self.current_block.moved(dx, 0)
+
+    def move_down(self) -> None:
+        # A manual drop restarts the gravity timer, so it is never followed
+        # straight away by a gravity drop.
+        self.drop_block()
+        self.fall_time = 0.0
+
+    def drop_distance(self, block: Block) -> int:
+        """Rows `block` can fall before it lands."""
+        tops = self.tops
+        x, y = block.x, block.y
+        distance = self.tops_shift + min(
+            tops[x + cx] - 1 - cy - y for cx, cy in block.shape.layout.bottoms
+        )
+        if distance < 0:
+            # The piece is under an overhang; step it down.
+            distance = 0
+            while self.is_valid_move(block, 0, distance + 1):
+                distance += 1
+        return distance
+
+    def update_tops(self) -> None:
+        """Rebuild the column indexes from `rows` and `cells`, for code
+        that writes those directly."""
+        width, height = self.config.grid_width, self.config.grid_height
+        rows = self.rows
+        self.tops = column_tops(rows, width)
+        self.tops_shift = 0
+        self.column_fill = [
+            height - self.cells[x::width].count(0) for x in range(width)
+        ]
+        holes = 0
+        for y in range(1, height):
+            holes |= rows[y - 1] & ~rows[y]
+        self.holes = holes
+        self.stack_top = min(self.tops, default=height)
+
+    def hard_drop(self):
+        if not self.current_block:
+            return
+        self.current_block.move(0, self.drop_distance(self.current_block))
+        self.place_block()
+
+    def rotate_block(self):
+        if self.current_block:
+            self.current_block.shape.rotate()
+            if not self.is_valid_move(self.current_block, 0, 0):
+                self.current_block.shape.rotate(-1)
+
+    def drop_block(self) -> bool:
+        if not self.current_block:
+            return False
+
+        if self.is_valid_move(self.current_block, 0, 1):
+            self.current_block.move(0, 1)
+            return False
+        else:
+            self.place_block()
+            return True
+
+    def place_block(self) -> None:
+        if not self.current_block:
+            return
+
+        touched = set()
+        tops = self.tops
+        shift = self.tops_shift
+        rows = self.rows
+        column_fill = self.column_fill
+        width = self.config.grid_width
+        value = COLOR_INDEX[self.current_block.color]
+        for x, y in self.current_block.shape.layout.cells:
+            grid_x = self.current_block.x + x
+            grid_y = self.current_block.y + y
+            self.cells[grid_y * width + grid_x] = value
+            rows[grid_y] |= 1 << grid_x
+            self.row_fill[grid_y] += 1
+            column_fill[grid_x] += 1
+            if grid_y < tops[grid_x] + shift:
+                tops[grid_x] = grid_y - shift
+            touched.add(grid_y)
+            if self.record_effects:
+                self.effects.append(("land", grid_x, grid_y, (255, 255, 255)))
+        self.stack_top = min(self.stack_top, min(touched))
+        # A cell left over an empty one is the only way a hole forms, and
+        # the piece's cells are all in the rows it touched.
+        last = self.config.grid_height - 1
+        for y in touched:
+            if y < last:
+                self.holes |= rows[y] & ~rows[y + 1]
+
+        # The board never rests with a full row, so only rows the piece
+        # landed in, and later rows gravity refilled, can have completed.
+        full_rows = self.full_rows(touched)
+        while full_rows:
+            self.remove_matches(full_rows)
+            full_rows = self.full_rows(self.apply_gravity())
+
+        self.current_block = None
+        self.placements += 1
+
+    def full_rows(self, candidates: Set[int]) -> List[int]:
+        """Complete rows among `candidates`, bottom-up like find_matches."""
+        if self.bitboard:
+            return [
+                y
+                for y in sorted(candidates, reverse=True)
+                if self.rows[y] == self.full_row
+            ]
+        return [
+            y
+            for y in sorted(candidates, reverse=True)
+            if self.row_fill[y] == self.config.grid_width
+        ]
+
+    def find_matches(self) -> List[int]:
+        """Every complete row, bottom-up."""
+        if self.bitboard:
+            return [
+                y
+                for y in range(self.config.grid_height - 1, -1, -1)
+                if self.rows[y] == self.full_row
+            ]
+
+        width = self.config.grid_width
+        return [
+            y
+            for y in range(self.config.grid_height - 1, -1, -1)
+            if all(self.cells[y * width : (y + 1) * width])
+        ]
+
+    def remove_matches(self, matches: List[int]) -> None:
+        """Clear the complete rows `matches` and score them."""
+        if not matches:
+            self.combo_count = 0
+            return
+
+        lines_cleared = len(matches)
+        base_scores = {1: 100, 2: 300, 3: 500, 4: 800}
+        score_gain = base_scores.get(lines_cleared, 800) * self.combo_count
+        self.score += score_gain
+        self.combo_count += 1
+        self.lines_cleared += lines_cleared
+
+        width = self.config.grid_width
+        cells = self.cells
+        if self.record_effects:
+            for y in matches:
+                for x in range(width):
+                    self.effects.append(
+                        ("clear", x, y, COLORS[cells[y * width + x] - 1])
+                    )
+
+        # Only the rows from the top of the stack down to the lowest
+        # cleared one move; the empty rows above the stack stay as they are.
+        rows = self.rows
+        row_fill = self.row_fill
+        cleared = sorted(set(matches))
+        count = len(cleared)
+        top = min(self.stack_top, cleared[0])
+        bottom = cleared[-1] + 1
+        gone = set(cleared)
+        kept = [y for y in range(top, bottom) if y not in gone]
+        above = 0
+        for y in range(top, cleared[0]):
+            above |= rows[y]
+        cells[(top + count) * width : bottom * width] = b"".join(
+            [cells[y * width : (y + 1) * width] for y in kept]
+        )
+        cells[top * width : (top + count) * width] = bytes(count * width)
+        rows[top + count : bottom] = [rows[y] for y in kept]
+        rows[top : top + count] = [0] * count
+        row_fill[top + count : bottom] = [row_fill[y] for y in kept]
+        row_fill[top : top + count] = [0] * count
+        height = self.config.grid_height
+        self.stack_top = min(top + count, height)
+
+        # Every column loses `count` cells, and a column with a cell above
+        # the cleared rows keeps that top cell, now `count` rows lower; the
+        # shift covers both. The other columns had their top in the highest
+        # cleared row, and the shift puts their top on the first row kept
+        # below it; only those empty there need looking at.
+        self.tops_shift += count
+        shift = self.tops_shift
+        first_kept = cleared[0] + count
+        emptied = self.full_row & ~above
+        if first_kept < height:
+            emptied &= ~rows[first_kept]
+        else:
+            emptied = 0
+        while emptied:
+            low = emptied & -emptied
+            x = low.bit_length() - 1
+            emptied ^= low
+            y = height
+            if self.column_fill[x] > shift:
+                y = first_kept + 1
+                while not rows[y] & low:
+                    y += 1
+            self.tops[x] = y - shift
+
+    def apply_gravity(self) -> Set[int]:
+        """Let cells fall into the holes below them; returns the rows that
+        received a cell.
+
+        Row clears are already spliced out by remove_matches, so only
+        columns with a hole left under an overhang need settling, and
+        place_block marks those in `holes` as it leaves them.
+        """
+        holes = self.holes
+        self.holes = 0
+        changed = set()
+        while holes:
+            low = holes & -holes
+            self.settle_column(low.bit_length() - 1, changed)
+            holes ^= low
+        return changed
+
+    def settle_column(self, x: int, changed: Set[int]) -> None:
+        """Pack column `x`'s cells down onto the floor."""
+        cells = self.cells
+        rows = self.rows
+        width = self.config.grid_width
+        height = self.config.grid_height
+        bit = 1 << x
+        fill = self.column_fill[x] - self.tops_shift
+        empty_y = None
+
+        # Bottom-up, stopping once past the column's last cell
+        y = height - 1
+        seen = 0
+        while seen < fill:
+            if not cells[y * width + x]:
+                if empty_y is None:
+                    empty_y = y
+            else:
+                seen += 1
+                if empty_y is not None:
+                    cells[empty_y * width + x] = cells[y * width + x]
+                    cells[y * width + x] = 0
+                    rows[y] &= ~bit
+                    rows[empty_y] |= bit
+                    self.row_fill[y] -= 1
+                    self.row_fill[empty_y] += 1
+                    changed.add(empty_y)
+                    empty_y -= 1
+            y -= 1
+        self.tops[x] = height - fill - self.tops_shift
@@ -0,0 +1,213 @@
+"""Recording and replaying Teratis games.
+
+A game is determined by its GameConfig, the engine seed and the actions
+applied between fixed simulation ticks, so that is all a replay stores.
+The binary format is a run of unsigned LEB128 varints:
+
+    b"TRPL", version
+    seed, number of config fields, config values (GameConfig field order)
+    number of events, then per event: (ticks since last event << 4) | action
+    trailing ticks, final score, board hash
+
+An event's action is applied with ``Engine.step(action)`` once that many
+ticks of ``Engine.step(Action.NONE, 1000 / tick_rate)`` have run, which is
+how Game drives the engine. The final score and board hash let a player
+check that the re-simulated game ended where the recorded one did.
+
+    python teratis_replay.py game.trpl            # verify headlessly
+    python teratis_replay.py game.trpl --render   # watch it in real time
+"""
+
+import argparse
+import dataclasses
+import hashlib
+import sys
+import time
+from typing import Iterator, List, NamedTuple, Tuple
+
+from teratis_engine import Action, Engine, GameConfig
+
+MAGIC = b"TRPL"
+VERSION = 1
+ACTION_BITS = 4
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varints(data: bytes) -> Iterator[int]:
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+    if shift:
+        raise ValueError("replay ends in the middle of a varint")
+
+
+def board_hash(engine: Engine) -> int:
+    """64-bit hash of the board's cell colors."""
+    digest = hashlib.blake2b(engine.cells, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class Replay(NamedTuple):
+    config: GameConfig
+    seed: int
+    events: List[Tuple[int, Action]]  # (absolute tick, action)
+    ticks: int
+    score: int
+    board_hash: int
+
+    def encode(self) -> bytes:
+        out = bytearray(MAGIC)
+        write_varint(out, VERSION)
+        write_varint(out, self.seed)
+        values = dataclasses.astuple(self.config)
+        write_varint(out, len(values))
+        for value in values:
+            write_varint(out, value)
+        write_varint(out, len(self.events))
+        last = 0
+        for tick, action in self.events:
+            write_varint(out, (tick - last) << ACTION_BITS | action.value)
+            last = tick
+        write_varint(out, self.ticks - last)
+        write_varint(out, self.score)
+        write_varint(out, self.board_hash)
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Replay":
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError("not a Teratis replay")
+        values = read_varints(data[len(MAGIC) :])
+        version = next(values)
+        if version != VERSION:
+            raise ValueError(f"unsupported replay version {version}")
+        seed = next(values)
+        config = GameConfig(*[next(values) for _ in range(next(values))])
+        events = []
+        tick = 0
+        for _ in range(next(values)):
+            packed = next(values)
+            tick += packed >> ACTION_BITS
+            events.append((tick, Action(packed & ((1 << ACTION_BITS) - 1))))
+        ticks = tick + next(values)
+        return cls(config, seed, events, ticks, next(values), next(values))
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.encode())
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        with open(path, "rb") as f:
+            return cls.decode(f.read())
+
+
+class Recorder:
+    """Collects the actions applied to an engine, stamped with the number
+    of simulation ticks run before them."""
+
+    def __init__(self, engine: Engine):
+        self.config = engine.config
+        self.seed = engine.seed
+        self.events: List[Tuple[int, Action]] = []
+
+    def record(self, tick: int, action: Action) -> None:
+        if action != Action.NONE:
+            self.events.append((tick, action))
+
+    def finish(self, engine: Engine, ticks: int) -> Replay:
+        return Replay(
+            self.config,
+            self.seed,
+            list(self.events),
+            ticks,
+            engine.score,
+            board_hash(engine),
+        )
+
+
+class ReplayPlayer:
+    """Feeds a replay's actions back tick by tick."""
+
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        self.index = 0
+
+    def engine(self) -> Engine:
+        return Engine(self.replay.config, seed=self.replay.seed)
+
+    def actions(self, tick: int) -> Iterator[Action]:
+        """Actions to apply once `tick` ticks have run."""
+        events = self.replay.events
+        while self.index < len(events) and events[self.index][0] <= tick:
+            yield events[self.index][1]
+            self.index += 1
+
+    def finished(self, tick: int) -> bool:
+        return tick >= self.replay.ticks
+
+    def verify(self, engine: Engine) -> bool:
+        return (
+            engine.score == self.replay.score
+            and board_hash(engine) == self.replay.board_hash
+        )
+
+
+def simulate(replay: Replay) -> Tuple[Engine, bool]:
+    """Re-simulate a replay headlessly; returns the engine and whether it
+    ended with the recorded score and board."""
+    player = ReplayPlayer(replay)
+    engine = player.engine()
+    tick_ms = 1000 / replay.config.tick_rate
+    for tick in range(replay.ticks):
+        for action in player.actions(tick):
+            engine.step(action)
+        engine.step(Action.NONE, tick_ms)
+    for action in player.actions(replay.ticks):
+        engine.step(action)
+    return engine, player.verify(engine)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify or watch a Teratis replay.")
+    parser.add_argument("path")
+    parser.add_argument(
+        "--render", action="store_true", help="play it back in a window in real time"
+    )
+    args = parser.parse_args(argv)
+    replay = Replay.load(args.path)
+
+    if args.render:
+        from Teratis import Game
+
+        Game(replay=replay).run()
+        return
+
+    start = time.perf_counter()
+    engine, ok = simulate(replay)
+    seconds = time.perf_counter() - start
+    game_seconds = replay.ticks / replay.config.tick_rate
+    print(
+        f"{len(replay.events)} actions, {game_seconds:.1f}s of play simulated in "
+        f"{seconds * 1000:.1f}ms ({game_seconds / max(seconds, 1e-9):.0f}x)"
+    )
+    print(f"score {engine.score} (recorded {replay.score})")
+    if not ok:
+        print("replay diverged from the recording", file=sys.stderr)
+        sys.exit(1)
+    print("final score and board match")
+
+
+if __name__ == "__main__":
+    main()
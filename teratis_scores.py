@@ -0,0 +1,599 @@
+"""Crash-safe high-score storage.
+
+Every score ever recorded is kept in two files next to `path`:
+
+``<path>.log.jsonl``
+    New entries, appended and fsynced one line at a time by a background
+    writer thread, so the game never waits on the disk.
+``<path>.snapshot.jsonl``
+    All compacted entries sorted best first, one ``score<TAB>seq<TAB>json``
+    line each (the merge only parses the prefix), after a JSON header line
+    holding the entry count, the highest sequence number included and the
+    top entries.
+
+Once the log holds `compact_every` entries the writer merges it into a new
+snapshot written beside the old one and swapped in with os.replace, so a
+crash leaves either the old or the new snapshot. Windows can't replace a
+file that is open, so compaction waits while history() is reading the
+snapshot and is tried again with the next entry. Entries carry increasing
+sequence numbers and the header records the last one compacted; log lines
+at or below it are skipped on load, so a crash between the swap and the
+log reset loses nothing and counts nothing twice.
+
+Startup reads only the snapshot header and the short log, however many
+entries the snapshot holds. Problems found while loading are collected in
+`errors` instead of being swallowed.
+
+`HistoryReader` reads the history a few entries at a time without
+blocking compaction in between. `Leaderboard` uses it to index the full
+history for ranks, percentiles, personal bests and date ranges, a slice
+at a time.
+"""
+
+import bisect
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SNAPSHOT_VERSION = 1
+FIELDS = frozenset(("seq", "score"))
+BUILD_CHUNK = 128  # leaderboard entries indexed between budget checks
+
+
+def entry_key(entry: Dict) -> Tuple[int, int]:
+    """Best first; among equal scores, the earliest first."""
+    return -entry["score"], entry["seq"]
+
+
+def snapshot_line(entry: Dict) -> str:
+    return f"{entry['score']}\t{entry['seq']}\t{json.dumps(entry, sort_keys=True)}\n"
+
+
+def fsync_dir(path: str) -> None:
+    """Make a rename in `path`'s directory durable, where the OS allows it."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ScoreStore:
+    def __init__(
+        self,
+        path: str = "high_scores",
+        top_size: int = 10,
+        compact_every: int = 256,
+        legacy_path: Optional[str] = "high_scores.json",
+    ):
+        self.snapshot_path = path + ".snapshot.jsonl"
+        self.log_path = path + ".log.jsonl"
+        self.top_size = top_size
+        self.compact_every = compact_every
+        self.errors: List[str] = []
+        # Held while compaction swaps files, so a reader of the whole
+        # history sees a snapshot and the log that goes with it.
+        self.files_lock = threading.Lock()
+        self.readers = 0  # history() calls reading the snapshot
+
+        self.top: List[Dict] = []
+        self.count = 0
+        self.seq = 0
+        self.log_entries = 0
+        self.load()
+
+        self.queue: queue.Queue = queue.Queue()
+        self.writer = threading.Thread(
+            target=self.run_writer, name="score-writer", daemon=True
+        )
+        self.writer.start()
+
+        if (
+            legacy_path
+            and not self.count
+            and not os.path.exists(self.snapshot_path)
+            and os.path.exists(legacy_path)
+        ):
+            self.import_legacy(legacy_path)
+
+    def load(self) -> None:
+        header = self.read_header()
+        last_seq = header.get("last_seq", 0)
+        self.count = header.get("count", 0)
+        self.seq = last_seq
+        top = list(header.get("top", []))
+
+        for entry in self.read_log():
+            self.log_entries += 1
+            self.seq = max(self.seq, entry["seq"])
+            if entry["seq"] > last_seq:
+                self.count += 1
+                top.append(entry)
+        top.sort(key=entry_key)
+        self.top = top[: self.top_size]
+
+    def read_header(self) -> Dict:
+        try:
+            with open(self.snapshot_path) as f:
+                header = json.loads(f.readline())
+            if header.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(f"unknown snapshot version {header.get('version')}")
+            return header
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            # Keep the damaged file for inspection and start a new history.
+            self.errors.append(f"{self.snapshot_path}: {exc}; moved aside")
+            try:
+                os.replace(self.snapshot_path, self.snapshot_path + ".corrupt")
+            except OSError as move_exc:
+                self.errors.append(f"{self.snapshot_path}: {move_exc}")
+            return {}
+
+    def read_log(self) -> Iterator[Dict]:
+        try:
+            with open(self.log_path) as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        if not isinstance(entry, dict) or not FIELDS <= entry.keys():
+                            raise ValueError("entry without seq and score")
+                    except ValueError as exc:
+                        # Usually a line torn by a crash mid-append
+                        self.errors.append(f"{self.log_path}:{number}: {exc}")
+                        continue
+                    yield entry
+        except FileNotFoundError:
+            return
+        except OSError as exc:
+            self.errors.append(f"{self.log_path}: {exc}")
+
+    def import_legacy(self, path: str) -> None:
+        """Bring scores from the old single-file format into the store."""
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+            for entry in entries:
+                self.add(entry["score"], entry.get("name", "Player"), entry.get("date"))
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            self.errors.append(f"{path}: {exc}")
+
+    def add(self, score: int, name: str = "Player", date: Optional[str] = None) -> Dict:
+        """Record a score. The in-memory top list updates at once; the disk
+        write happens on the writer thread."""
+        self.seq += 1
+        entry = {
+            "seq": self.seq,
+            "score": score,
+            "name": name,
+            "date": date or time.strftime("%Y-%m-%d"),
+        }
+        self.count += 1
+        self.top.append(entry)
+        self.top.sort(key=entry_key)
+        del self.top[self.top_size :]
+        self.queue.put(entry)
+        return entry
+
+    def run_writer(self) -> None:
+        log = None
+        try:
+            log = open(self.log_path, "a")
+            self.end_torn_line(log)
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                log.write(json.dumps(entry, sort_keys=True) + "\n")
+                log.flush()
+                os.fsync(log.fileno())
+                self.log_entries += 1
+                if self.log_entries >= self.compact_every:
+                    with self.files_lock:
+                        if not self.readers:
+                            log.close()
+                            self.try_compact()
+                            log = open(self.log_path, "a")
+        except OSError as exc:
+            # Scores keep working in memory; the failure is reported.
+            self.errors.append(f"score writer stopped: {exc}")
+        finally:
+            if log:
+                log.close()
+
+    def end_torn_line(self, log) -> None:
+        """Start appending on a fresh line if a crash cut the last one short."""
+        if log.tell() == 0:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                log.write("\n")
+
+    def snapshot_entries(self) -> Iterator[Tuple[int, int, str]]:
+        """(score, seq, line) for every snapshot entry, best first."""
+        try:
+            f = open(self.snapshot_path)
+        except FileNotFoundError:
+            return
+        with f:
+            f.readline()
+            for line in f:
+                try:
+                    score, seq, _ = line.split("\t", 2)
+                    yield int(score), int(seq), line
+                except ValueError as exc:
+                    self.errors.append(f"{self.snapshot_path}: skipped entry: {exc}")
+
+    def try_compact(self) -> None:
+        """Compact, or report why not and try again `compact_every`
+        entries later; the log keeps every entry meanwhile."""
+        try:
+            self.compact()
+        except OSError as exc:
+            self.errors.append(f"compaction failed, will retry: {exc}")
+            self.log_entries = 0
+
+    def compact(self) -> None:
+        """Merge the log into a new snapshot and reset the log."""
+        header = self.read_header()
+        last_seq = header.get("last_seq", 0)
+        logged = sorted(
+            (entry for entry in self.read_log() if entry["seq"] > last_seq),
+            key=entry_key,
+        )
+        top = sorted(list(header.get("top", [])) + logged, key=entry_key)
+        new_header = {
+            "version": SNAPSHOT_VERSION,
+            "count": header.get("count", 0) + len(logged),
+            "last_seq": max([last_seq] + [entry["seq"] for entry in logged]),
+            "top": top[: self.top_size],
+        }
+
+        # The snapshot and the sorted log are merged as they stream, so
+        # compaction needs memory for the log only.
+        merged = heapq.merge(
+            ((-score, seq, line) for score, seq, line in self.snapshot_entries()),
+            ((-entry["score"], entry["seq"], snapshot_line(entry)) for entry in logged),
+        )
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(json.dumps(new_header, sort_keys=True) + "\n")
+            for _, _, line in merged:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        fsync_dir(self.snapshot_path)
+
+        with open(self.log_path, "w") as f:
+            os.fsync(f.fileno())
+        self.log_entries = 0
+
+    def history(self) -> Iterator[Dict]:
+        """Every stored entry: the snapshot best first, then the log. Entries
+        still queued for the writer are not included."""
+        with self.files_lock:
+            header = self.read_header()
+            logged = list(self.read_log())
+            try:
+                snapshot = open(self.snapshot_path)
+            except FileNotFoundError:
+                snapshot = None
+            else:
+                self.readers += 1
+        if snapshot:
+            try:
+                with snapshot:
+                    snapshot.readline()
+                    for line in snapshot:
+                        try:
+                            yield json.loads(line.split("\t", 2)[2])
+                        except (IndexError, ValueError) as exc:
+                            self.errors.append(
+                                f"{self.snapshot_path}: skipped entry: {exc}"
+                            )
+            finally:
+                with self.files_lock:
+                    self.readers -= 1
+        last_seq = header.get("last_seq", 0)
+        for entry in logged:
+            if entry["seq"] > last_seq:
+                yield entry
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Finish pending writes and stop the writer thread."""
+        self.queue.put(None)
+        self.writer.join(timeout)
+
+
+class HistoryReader:
+    """A store's history, as history() yields it, read a few entries at a
+    time. Nothing stays open between reads, so compaction is never held
+    up, however long the reader takes or if it is abandoned.
+
+    The log is read up front. If compaction swaps the snapshot between
+    reads, reading resumes in the new one after the last entry read, and
+    skips the entries compaction merged in: those come from the log
+    already read, or were added since. `last_seq` is the highest sequence
+    number included, so newer entries can be applied separately.
+    """
+
+    def __init__(self, store: ScoreStore, parse: bool = True):
+        self.store = store
+        self.parse = parse
+        self.started = False
+        self.snapshot_seq = 0  # header's last_seq when reading started
+        self.logged: List[Dict] = []
+        self.last_seq = 0
+        self.in_snapshot = False
+        self.offset: Optional[int] = None  # of the next snapshot line
+        self.compacted_seq = 0  # header's last_seq of the snapshot being read
+        self.resume_after: Optional[Tuple[int, int]] = None
+        self.last_key: Optional[Tuple[int, int]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.started and not self.in_snapshot and not self.logged
+
+    def read(self, size: int) -> list:
+        """Up to `size` more entries, or (score, seq) pairs if not
+        parsing; fewer, possibly none, while compaction is running."""
+        if not self.started:
+            self.start()
+            return []
+        if self.in_snapshot:
+            return self.read_snapshot(size)
+        entries = self.logged[:size]
+        del self.logged[:size]
+        if self.parse:
+            return entries
+        return [(entry["score"], entry["seq"]) for entry in entries]
+
+    def start(self) -> None:
+        store = self.store
+        # Compaction holds the lock while it runs; rather than wait for
+        # it, try again on the next read.
+        if not store.files_lock.acquire(blocking=False):
+            return
+        try:
+            header = store.read_header()
+            logged = list(store.read_log())
+        finally:
+            store.files_lock.release()
+        self.snapshot_seq = self.compacted_seq = header.get("last_seq", 0)
+        self.logged = [entry for entry in logged if entry["seq"] > self.snapshot_seq]
+        self.last_seq = max([self.snapshot_seq] + [e["seq"] for e in self.logged])
+        self.in_snapshot = bool(header)
+        self.started = True
+
+    def read_snapshot(self, size: int) -> list:
+        store = self.store
+        entries: list = []
+        if not store.files_lock.acquire(blocking=False):
+            return entries
+        try:
+            with open(store.snapshot_path, "rb") as f:
+                compacted_seq = json.loads(f.readline()).get("last_seq", 0)
+                if compacted_seq != self.compacted_seq:
+                    self.compacted_seq = compacted_seq
+                    self.resume_after = self.last_key
+                elif self.offset is not None:
+                    f.seek(self.offset)
+                # Lines skipped count towards `size`, keeping reads short.
+                for _ in range(size):
+                    line = f.readline()
+                    if not line:
+                        self.in_snapshot = False
+                        break
+                    entry = self.read_line(line)
+                    if entry is not None:
+                        entries.append(entry)
+                self.offset = f.tell()
+        except (OSError, ValueError) as exc:
+            store.errors.append(f"{store.snapshot_path}: history cut short: {exc}")
+            self.in_snapshot = False
+        finally:
+            store.files_lock.release()
+        return entries
+
+    def read_line(self, line: bytes):
+        try:
+            score, seq, rest = line.split(b"\t", 2)
+            key = -int(score), int(seq)
+            if key[1] > self.snapshot_seq:
+                return None  # merged in since reading started
+            if self.resume_after is not None and key <= self.resume_after:
+                return None  # read before the snapshot was swapped
+            self.last_key = key
+            return json.loads(rest) if self.parse else (-key[0], key[1])
+        except ValueError as exc:
+            self.store.errors.append(
+                f"{self.store.snapshot_path}: skipped entry: {exc}"
+            )
+            return None
+
+
+class Leaderboard:
+    """Sorted indexes over every stored score: by score for ranks and
+    percentiles, by player for personal bests and by date for date-range
+    leaderboards. Queries bisect; adding a score inserts into each index.
+
+    The indexes are built by calling build() with a time budget until it
+    returns True, so a game can spread the work over its frames; a build
+    thread would hold the GIL through whole sorts and stall the frames
+    anyway. The score index comes first and straight from the snapshot's
+    score prefixes, which are already sorted, so ranks are `ready` after
+    one quick pass; player and date queries return nothing until the
+    slower JSON pass is `complete`. Both passes read through
+    HistoryReader, so a slow or abandoned build never holds up
+    compaction. Scores recorded meanwhile must also be passed to add();
+    they are applied when each pass ends. Use a leaderboard from one
+    thread only.
+    """
+
+    def __init__(self, store: ScoreStore):
+        self.store = store
+        self.ready = False
+        self.complete = False
+        self.pending: List[Dict] = []
+        self.steps = self.build_steps()
+
+        self.scores = array("q")  # every score, ascending
+        self.players: Dict[str, array] = {}  # name -> their scores, ascending
+        # Date index as parallel columns, ordered by date
+        self.dates: List[str] = []
+        self.date_scores = array("q")
+        self.date_names: List[str] = []
+
+    def build(self, budget_ms: Optional[float] = None) -> bool:
+        """Work on the indexes for about `budget_ms`, or until they are
+        done if None. Returns whether they are complete."""
+        if budget_ms is not None:
+            deadline = time.perf_counter() + budget_ms / 1000
+        for _ in self.steps:
+            if budget_ms is not None and time.perf_counter() >= deadline:
+                return False
+        return True
+
+    def build_steps(self) -> Iterator[None]:
+        """The build, pausing every BUILD_CHUNK entries or so. Nothing here
+        sorts a whole index."""
+        # Scores: the snapshot is best first, so appending its scores and
+        # reversing sorts them. The log's entries come last in any order;
+        # those out of order are inserted afterwards.
+        scores = array("q")
+        unsorted = []
+        reader = HistoryReader(self.store, parse=False)
+        while not reader.finished:
+            for score, _ in reader.read(BUILD_CHUNK):
+                if not scores or score <= scores[-1]:
+                    scores.append(score)
+                else:
+                    unsorted.append(score)
+            yield
+        scores.reverse()
+        for score in unsorted:
+            bisect.insort(scores, score)
+            yield
+        for entry in self.pending:
+            if entry["seq"] > reader.last_seq:
+                bisect.insort(scores, entry["score"])
+        self.scores = scores
+        self.ready = True
+        yield
+
+        # Players and dates, the same way: best-first runs reversed, the
+        # rest inserted. Dates are bucketed, as there are few distinct ones.
+        players: Dict[str, array] = {}
+        unsorted_players = []
+        by_date: Dict[str, Tuple[array, List[str]]] = {}
+        interned: Dict[str, str] = {}
+        reader = HistoryReader(self.store)
+        while not reader.finished:
+            for entry in reader.read(BUILD_CHUNK):
+                score = entry["score"]
+                name = interned.setdefault(entry["name"], entry["name"])
+                values = players.setdefault(name, array("q"))
+                if not values or score <= values[-1]:
+                    values.append(score)
+                else:
+                    unsorted_players.append((name, score))
+                date_scores, date_names = by_date.setdefault(
+                    entry["date"], (array("q"), [])
+                )
+                date_scores.append(score)
+                date_names.append(name)
+            yield
+        for values in players.values():
+            values.reverse()
+        for name, score in unsorted_players:
+            bisect.insort(players[name], score)
+            yield
+
+        dates: List[str] = []
+        date_scores = array("q")
+        date_names: List[str] = []
+        for date in sorted(by_date):
+            bucket_scores, bucket_names = by_date.pop(date)
+            dates.extend([date] * len(bucket_scores))
+            date_scores.extend(bucket_scores)
+            date_names.extend(bucket_names)
+            yield
+
+        self.players = players
+        self.dates = dates
+        self.date_scores = date_scores
+        self.date_names = date_names
+        for entry in self.pending:
+            if entry["seq"] > reader.last_seq:
+                self.insert_details(entry)
+        self.pending.clear()
+        self.complete = True
+
+    def add(self, entry: Dict) -> None:
+        if self.ready:
+            bisect.insort(self.scores, entry["score"])
+        if self.complete:
+            self.insert_details(entry)
+        else:
+            self.pending.append(entry)
+
+    def insert_details(self, entry: Dict) -> None:
+        """Add `entry` to the player and date indexes."""
+        score, name, date = entry["score"], entry["name"], entry["date"]
+        bisect.insort(self.players.setdefault(name, array("q")), score)
+        i = bisect.bisect_right(self.dates, date)
+        self.dates.insert(i, date)
+        self.date_scores.insert(i, score)
+        self.date_names.insert(i, name)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def rank(self, score: int) -> Optional[int]:
+        """Place `score` would take if recorded now; ties go to the earlier."""
+        if not self.ready:
+            return None
+        return len(self.scores) - bisect.bisect_left(self.scores, score) + 1
+
+    def percentile_of(self, score: int) -> Optional[float]:
+        """Percentage of recorded scores strictly below `score`."""
+        if not self.ready or not self.scores:
+            return None
+        return 100 * bisect.bisect_left(self.scores, score) / len(self.scores)
+
+    def percentile(self, percent: float) -> Optional[int]:
+        """The score at `percent` (0-100) of the distribution."""
+        if not self.ready or not self.scores:
+            return None
+        index = round(percent / 100 * (len(self.scores) - 1))
+        return self.scores[min(max(index, 0), len(self.scores) - 1)]
+
+    def player_best(self, name: str) -> Optional[int]:
+        scores = self.players.get(name)
+        return scores[-1] if scores else None
+
+    def player_games(self, name: str) -> int:
+        return len(self.players.get(name, ()))
+
+    def between(
+        self, start: str, end: str, limit: int = 10
+    ) -> List[Tuple[int, str, str]]:
+        """Best (score, name, date) entries dated from `start` to `end`
+        inclusive, as "YYYY-MM-DD" strings."""
+        lo = bisect.bisect_left(self.dates, start)
+        hi = bisect.bisect_right(self.dates, end)
+        best = heapq.nlargest(
+            limit, range(lo, hi), key=lambda i: (self.date_scores[i], -i)
+        )
+        return [(self.date_scores[i], self.date_names[i], self.dates[i]) for i in best]
@@ -0,0 +1,411 @@
+"""Many headless Teratis sessions in one process, served over asyncio.
+
+Every connection gets its own Engine. One scheduler steps all sessions
+through the same fixed ticks, the way Game drives its engine. Clients
+connect over TCP or a Unix socket.
+
+A client sends one byte per Action value: the actions Game's gameplay
+input produces, such as LEFT, ROTATE, DOWN or HARD_DROP. Key repeat
+stays on the client. Queued actions are applied before the next tick's
+gravity, at most MAX_INPUTS_PER_TICK a tick, so a burst can't stall the
+tick every session shares. A client with more than MAX_QUEUED_INPUTS
+waiting is sending faster than anyone plays and is disconnected.
+
+The server sends frames of a 4-byte big-endian length and a body of
+unsigned LEB128 varints, as in teratis_replay. The first frame is a
+hello:
+
+    b"TRSV", version, seed, number of config fields, config values
+
+Every later frame is an update, sent only if something changed since
+the last one:
+
+    tick, field mask
+    the masked HUD fields, in HUD_FIELDS order
+    if the rows bit is set: number of rows, then per row y and its cells
+
+Cells are COLOR_INDEX values, which all fit in one varint byte. A piece
+is 0 when there is none; otherwise it is shape index + 1, rotation, x,
+y and COLOR_INDEX. "inputs" counts the actions applied so far, so a
+client can tell when its input has taken effect. Updates are diffed
+against what was last sent, so a client too slow to drain its socket
+skips updates and then catches up in one.
+
+    python teratis_server.py --port 7777
+    python teratis_client.py --port 7777 --clients 500 --seconds 30
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import statistics
+import struct
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from teratis_engine import (
+    COLOR_INDEX,
+    COLORS,
+    SHAPE_TYPES,
+    Action,
+    Engine,
+    GameConfig,
+    PiecePose,
+    piece_pose,
+)
+from teratis_replay import read_varints, write_varint
+
+MAGIC = b"TRSV"
+VERSION = 1
+HUD_FIELDS = (
+    "score",
+    "time_left",
+    "combo",
+    "lines",
+    "state",
+    "placements",
+    "inputs",
+    "piece",
+    "next",
+)
+PIECE_FIELDS = {"piece", "next"}
+ROWS_BIT = 1 << len(HUD_FIELDS)
+FRAME_HEADER = struct.Struct("!I")
+MAX_WRITE_BUFFER = 64 * 1024  # bytes queued for a client before it skips updates
+LISTEN_BACKLOG = 1024  # a load test connects its clients all at once
+MAX_INPUTS_PER_TICK = 4  # 480 actions a second at the default tick rate
+MAX_QUEUED_INPUTS = 64  # actions waiting before a client is disconnected
+
+
+def frame(body: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    return await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+
+
+def encode_hello(engine: Engine) -> bytes:
+    out = bytearray(MAGIC)
+    write_varint(out, VERSION)
+    write_varint(out, engine.seed)
+    values = dataclasses.astuple(engine.config)
+    write_varint(out, len(values))
+    for value in values:
+        write_varint(out, value)
+    return bytes(out)
+
+
+def decode_hello(data: bytes) -> Tuple[GameConfig, int]:
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("not a Teratis server")
+    values = read_varints(data[len(MAGIC) :])
+    version = next(values)
+    if version != VERSION:
+        raise ValueError(f"unsupported server version {version}")
+    seed = next(values)
+    config = GameConfig(*[next(values) for _ in range(next(values))])
+    return config, seed
+
+
+def write_piece(out: bytearray, pose: Optional[PiecePose]) -> None:
+    if pose is None:
+        write_varint(out, 0)
+        return
+    x, y, color, shape_type, rotation = pose
+    for value in (SHAPE_TYPES.index(shape_type) + 1, rotation, x, y):
+        write_varint(out, value)
+    write_varint(out, COLOR_INDEX[color])
+
+
+def read_piece(values: Iterator[int]) -> Optional[PiecePose]:
+    shape = next(values)
+    if not shape:
+        return None
+    rotation, x, y, color = next(values), next(values), next(values), next(values)
+    return x, y, COLORS[color - 1], SHAPE_TYPES[shape - 1], rotation
+
+
+def hud(engine: Engine, inputs: int) -> tuple:
+    """The HUD_FIELDS values of a session."""
+    return (
+        engine.score,
+        engine.time_remaining,
+        engine.combo_count,
+        engine.lines_cleared,
+        engine.state.value,
+        engine.placements,
+        inputs,
+        piece_pose(engine.current_block),
+        piece_pose(engine.next_block),
+    )
+
+
+class Update(NamedTuple):
+    tick: int
+    fields: Dict[str, object]
+    rows: List[Tuple[int, bytes]]
+
+    @classmethod
+    def decode(cls, data: bytes, width: int) -> "Update":
+        values = read_varints(data)
+        tick = next(values)
+        mask = next(values)
+        fields = {}
+        for bit, name in enumerate(HUD_FIELDS):
+            if mask & 1 << bit:
+                if name in PIECE_FIELDS:
+                    fields[name] = read_piece(values)
+                else:
+                    fields[name] = next(values)
+        rows = []
+        if mask & ROWS_BIT:
+            for _ in range(next(values)):
+                y = next(values)
+                rows.append((y, bytes(next(values) for _ in range(width))))
+        return cls(tick, fields, rows)
+
+
+class Session:
+    """One headless game, the actions its client has queued and what the
+    client was last sent."""
+
+    def __init__(self, engine: Engine, writer: asyncio.StreamWriter):
+        self.engine = engine
+        self.writer = writer
+        self.inputs: Deque[Action] = deque()
+        self.applied = 0
+        # The client starts from an empty board and no HUD.
+        self.sent_cells = bytearray(len(engine.cells))
+        self.sent_hud: tuple = (None,) * len(HUD_FIELDS)
+        self.bytes_sent = 0
+
+    def step(self, tick_ms: float) -> None:
+        for _ in range(min(len(self.inputs), MAX_INPUTS_PER_TICK)):
+            self.engine.step(self.inputs.popleft())
+            self.applied += 1
+        # step(Action.NONE, tick_ms) without walking apply_action's chain
+        self.engine.update(tick_ms)
+
+    def update(self, tick: int) -> Optional[bytes]:
+        """The update bringing the client up to date, or None if it is."""
+        current = hud(self.engine, self.applied)
+        cells = self.engine.cells
+        if current == self.sent_hud and cells == self.sent_cells:
+            return None
+        mask = 0
+        for bit, (new, old) in enumerate(zip(current, self.sent_hud)):
+            if new != old:
+                mask |= 1 << bit
+
+        rows = []
+        if cells != self.sent_cells:
+            width = self.engine.config.grid_width
+            for y in range(self.engine.config.grid_height):
+                row = slice(y * width, (y + 1) * width)
+                if cells[row] != self.sent_cells[row]:
+                    rows.append(row)
+            mask |= ROWS_BIT
+
+        out = bytearray()
+        write_varint(out, tick)
+        write_varint(out, mask)
+        for bit, (name, value) in enumerate(zip(HUD_FIELDS, current)):
+            if mask & 1 << bit:
+                if name in PIECE_FIELDS:
+                    write_piece(out, value)
+                else:
+                    write_varint(out, value)
+        if rows:
+            write_varint(out, len(rows))
+            for row in rows:
+                write_varint(out, row.start // self.engine.config.grid_width)
+                # Every COLOR_INDEX value is a one-byte varint.
+                out += cells[row]
+            self.sent_cells[:] = cells
+        self.sent_hud = current
+        return bytes(out)
+
+    def send(self, tick: int) -> None:
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            return
+        body = self.update(tick)
+        if body is not None:
+            data = frame(body)
+            self.writer.write(data)
+            self.bytes_sent += len(data)
+
+
+class TickStats:
+    """Rolling window of tick durations, and ticks the scheduler gave up
+    on after falling behind."""
+
+    def __init__(self, size: int = 1200):
+        self.durations: deque = deque(maxlen=size)
+        self.skipped = 0
+
+    def record(self, duration_ms: float) -> None:
+        self.durations.append(duration_ms)
+
+    def summary(self) -> str:
+        if not self.durations:
+            return "no ticks yet"
+        durations = sorted(self.durations)
+        p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+        return (
+            f"tick mean {statistics.fmean(durations):.2f} ms, "
+            f"p50 {durations[len(durations) // 2]:.2f} ms, p99 {p99:.2f} ms, "
+            f"max {durations[-1]:.2f} ms, {self.skipped} skipped"
+        )
+
+
+class Server:
+    """Accepts clients and steps every session on one shared schedule.
+
+    Ticks run at the config's tick_rate and updates go out every
+    `send_every` ticks. A tick that runs late is caught up, up to
+    `max_behind` ticks; any more are skipped, slowing every game alike.
+    """
+
+    def __init__(
+        self,
+        config: Optional[GameConfig] = None,
+        seed: Optional[int] = None,
+        send_rate: float = 60,
+        max_behind: int = 30,
+    ):
+        self.config = config or GameConfig()
+        self.seed = seed
+        self.send_every = max(1, round(self.config.tick_rate / send_rate))
+        self.max_behind = max_behind
+        self.sessions: Set[Session] = set()
+        self.ticks = 0
+        self.stats = TickStats()
+        self.connections = 0
+        self.flooded = 0  # clients disconnected for queueing too many actions
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        session = Session(Engine(self.config, seed=self.seed), writer)
+        session.engine.step()
+        writer.write(frame(encode_hello(session.engine)))
+        self.sessions.add(session)
+        self.connections += 1
+        try:
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    break
+                for value in data:
+                    session.inputs.append(Action(value))
+                if len(session.inputs) > MAX_QUEUED_INPUTS:
+                    self.flooded += 1
+                    break
+        except (ConnectionError, ValueError):
+            # A dropped connection, or a byte that is no Action.
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def tick(self) -> None:
+        tick_ms = 1000 / self.config.tick_rate
+        for session in self.sessions:
+            session.step(tick_ms)
+        self.ticks += 1
+        if self.ticks % self.send_every == 0:
+            for session in self.sessions:
+                session.send(self.ticks)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.config.tick_rate
+        deadline = loop.time()
+        while True:
+            started = time.perf_counter()
+            self.tick()
+            self.stats.record((time.perf_counter() - started) * 1000)
+            deadline += interval
+            behind = loop.time() - deadline
+            if behind > self.max_behind * interval:
+                skipped = int(behind / interval)
+                self.stats.skipped += skipped
+                deadline += skipped * interval
+            # Always yield, so clients are served even while catching up.
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def report(self, seconds: float) -> None:
+        sent = 0
+        while True:
+            await asyncio.sleep(seconds)
+            total = sum(session.bytes_sent for session in self.sessions)
+            print(
+                f"{len(self.sessions)} sessions ({self.connections} total, "
+                f"{self.flooded} flooding), "
+                f"{self.stats.summary()}, "
+                f"{max(0, total - sent) / seconds / 1024:.0f} KiB/s sent",
+                flush=True,
+            )
+            sent = total
+
+
+async def serve(server: Server, args) -> None:
+    if args.unix:
+        listener = await asyncio.start_unix_server(
+            server.handle, args.unix, backlog=LISTEN_BACKLOG
+        )
+        where = args.unix
+    else:
+        listener = await asyncio.start_server(
+            server.handle, args.host, args.port, backlog=LISTEN_BACKLOG
+        )
+        where = f"{args.host}:{args.port}"
+    print(f"serving Teratis sessions on {where}", flush=True)
+    async with listener:
+        tasks = [server.run()]
+        if args.report:
+            tasks.append(server.report(args.report))
+        await asyncio.gather(*tasks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve headless Teratis sessions over TCP or a Unix socket."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket")
+    parser.add_argument(
+        "--seed", type=int, help="seed every session alike, e.g. for versus play"
+    )
+    parser.add_argument(
+        "--send-rate",
+        type=float,
+        default=60,
+        help="updates per second to each client (default: 60)",
+    )
+    parser.add_argument(
+        "--report",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="print server load this often, 0 for never (default: 5)",
+    )
+    args = parser.parse_args(argv)
+
+    server = Server(seed=args.seed, send_rate=args.send_rate)
+    try:
+        asyncio.run(serve(server, args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""Compact binary game-state stream for spectators.
+
+A stream is a run of frames, each a fixed-layout little-endian record:
+
+    kind (b"K" keyframe or b"D" delta), tick
+    score, seconds left, combo, lines, state, placements
+    falling piece and next piece: shape index + 1 (0 for none), rotation,
+        x and y as int32, COLOR_INDEX
+    keyframe: width, height, target score, then the board's COLOR_INDEX
+        values packed two cells to a byte, low nibble first
+    delta: number of changed cells, their uint32 indices into the board,
+        then their uint8 values
+
+Keyframes go out every `keyframe_interval` frames, and whenever a delta
+would be bigger than one, so a spectator can join at any keyframe. Both
+paths avoid copies. StreamEncoder packs and diffs the board with NumPy
+straight into a buffer it reuses and hands back a memoryview of it.
+StreamState reads a frame through NumPy views of the frame itself.
+
+A stream file is b"TSTR", a version byte, then every frame behind a
+uint32 length.
+
+    python teratis_stream.py game.trpl --save game.tstr   # encode a replay
+    python teratis_stream.py game.tstr --watch            # spectate a stream
+    python teratis_stream.py game.trpl --watch            # both, live
+"""
+
+import argparse
+import struct
+import sys
+import time
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from teratis_engine import (
+    COLOR_INDEX,
+    COLORS,
+    SHAPE_TYPES,
+    Action,
+    Engine,
+    GameConfig,
+    GameState,
+    PiecePose,
+    piece_from_pose,
+)
+from teratis_replay import MAGIC as REPLAY_MAGIC
+from teratis_replay import Replay, ReplayPlayer
+
+MAGIC = b"TSTR"
+VERSION = 2  # 2: piece x and y widened from int16 to int32
+KEYFRAME = b"K"
+DELTA = b"D"
+
+HEADER = struct.Struct("<cI")  # kind, tick
+COUNTERS = struct.Struct("<IHHIBI")  # score, time left, combo, lines, state, placements
+PIECE = struct.Struct("<BBiiB")  # shape + 1, rotation, x, y, color index
+KEY = struct.Struct("<HHI")  # width, height, target score
+COUNT = struct.Struct("<I")
+LENGTH = struct.Struct("<I")
+INDEX = np.dtype("<u4")  # delta cell indices, little-endian on any host
+STATE_SIZE = HEADER.size + COUNTERS.size + 2 * PIECE.size
+
+
+def pack_piece(buffer, offset: int, block) -> None:
+    if block is None:
+        PIECE.pack_into(buffer, offset, 0, 0, 0, 0, 0)
+        return
+    shape = block.shape
+    PIECE.pack_into(
+        buffer,
+        offset,
+        SHAPE_TYPES.index(shape.shape_type) + 1,
+        shape.rotation,
+        block.x,
+        block.y,
+        COLOR_INDEX[block.color],
+    )
+
+
+def unpack_piece(frame, offset: int) -> Optional[PiecePose]:
+    shape, rotation, x, y, color = PIECE.unpack_from(frame, offset)
+    if not shape:
+        return None
+    return x, y, COLORS[color - 1], SHAPE_TYPES[shape - 1], rotation
+
+
+class StreamEncoder:
+    """Encodes an engine's state into keyframes and deltas.
+
+    `encode` returns a memoryview into a buffer the next call overwrites,
+    so send or write each frame before encoding the next.
+    """
+
+    def __init__(self, engine: Engine, keyframe_interval: int = 60):
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval
+        size = len(engine.cells)
+        self.packed_size = (size + 1) // 2
+        # A delta is only sent while smaller than a keyframe, so the
+        # largest frame is a keyframe.
+        self.buffer = bytearray(STATE_SIZE + KEY.size + self.packed_size)
+        self.view = memoryview(self.buffer)
+        self.sent_cells = bytearray(size)
+        self.sent = np.frombuffer(self.sent_cells, np.uint8)
+        self.frames = 0
+
+    def encode(self, tick: int) -> memoryview:
+        engine = self.engine
+        cells = np.frombuffer(engine.cells, np.uint8)
+        changed = None
+        if self.frames % self.keyframe_interval:
+            # Most frames leave the board alone; memcmp says so quickest.
+            if engine.cells == self.sent_cells:
+                changed = np.empty(0, np.intp)
+            else:
+                changed = np.flatnonzero(cells != self.sent)
+            if len(changed) * (INDEX.itemsize + 1) >= self.packed_size:
+                changed = None
+        self.frames += 1
+
+        kind = KEYFRAME if changed is None else DELTA
+        HEADER.pack_into(self.buffer, 0, kind, tick)
+        COUNTERS.pack_into(
+            self.buffer,
+            HEADER.size,
+            engine.score,
+            engine.time_remaining,
+            engine.combo_count,
+            engine.lines_cleared,
+            engine.state.value,
+            engine.placements,
+        )
+        offset = HEADER.size + COUNTERS.size
+        pack_piece(self.buffer, offset, engine.current_block)
+        pack_piece(self.buffer, offset + PIECE.size, engine.next_block)
+        offset = STATE_SIZE
+
+        if changed is None:
+            config = engine.config
+            KEY.pack_into(
+                self.buffer,
+                offset,
+                config.grid_width,
+                config.grid_height,
+                config.target_score,
+            )
+            offset += KEY.size
+            packed = np.frombuffer(self.buffer, np.uint8, self.packed_size, offset)
+            packed[:] = cells[0::2]
+            packed[: len(cells) // 2] |= cells[1::2] << 4
+            self.sent[:] = cells
+            return self.view[: offset + self.packed_size]
+
+        count = len(changed)
+        COUNT.pack_into(self.buffer, offset, count)
+        offset += COUNT.size
+        np.frombuffer(self.buffer, INDEX, count, offset)[:] = changed
+        offset += INDEX.itemsize * count
+        values = np.frombuffer(self.buffer, np.uint8, count, offset)
+        values[:] = cells[changed]
+        self.sent[changed] = values
+        return self.view[: offset + count]
+
+
+class StreamState:
+    """A spectator's copy of the game, rebuilt from a stream. Frames
+    before the first keyframe are skipped."""
+
+    def __init__(self):
+        self.config: Optional[GameConfig] = None
+        self.cells = bytearray()
+        self.board = np.frombuffer(self.cells, np.uint8)
+        self.tick = 0
+        self.score = 0
+        self.time_left = 0
+        self.combo = 0
+        self.lines = 0
+        self.state = GameState.PLAYING
+        self.placements = 0
+        self.piece: Optional[PiecePose] = None
+        self.next_piece: Optional[PiecePose] = None
+
+    def apply(self, frame) -> bool:
+        """Apply one frame; returns False if it was skipped."""
+        kind, tick = HEADER.unpack_from(frame)
+        if kind == DELTA and self.config is None:
+            return False
+        self.tick = tick
+        (
+            self.score,
+            self.time_left,
+            self.combo,
+            self.lines,
+            state,
+            self.placements,
+        ) = COUNTERS.unpack_from(frame, HEADER.size)
+        self.state = GameState(state)
+        offset = HEADER.size + COUNTERS.size
+        self.piece = unpack_piece(frame, offset)
+        self.next_piece = unpack_piece(frame, offset + PIECE.size)
+        offset = STATE_SIZE
+
+        if kind == KEYFRAME:
+            width, height, target_score = KEY.unpack_from(frame, offset)
+            offset += KEY.size
+            size = width * height
+            if self.config is None or len(self.cells) != size:
+                self.cells = bytearray(size)
+                self.board = np.frombuffer(self.cells, np.uint8)
+            self.config = GameConfig(
+                grid_width=width, grid_height=height, target_score=target_score
+            )
+            packed = np.frombuffer(frame, np.uint8, (size + 1) // 2, offset)
+            self.board[0::2] = packed & 0x0F
+            self.board[1::2] = packed[: size // 2] >> 4
+            return True
+
+        (count,) = COUNT.unpack_from(frame, offset)
+        offset += COUNT.size
+        indices = np.frombuffer(frame, INDEX, count, offset)
+        offset += INDEX.itemsize * count
+        self.board[indices] = np.frombuffer(frame, np.uint8, count, offset)
+        return True
+
+
+class Spectator:
+    """Draws a StreamState with the game's UIManager: the cells in view,
+    the falling piece and the sidebar. The window opens on the first
+    keyframe, sized like Game's."""
+
+    def __init__(self, state: StreamState, view: Optional[Tuple[int, int]] = None):
+        import pygame
+
+        import Teratis
+
+        self.pygame = pygame
+        self.teratis = Teratis
+        self.state = state
+        self.view = view or (Teratis.VIEW_COLUMNS, Teratis.VIEW_ROWS)
+        self.screen = None
+        pygame.display.init()
+        pygame.font.init()
+
+    def open(self, config: GameConfig) -> None:
+        Teratis = self.teratis
+        self.camera = Teratis.Camera(config.grid_width, config.grid_height, *self.view)
+        size = (
+            self.camera.columns * config.block_size + 200,
+            self.camera.rows * config.block_size,
+        )
+        self.screen = self.pygame.display.set_mode(size)
+        self.pygame.display.set_caption("Teratis spectator")
+        self.ui_manager = Teratis.UIManager(
+            size[0], size[1], config.block_size, config.max_particles
+        )
+
+    def draw(self) -> None:
+        state = self.state
+        config = state.config
+        if config is None:
+            return
+        if self.screen is None:
+            self.open(config)
+        camera, ui_manager, screen = self.camera, self.ui_manager, self.screen
+        block_size = config.block_size
+        block = piece_from_pose(state.piece)
+        camera.follow(block)
+
+        ui_manager.draw_grid_background(screen, config, True)
+        width = config.grid_width
+        for y in range(camera.rows):
+            start = (camera.y + y) * width + camera.x
+            for x, value in enumerate(state.cells[start : start + camera.columns]):
+                if value:
+                    ui_manager.draw_cell(screen, x, y, COLORS[value - 1], block_size)
+        if block:
+            for cell_x, cell_y in block.shape.layout.cells:
+                x, y = block.x + cell_x, block.y + cell_y
+                if camera.visible(x, y):
+                    ui_manager.draw_cell(
+                        screen, x - camera.x, y - camera.y, block.color, block_size
+                    )
+        ui_manager.draw_sidebar(
+            screen, state.score, state.time_left, state.combo, config.target_score
+        )
+
+        if state.state in (GameState.GAME_OVER, GameState.WON):
+            ui_manager.draw_game_over(screen, state.score, [], state.state)
+        elif state.state == GameState.PAUSED:
+            screen.blit(ui_manager.overlay(128), (0, 0))
+            text = ui_manager.labels["paused"]
+            screen.blit(
+                text,
+                text.get_rect(
+                    center=(screen.get_width() // 2, screen.get_height() // 2)
+                ),
+            )
+        self.pygame.display.flip()
+
+
+def replay_frames(
+    replay: Replay, rate: float = 60, keyframe_interval: int = 60
+) -> Iterator[Tuple[Engine, memoryview]]:
+    """Re-simulate a replay, encoding a frame `rate` times a second of
+    play. Each frame comes with the engine it was encoded from."""
+    player = ReplayPlayer(replay)
+    engine = player.engine()
+    encoder = StreamEncoder(engine, keyframe_interval)
+    tick_ms = 1000 / replay.config.tick_rate
+    every = max(1, round(replay.config.tick_rate / rate))
+    for tick in range(replay.ticks):
+        for action in player.actions(tick):
+            engine.step(action)
+        engine.step(Action.NONE, tick_ms)
+        if (tick + 1) % every == 0:
+            yield engine, encoder.encode(tick + 1)
+
+
+def read_stream(data: bytes) -> Iterator[memoryview]:
+    """The frames of a stream file, as views into `data`."""
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("not a Teratis stream")
+    if data[len(MAGIC)] != VERSION:
+        raise ValueError(f"unsupported stream version {data[len(MAGIC)]}")
+    view = memoryview(data)
+    offset = len(MAGIC) + 1
+    while offset < len(data):
+        (length,) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        yield view[offset : offset + length]
+        offset += length
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Encode a replay as a spectator stream, or watch one."
+    )
+    parser.add_argument("path", help="a replay (.trpl) or a stream file")
+    parser.add_argument("--save", metavar="PATH", help="write the stream to PATH")
+    parser.add_argument(
+        "--watch", action="store_true", help="draw the stream in real time"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=60, help="frames per second (default: 60)"
+    )
+    parser.add_argument(
+        "--keyframe-interval",
+        type=int,
+        default=60,
+        help="frames between keyframes (default: 60)",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+    if data.startswith(REPLAY_MAGIC):
+        source = replay_frames(Replay.decode(data), args.rate, args.keyframe_interval)
+    else:
+        source = ((None, frame) for frame in read_stream(data))
+
+    state = StreamState()
+    spectator = Spectator(state) if args.watch else None
+    out = open(args.save, "wb") if args.save else None
+    if out:
+        out.write(MAGIC + bytes([VERSION]))
+    frames = keyframes = total = 0
+    decode_time = 0.0
+    diverged = False
+    deadline = time.perf_counter()
+    try:
+        for engine, frame in source:
+            frames += 1
+            keyframes += frame[0] == KEYFRAME[0]
+            total += len(frame)
+            if out:
+                out.write(LENGTH.pack(len(frame)))
+                out.write(frame)
+            started = time.perf_counter()
+            state.apply(frame)
+            decode_time += time.perf_counter() - started
+            if engine is not None and state.cells != engine.cells:
+                diverged = True
+            if spectator:
+                for event in spectator.pygame.event.get():
+                    if event.type == spectator.pygame.QUIT:
+                        return
+                spectator.draw()
+                deadline += 1 / args.rate
+                time.sleep(max(0.0, deadline - time.perf_counter()))
+    finally:
+        if out:
+            out.close()
+
+    seconds = frames / args.rate
+    print(
+        f"{frames} frames ({keyframes} keyframes), {total} bytes: "
+        f"{total / max(1, frames):.1f} bytes/frame, "
+        f"{total / max(seconds, 1e-9) / 1024:.1f} KiB/s at {args.rate:g} Hz, "
+        f"decode {decode_time / max(1, frames) * 1e6:.1f} us/frame"
+    )
+    if diverged:
+        print("decoded board differs from the engine's", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Parameter sweeps over GameConfig, played headlessly across all cores.
+
+Every combination of the `--grid` values is played for `--seeds` seeds by
+a policy. Games run on a ProcessPoolExecutor and each result is written
+to the output CSV (one column per field) as soon as it arrives. Results
+are also appended to a cache keyed by (config, seed, policy, policy
+version), so rerunning a sweep only plays the games it hasn't seen.
+
+    python teratis_sweep.py --grid time_limit=60,120,180 \\
+        --grid initial_fall_speed=300,500 --seeds 50 --policy random
+"""
+
+import argparse
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from teratis_bot import AutoPlayer, steer
+from teratis_engine import Action, Engine, GameConfig, GameState
+
+RESULT_FIELDS = [
+    "score",
+    "won",
+    "lines",
+    "combo_peak",
+    "placements",
+    "seconds",
+    "end",
+]
+
+
+class Policy:
+    """Chooses one action at a time, acting at most every `delay` ms."""
+
+    name = "idle"
+    version = "1"
+    delay = 150
+
+    def __init__(self, seed: int, arg: str = ""):
+        self.rng = random.Random(seed)
+        self.arg = arg
+
+    def act(self, engine: Engine) -> Action:
+        return Action.NONE
+
+
+class TargetPolicy(Policy):
+    """Steers each new piece to a chosen rotation and column, then hard
+    drops it. Subclasses pick the target."""
+
+    def __init__(self, seed: int, arg: str = ""):
+        super().__init__(seed, arg)
+        self.block = None
+        self.target = None
+        self.last_pose = None
+
+    def choose(self, engine: Engine):
+        raise NotImplementedError
+
+    def act(self, engine: Engine) -> Action:
+        block = engine.current_block
+        if block is None:
+            return Action.NONE
+        if block.shape is not self.block:
+            self.block = block.shape
+            self.target = self.choose(engine)
+            self.last_pose = None
+
+        action = steer(block, self.target, self.last_pose)
+        self.last_pose = (block.shape.rotation, block.x, block.y)
+        return action
+
+
+class RandomPolicy(TargetPolicy):
+    name = "random"
+
+    def choose(self, engine: Engine):
+        return self.rng.randrange(4), self.rng.randrange(engine.config.grid_width)
+
+
+class BotPolicy(TargetPolicy):
+    """Targets the AutoPlayer's choice. The policy argument sets heuristic
+    weights and search options, e.g. ``holes=-0.5,beam=6``. The search is
+    unbudgeted unless ``budget=MS`` is given, so cached results stay
+    reproducible."""
+
+    name = "bot"
+
+    def __init__(self, seed: int, arg: str = ""):
+        super().__init__(seed, arg)
+        options = {}
+        for item in arg.split(","):
+            if item:
+                name, _, value = item.partition("=")
+                options[name] = float(value)
+        beam = int(options.pop("beam", 4))
+        budget = options.pop("budget", None)
+        self.player = AutoPlayer(options, beam_width=beam, budget_ms=budget)
+
+    def choose(self, engine: Engine):
+        return self.player.decide(engine)
+
+
+class ScriptPolicy(Policy):
+    """Repeats a script of actions: L, R, U (rotate), D (soft drop),
+    H (hard drop) and . (wait)."""
+
+    name = "script"
+    letters = {
+        "L": Action.LEFT,
+        "R": Action.RIGHT,
+        "U": Action.ROTATE,
+        "D": Action.SOFT_DROP,
+        "H": Action.HARD_DROP,
+        ".": Action.NONE,
+    }
+
+    def __init__(self, seed: int, arg: str = ""):
+        super().__init__(seed, arg or "H")
+        self.script = itertools.cycle([self.letters[c] for c in self.arg.upper()])
+
+    def act(self, engine: Engine) -> Action:
+        return next(self.script)
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, ScriptPolicy, BotPolicy)}
+
+
+def play_game(config: GameConfig, seed: int, policy_name: str, policy_arg: str):
+    engine = Engine(config, seed=seed)
+    policy = POLICIES[policy_name](seed, policy_arg)
+    tick = 1000 / config.tick_rate
+    next_action = 0.0
+    combo_peak = 0
+
+    engine.step()
+    while engine.state == GameState.PLAYING:
+        action = Action.NONE
+        if engine.elapsed >= next_action:
+            action = policy.act(engine)
+            if action != Action.NONE:
+                next_action = engine.elapsed + policy.delay
+        engine.step(action, tick)
+        combo_peak = max(combo_peak, engine.combo_count)
+
+    if engine.state == GameState.WON:
+        end = "won"
+    elif engine.time_remaining == 0:
+        end = "time"
+    else:
+        end = "top_out"
+    return {
+        "score": engine.score,
+        "won": engine.state == GameState.WON,
+        "lines": engine.lines_cleared,
+        "combo_peak": combo_peak,
+        "placements": engine.placements,
+        "seconds": round(engine.elapsed / 1000, 3),
+        "end": end,
+    }
+
+
+def parse_grid(specs: List[str]) -> Dict[str, list]:
+    fields = {field.name: field.type for field in dataclasses.fields(GameConfig)}
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in fields:
+            raise SystemExit(f"unknown GameConfig field: {name}")
+        grid[name] = [int(value) for value in values.split(",") if value]
+    return grid
+
+
+def configs(grid: Dict[str, list]) -> Iterator[GameConfig]:
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield GameConfig(**dict(zip(names, values)))
+
+
+def cache_key(config: GameConfig, seed: int, policy_name: str, policy_arg: str):
+    policy = POLICIES[policy_name]
+    return json.dumps(
+        [dataclasses.asdict(config), seed, policy_name, policy.version, policy_arg],
+        sort_keys=True,
+    )
+
+
+def load_cache(path: Optional[str]) -> Dict[str, dict]:
+    cache = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    cache[entry["key"]] = entry["result"]
+    return cache
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Sweep GameConfig values with headless games."
+    )
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="FIELD=V1,V2",
+        help="GameConfig field and the values to try; repeat for more fields",
+    )
+    parser.add_argument("--seeds", type=int, default=20, help="games per config")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument(
+        "--policy-arg", default="", help="policy option, e.g. the action script"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep_results.csv")
+    parser.add_argument(
+        "--cache",
+        default=".sweep_cache.jsonl",
+        help="result cache shared between runs ('' to disable)",
+    )
+    args = parser.parse_args(argv)
+
+    grid = parse_grid(args.grid)
+    cache = load_cache(args.cache)
+    config_fields = [field.name for field in dataclasses.fields(GameConfig)]
+    jobs = [
+        (config, seed)
+        for config in configs(grid)
+        for seed in range(args.first_seed, args.first_seed + args.seeds)
+    ]
+
+    with open(args.output, "w", newline="") as out:
+        writer = csv.DictWriter(
+            out, fieldnames=config_fields + ["seed", "policy"] + RESULT_FIELDS
+        )
+        writer.writeheader()
+
+        def write(config, seed, result):
+            row = dataclasses.asdict(config)
+            row.update(seed=seed, policy=args.policy, **result)
+            writer.writerow(row)
+            out.flush()
+
+        pending = []
+        for config, seed in jobs:
+            key = cache_key(config, seed, args.policy, args.policy_arg)
+            if key in cache:
+                write(config, seed, cache[key])
+            else:
+                pending.append((config, seed, key))
+
+        cache_file = open(args.cache, "a") if args.cache else None
+        try:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = {
+                    pool.submit(
+                        play_game, config, seed, args.policy, args.policy_arg
+                    ): (config, seed, key)
+                    for config, seed, key in pending
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    config, seed, key = futures[future]
+                    result = future.result()
+                    write(config, seed, result)
+                    if cache_file:
+                        cache_file.write(
+                            json.dumps({"key": key, "result": result}) + "\n"
+                        )
+                        cache_file.flush()
+                    print(f"\r{done}/{len(pending)} games", end="", file=sys.stderr)
+        finally:
+            if cache_file:
+                cache_file.close()
+
+    print(
+        f"\n{len(jobs)} games ({len(jobs) - len(pending)} cached) -> {args.output}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()